@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the per-call latency of the `CaughtDB` backends on the same synthetic
+database.  The results of every operation are also compared between the
+backends, and any mismatch is reported, as is any statement that had to be
+recompiled after the first call on a backend that tracks its statement cache.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.backends [--species N] [--games N] [--calls N]
+"""
+import argparse
+import os.path
+import shutil
+import tempfile
+import timeit
+from   caught.base   import BACKENDS, open_db
+from   caught.models import Status
+from   .synthetic    import build_db, write_pokedex
+
+def operations(species, calls):
+    """
+    Returns a list of ``(name, function)`` pairs of the operations to time,
+    where each function takes an open database and returns a comparable
+    result
+    """
+    step = max(species // calls, 1)
+    dexnos = list(range(1, species+1, step))[:calls]
+    return [
+        ('getStatus', lambda db: [db.getStatus(1, d) for d in dexnos]),
+        ('getPokemonByDexno',
+         lambda db: [db.getPokemonByDexno(d) for d in dexnos]),
+        ('getPokemon',
+         lambda db: [db.getPokemon('Species%d' % (d,)) for d in dexnos]),
+        ('getGame', lambda db: [db.getGame('g1') for _ in dexnos]),
+        ('setStatus', lambda db: [db.setStatus(2, d, Status.OWNED)
+                                  for d in dexnos]),
+        ('markCaughtMany', lambda db: db.markCaughtMany(3, dexnos)),
+        ('getStatuses', lambda db: db.getStatuses(1, dexnos)),
+        ('allPokemon', lambda db: db.allPokemon()),
+        ('getStatusRange', lambda db: db.getStatusRange(1)),
+        ('getByStatus', lambda db: db.getByStatus(1, Status.CAUGHT)),
+        ('getStatusMatrix', lambda db: list(db.getStatusMatrix(
+            db.allGames()[:10],
+        ))),
+        ('getGameCounts', lambda db: db.getGameCounts()),
+        ('allGames', lambda db: db.allGames()),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--species', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pokedex = os.path.join(tmpdir, 'pokedex.tsv')
+        dbpath = os.path.join(tmpdir, 'bench.caughtdb')
+        write_pokedex(pokedex, args.species)
+        build_db(dbpath, pokedex, args.species, args.games, seed=0)
+        backends = sorted(BACKENDS)
+        print('%-20s' % ('',) + ''.join('%15s' % (b,) for b in backends))
+        for name, op in operations(args.species, args.calls):
+            results = []
+            times = []
+            recompiles = 0
+            for backend in backends:
+                db = open_db(dbpath, backend)
+                results.append(rolled_back(db, op))
+                before = db.statementCacheInfo()
+                times.append(min(timeit.repeat(
+                    lambda: rolled_back(db, op),
+                    number=1,
+                    repeat=args.repeat,
+                )))
+                if before is not None:
+                    recompiles += db.statementCacheInfo().misses - before.misses
+                db.close()
+            print('%-20s' % (name,)
+                  + ''.join('%12.2f ms' % (t * 1000,) for t in times)
+                  + ('' if all(r == results[0] for r in results)
+                     else '   RESULTS DIFFER')
+                  + ('   %d RECOMPILED' % (recompiles,) if recompiles else ''))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def rolled_back(db, op):
+    """
+    Runs ``op`` on ``db`` inside a transaction that is then rolled back, so
+    that every backend and every repetition starts from the same data, and
+    returns its result
+    """
+    try:
+        with db:
+            result = op(db)
+            raise Rollback()
+    except Rollback:
+        return result
+
+
+class Rollback(Exception):
+    pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Measures throughput when several processes use the same database at once: N
+reader processes repeatedly fetch game progress and ranges of statuses in
+read-only transactions while one writer process repeatedly marks Pokémon as
+caught, each in a transaction of its own.  This is run for each backend with
+the database in both rollback-journal and WAL mode, and the number of
+transactions per second and of "database is locked" failures are reported.
+
+Run from the root of the repository with::
+
+    python -m benchmarks.contention [--readers N] [--duration SECS]
+        [--batch N] [--busy-timeout SECS]
+"""
+import argparse
+import json
+import multiprocessing
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import time
+from   caught.base   import BACKENDS, JOURNAL_MODES, is_busy_error, open_db
+from   caught.models import DatabaseLockedError
+from   .synthetic    import build_db, write_pokedex
+
+def reader(dbpath, options, species, start, duration, results):
+    db = open_db(dbpath, **options)
+    rng = random.Random()
+    ops = errors = 0
+    start.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            with db.reading():
+                games = db.allGames()
+                db.getGameCounts(games)
+                dexno = rng.randint(1, species)
+                list(db.iterStatusRange(rng.choice(games), dexno, dexno+100))
+        except Exception as e:
+            if not is_busy_error(e):
+                raise
+            errors += 1
+        else:
+            ops += 1
+    db.close()
+    results.put(('reader', ops, errors))
+
+def writer(dbpath, options, species, batch, start, duration, results):
+    db = open_db(dbpath, **options)
+    rng = random.Random()
+    ops = errors = 0
+    start.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            with db:
+                game = rng.choice(db.allGames())
+                db.markCaughtMany(game, rng.sample(range(1, game.dexsize+1),
+                                                   min(batch, game.dexsize)))
+        except DatabaseLockedError:
+            errors += 1
+        else:
+            ops += 1
+    db.close()
+    results.put(('writer', ops, errors))
+
+def run(dbpath, options, args):
+    """
+    Runs the readers & writer against the database and returns a `dict` of
+    results
+    """
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=reader, args=(
+            dbpath, options, args.species, start, args.duration, results,
+        ))
+        for _ in range(args.readers)
+    ]
+    procs.append(multiprocessing.Process(target=writer, args=(
+        dbpath, options, args.species, args.batch, start, args.duration,
+        results,
+    )))
+    for p in procs:
+        p.start()
+    # Give the workers time to open the database:
+    time.sleep(1)
+    start.set()
+    totals = {
+        "reader": {"ops": 0, "errors": 0},
+        "writer": {"ops": 0, "errors": 0},
+    }
+    for _ in procs:
+        role, ops, errors = results.get()
+        totals[role]["ops"] += ops
+        totals[role]["errors"] += errors
+    for p in procs:
+        p.join()
+    for t in totals.values():
+        t["tps"] = t["ops"] / args.duration
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--species', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--batch', type=int, default=100,
+                        help='Pokémon to mark per write transaction')
+    parser.add_argument('--busy-timeout', type=float, default=5.0)
+    parser.add_argument('--json', metavar='FILE')
+    args = parser.parse_args()
+    results = {}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pokedex = os.path.join(tmpdir, 'pokedex.tsv')
+        write_pokedex(pokedex, args.species)
+        for backend in sorted(BACKENDS):
+            for mode in JOURNAL_MODES:
+                dbpath = os.path.join(tmpdir, '%s-%s.caughtdb' % (backend, mode))
+                build_db(dbpath, pokedex, args.species, args.games, seed=0)
+                options = {
+                    "backend": backend,
+                    "journal_mode": mode,
+                    "busy_timeout": args.busy_timeout,
+                }
+                # Switch the journal mode before the workers start:
+                open_db(dbpath, **options).close()
+                r = run(dbpath, options, args)
+                results['%s/%s' % (backend, mode)] = r
+                print('%-10s %-6s  %d readers: %8.1f txn/s (%d locked)   '
+                      'writer: %7.1f txn/s (%d locked)' % (
+                          backend, mode, args.readers,
+                          r["reader"]["tps"], r["reader"]["errors"],
+                          r["writer"]["tps"], r["writer"]["errors"],
+                      ))
+    finally:
+        shutil.rmtree(tmpdir)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump({
+                "python": sys.version.split()[0],
+                "readers": args.readers,
+                "duration": args.duration,
+                "batch": args.batch,
+                "busy_timeout": args.busy_timeout,
+                "results": results,
+            }, fp, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
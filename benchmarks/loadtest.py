@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the throughput & latency of the ``caught serve`` HTTP API
+
+A server is started on a synthetic database for each backend (or the instance
+at ``--url`` is used instead), and a number of client threads, each with a
+keep-alive connection, send a random mix of read & write requests for a fixed
+duration.  The requests per second and median & 99th-percentile latencies are
+reported for reads and writes separately.  Run from the root of the
+repository with::
+
+    python -m benchmarks.loadtest [--clients N] [--duration SECS]
+        [--write-ratio R] [--readers N] [--url URL]
+"""
+import argparse
+import http.client
+import json
+import os.path
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from   urllib.parse import quote, urlsplit
+from   caught.base  import BACKENDS
+from   .synthetic   import build_db, write_pokedex
+
+def start_server(dbpath, backend, readers):
+    """
+    Starts ``caught serve`` on an ephemeral port and returns the process and
+    the server's base URL
+    """
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'caught', '--backend', backend, '-D', dbpath,
+         'serve', '--port', '0', '--readers', str(readers), '--quiet'],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    m = re.search(r'(http://\S+?)/?$', proc.stderr.readline().strip())
+    if not m:
+        proc.kill()
+        raise RuntimeError('Server did not start')
+    return proc, m.group(1)
+
+def requests(games, species, write_ratio, rng):
+    """
+    Returns a function that returns a random ``(is_write, method, path,
+    body)`` request
+    """
+    def request():
+        game = quote(rng.choice(games))
+        if rng.random() < write_ratio:
+            body = json.dumps({"pokemon": [str(rng.randint(1, species))]})
+            action = rng.choice(['add', 'own', 'release', 'uncatch'])
+            return (True, 'POST', '/games/%s/%s' % (game, action), body)
+        start = rng.randint(1, species)
+        return (False, 'GET', rng.choice([
+            '/games',
+            '/games/%s/count' % (game,),
+            '/games/%s/statuses?start=%d&end=%d' % (game, start, start + 50),
+            '/games/%s/pokemon?status=owned' % (game,),
+        ]), None)
+    return request
+
+def client(url, request, deadline, latencies, errors):
+    """
+    Sends requests over one connection until ``deadline``, appending the
+    latencies of reads & writes to ``latencies[False]`` and
+    ``latencies[True]``
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    while time.perf_counter() < deadline:
+        is_write, method, path, body = request()
+        start = time.perf_counter()
+        conn.request(method, parts.path + path, body=body)
+        resp = conn.getresponse()
+        resp.read()
+        latencies[is_write].append(time.perf_counter() - start)
+        if resp.status >= 500:
+            errors.append(resp.status)
+    conn.close()
+
+def run_load(url, species, args):
+    """
+    Runs the clients against the server at ``url`` and returns a `dict` of
+    results
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    conn.request('GET', parts.path + '/games')
+    games = json.loads(conn.getresponse().read().decode('utf-8'))
+    conn.close()
+    if not games:
+        raise RuntimeError('Server has no games to query')
+    if species is None:
+        species = max(g["dexsize"] for g in games)
+    games = [g["name"] for g in games]
+    latencies = {False: [], True: []}
+    errors = []
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(
+            url,
+            requests(games, species, args.write_ratio, random.Random(i)),
+            deadline,
+            latencies,
+            errors,
+        ))
+        for i in range(args.clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results = {"errors": len(errors)}
+    for is_write, kind in [(False, 'reads'), (True, 'writes')]:
+        times = sorted(latencies[is_write])
+        results[kind] = {
+            "requests": len(times),
+            "rps": len(times) / args.duration,
+            "p50_ms": percentile(times, 0.5) * 1000,
+            "p99_ms": percentile(times, 0.99) * 1000,
+        }
+    return results
+
+def percentile(times, p):
+    """ Returns the ``p``-th quantile of the sorted list ``times`` """
+    if not times:
+        return 0.0
+    return times[min(int(len(times) * p), len(times) - 1)]
+
+def report(name, results):
+    for kind in ('reads', 'writes'):
+        r = results[kind]
+        print('%-12s %-7s %7d req  %8.1f req/s   p50 %7.2f ms   p99 %7.2f ms'
+              % (name, kind, r["requests"], r["rps"], r["p50_ms"], r["p99_ms"]))
+    if results["errors"]:
+        print('%-12s %d server errors' % (name, results["errors"]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--species', type=int, default=1000)
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--url')
+    parser.add_argument('--json', metavar='FILE')
+    args = parser.parse_args()
+    results = {}
+    if args.url is not None:
+        results['server'] = run_load(args.url.rstrip('/'), None, args)
+        report('server', results['server'])
+    else:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            pokedex = os.path.join(tmpdir, 'pokedex.tsv')
+            dbpath = os.path.join(tmpdir, 'bench.caughtdb')
+            write_pokedex(pokedex, args.species)
+            build_db(dbpath, pokedex, args.species, args.games, seed=0)
+            for backend in sorted(BACKENDS):
+                proc, url = start_server(dbpath, backend, args.readers)
+                try:
+                    results[backend] = run_load(url, args.species, args)
+                finally:
+                    proc.terminate()
+                    proc.wait()
+                report(backend, results[backend])
+        finally:
+            shutil.rmtree(tmpdir)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump({
+                "python": sys.version.split()[0],
+                "clients": args.clients,
+                "duration": args.duration,
+                "write_ratio": args.write_ratio,
+                "results": results,
+            }, fp, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
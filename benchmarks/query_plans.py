@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Shows the query plans & timings of `CaughtDB`'s hottest lookups on a synthetic
+database before and after the schema version 1 migration (covering indexes).
+
+Run from the root of the repository with::
+
+    python -m benchmarks.query_plans [--species N] [--games N]
+"""
+import argparse
+import os.path
+import shutil
+import sqlite3
+import tempfile
+import timeit
+from   caught.database import CaughtDB, Status
+from   .synthetic      import build_db, write_pokedex
+
+QUERIES = [
+    (
+        'get_pokemon_names',
+        'SELECT name FROM pokemon_names WHERE dexno = :dexno ORDER BY name',
+    ),
+    (
+        'get_game_names',
+        'SELECT name FROM game_names WHERE gameID = :gameID ORDER BY name',
+    ),
+    (
+        'getByStatus',
+        'SELECT pokemon.dexno, pokemon.name FROM pokemon'
+        ' JOIN (SELECT * FROM caught WHERE gameID = :gameID) AS game_caught'
+        ' ON pokemon.dexno = game_caught.dexno'
+        ' WHERE game_caught.status = :status ORDER BY pokemon.dexno',
+    ),
+    (
+        'getGameCount',
+        'SELECT gameID, status, count(*) FROM caught'
+        ' WHERE gameID IN (:gameID) GROUP BY gameID, status',
+    ),
+]
+
+def report(dbpath, params, repeat):
+    conn = sqlite3.connect(dbpath)
+    try:
+        for name, sql in QUERIES:
+            print('  ' + name)
+            for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+                print('    ' + row[-1])
+            secs = min(timeit.repeat(
+                lambda: conn.execute(sql, params).fetchall(),
+                number=repeat,
+                repeat=3,
+            ))
+            print('    %.1f µs/query' % (secs / repeat * 1e6,))
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--species', type=int, default=10000)
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pokedex = os.path.join(tmpdir, 'pokedex.tsv')
+        dbpath = os.path.join(tmpdir, 'bench.caughtdb')
+        write_pokedex(pokedex, args.species)
+        build_db(dbpath, pokedex, args.species, args.games, seed=0)
+        # Turn the database back into a pre-migration one:
+        conn = sqlite3.connect(dbpath)
+        for ix, in conn.execute("SELECT name FROM sqlite_master"
+                                " WHERE type = 'index' AND name LIKE 'ix_%'"
+                                ).fetchall():
+            conn.execute('DROP INDEX ' + ix)
+        conn.execute('PRAGMA user_version = 0')
+        conn.commit()
+        conn.close()
+        params = {
+            "dexno": args.species // 2,
+            "gameID": args.games // 2 or 1,
+            "status": int(Status.OWNED),
+        }
+        print('Before migration:')
+        report(dbpath, params, args.repeat)
+        CaughtDB(dbpath)
+        print('After migration:')
+        report(dbpath, params, args.repeat)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
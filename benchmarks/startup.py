@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the wall-clock startup cost of `caught` invocations
+
+Each command is run in a fresh interpreter several times, and the minimum &
+median times are reported.  Run from the root of the repository with::
+
+    python -m benchmarks.startup [--runs N] [--json FILE]
+"""
+import argparse
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from   .synthetic import build_db, write_pokedex
+
+def commands(dbpath):
+    caught = [sys.executable, '-m', 'caught', '-D', dbpath]
+    return [
+        ('import', [sys.executable, '-c', 'import caught.__main__']),
+        ('--help', caught + ['--help']),
+        ('stats', caught + ['stats']),
+        ('add', caught + ['add', 'Game1', '25']),
+        ('get', caught + ['get', '--games', 'Game1', '1-10']),
+    ]
+
+def time_command(argv, runs):
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call(argv, stdout=devnull)
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {"min": times[0], "median": times[len(times) // 2]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', metavar='FILE')
+    args = parser.parse_args()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        pokedex = os.path.join(tmpdir, 'pokedex.tsv')
+        dbpath = os.path.join(tmpdir, 'bench.caughtdb')
+        write_pokedex(pokedex, 1000)
+        build_db(dbpath, pokedex, 1000, 10, seed=0)
+        results = {}
+        for name, argv in commands(dbpath):
+            results[name] = time_command(argv, args.runs)
+            print('%-8s min %7.1f ms   median %7.1f ms' % (
+                name,
+                results[name]["min"] * 1000,
+                results[name]["median"] * 1000,
+            ))
+    finally:
+        shutil.rmtree(tmpdir)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump({
+                "python": sys.version.split()[0],
+                "runs": args.runs,
+                "results": results,
+            }, fp, indent=4, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Times every public `CaughtDB` method and a set of end-to-end CLI commands on
+synthetic databases of one or more sizes
+
+For each scale, a synthetic Pokédex and database are generated, and then, for
+each backend, every public method of the database API is timed (each
+repetition in a transaction that is rolled back afterwards, so that every
+repetition starts from the same data), followed by ``caught get``, ``list``,
+``stats``, ``add -F``, ``copy``, ``diff``, and ``create`` run through click's
+test runner.  The fastest and median times are reported, and the results can
+be saved as JSON and compared against a previous run (e.g., from another
+commit) with ``--baseline``.  Run from the root of the repository with::
+
+    python -m benchmarks.suite [--scale small|medium|large ...]
+        [--backend NAME ...] [--repeat N] [--calls N] [--json FILE]
+        [--baseline FILE]
+"""
+import argparse
+import inspect
+import json
+import os
+import os.path
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from   timeit        import default_timer
+from   click.testing import CliRunner
+from   caught.__main__   import main as caught_main
+from   caught.base       import BACKENDS, open_db
+from   caught.models     import Game, Status
+from   caught.statusexpr import And, StatusIn
+from   .synthetic        import build_db, write_pokedex
+
+#: The database sizes to benchmark at, as ``(species, games, density)``
+#: triples, where ``density`` is the fraction of each game's dex that is
+#: caught or owned
+SCALES = {
+    "small":  (1000, 10, 0.6),
+    "medium": (10000, 100, 0.3),
+    "large":  (100000, 1000, 0.02),
+}
+
+#: Public methods that are not benchmarked: those that end the connection or
+#: transaction that the benchmarks run in, and the sqlite3 backend's query
+#: helper
+UNTIMED = ('close', 'commit', 'scalar')
+
+#: Methods that manage their own transactions, and so are timed outside of a
+#: ``with`` block (they do not change the data)
+SELF_CONTAINED = ('migrate', 'reading')
+
+
+class Fixtures(object):
+    """ The arguments used by the benchmarks at a given scale """
+
+    def __init__(self, db, empty, pokedex, species, calls):
+        #: A database with no Pokédex, for `CaughtDB.create`
+        self.empty = empty
+        with db:
+            self.games = db.allGames()
+        self.game = self.games[0]
+        self.pokedex = pokedex
+        step = max(self.game.dexsize // calls, 1)
+        self.dexnos = list(range(1, self.game.dexsize+1, step))[:calls]
+        self.names = ['Species%d' % (d,) for d in self.dexnos]
+        self.end = min(self.game.dexsize, 1000)
+        self.expr = And((
+            StatusIn(frozenset([Status.CAUGHT]), self.games[0]),
+            StatusIn(frozenset([Status.UNCAUGHT]), self.games[-1]),
+        ))
+
+
+def method_benchmarks():
+    """
+    Returns a list of ``(name, function, setup)`` triples of the `CaughtDB`
+    methods to time, where each function takes an open database and a
+    `Fixtures`, and ``setup`` (if not `None`) is called (untimed) on the
+    database beforehand in the same transaction
+    """
+    def each(method):
+        return lambda db, fx: [getattr(db, method)(fx.game, d)
+                               for d in fx.dexnos]
+
+    def many(method):
+        return lambda db, fx: getattr(db, method)(fx.game, fx.dexnos)
+
+    def profile(db, fx):
+        db.startProfiling()
+        db.getGameCounts()
+        db.stopProfiling()
+
+    def create(db, fx):
+        try:
+            with fx.empty:
+                fx.empty.create(fx.pokedex)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def counters(db):
+        if not db.hasProgressCounters():
+            db.enableProgressCounters()
+
+    def changelog(db):
+        db.enableChangeLog()
+        game = db.allGames()[0]
+        db.markOwnedMany(game, range(1, game.dexsize+1))
+
+    def enter(manager):
+        def run(db, fx):
+            with getattr(db, manager)():
+                db.pokemonQty()
+        return run
+
+    benchmarks = [
+        ('allGames', lambda db, fx: db.allGames()),
+        ('allPokemon', lambda db, fx: db.allPokemon()),
+        ('changesSince', lambda db, fx: list(db.changesSince(0))),
+        ('checkProgressCounters', lambda db, fx: db.checkProgressCounters()),
+        ('copyProgress',
+         lambda db, fx: db.copyProgress(fx.game, fx.games[-1])),
+        ('create', create),
+        ('deleteGame', lambda db, fx: db.deleteGame(fx.game)),
+        ('deleteGames', lambda db, fx: db.deleteGames(fx.games)),
+        ('disableChangeLog', lambda db, fx: db.disableChangeLog()),
+        ('disableProgressCounters',
+         lambda db, fx: db.disableProgressCounters()),
+        ('enableChangeLog', lambda db, fx: db.enableChangeLog()),
+        ('enableProgressCounters', lambda db, fx: db.enableProgressCounters()),
+        ('getByStatus',
+         lambda db, fx: db.getByStatus(fx.game, Status.CAUGHT)),
+        ('getByStatusExpr', lambda db, fx: db.getByStatusExpr(fx.expr)),
+        ('getGame',
+         lambda db, fx: [db.getGame(g.name) for g in fx.games[:100]]),
+        ('getGameByID',
+         lambda db, fx: [db.getGameByID(g.gameID) for g in fx.games[:100]]),
+        ('getGameCount', lambda db, fx: db.getGameCount(fx.game)),
+        ('getGameCounts', lambda db, fx: db.getGameCounts()),
+        ('getPokemon', lambda db, fx: [db.getPokemon(n) for n in fx.names]),
+        ('getPokemonByDexno',
+         lambda db, fx: [db.getPokemonByDexno(d) for d in fx.dexnos]),
+        ('getPokemonRange', lambda db, fx: db.getPokemonRange(1, fx.end)),
+        ('getStatus', each('getStatus')),
+        ('getStatusMatrix',
+         lambda db, fx: list(db.getStatusMatrix(fx.games[:10], fx.dexnos))),
+        ('getStatusRange', lambda db, fx: db.getStatusRange(fx.game)),
+        ('getStatuses', many('getStatuses')),
+        ('hasChangeLog', lambda db, fx: db.hasChangeLog()),
+        ('hasProgressCounters', lambda db, fx: db.hasProgressCounters()),
+        ('iterAllGames', lambda db, fx: list(db.iterAllGames())),
+        ('iterAllPokemon', lambda db, fx: list(db.iterAllPokemon())),
+        ('iterByStatus',
+         lambda db, fx: list(db.iterByStatus(fx.game, Status.OWNED))),
+        ('iterByStatusExpr',
+         lambda db, fx: list(db.iterByStatusExpr(fx.expr))),
+        ('iterCaught', lambda db, fx: list(db.iterCaught([fx.game]))),
+        ('iterPokemonRange',
+         lambda db, fx: list(db.iterPokemonRange(1, fx.end))),
+        ('iterStatusRange',
+         lambda db, fx: list(db.iterStatusRange(fx.game, 1, fx.end))),
+        ('lastChangeSeq', lambda db, fx: db.lastChangeSeq()),
+        ('markCaught', each('markCaught')),
+        ('markCaughtMany', many('markCaughtMany')),
+        ('markOwned', each('markOwned')),
+        ('markOwnedMany', many('markOwnedMany')),
+        ('markReleased', each('markReleased')),
+        ('markReleasedMany', many('markReleasedMany')),
+        ('markUncaught', each('markUncaught')),
+        ('markUncaughtMany', many('markUncaughtMany')),
+        ('mergeGames',
+         lambda db, fx: db.mergeGames(fx.games[:10], fx.games[-1])),
+        ('migrate', lambda db, fx: db.migrate()),
+        ('nameResolver', lambda db, fx: db.nameResolver()),
+        ('objectCacheInfo', lambda db, fx: db.objectCacheInfo()),
+        ('newGame', lambda db, fx: [
+            db.newGame(Game(None, 'New%d' % (i,), None, None, 151, ()))
+            for i in range(100)
+        ]),
+        ('pokemonQty', lambda db, fx: db.pokemonQty()),
+        ('reading', enter('reading')),
+        ('rebuildProgressCounters',
+         lambda db, fx: db.rebuildProgressCounters()),
+        ('savepoint', enter('savepoint')),
+        ('setStatus', lambda db, fx: [db.setStatus(fx.game, d, Status.OWNED)
+                                      for d in fx.dexnos]),
+        ('setStatusMany', lambda db, fx: db.setStatusMany(
+            fx.game, fx.dexnos, Status.OWNED,
+        )),
+        ('setStatusRows', lambda db, fx: db.setStatusRows([
+            (g.gameID, d, Status.CAUGHT) for g in fx.games[:10]
+                                         for d in fx.dexnos
+        ])),
+        ('startProfiling', profile),
+        ('statementCacheInfo', lambda db, fx: db.statementCacheInfo()),
+        ('stopProfiling', profile),
+        ('update', lambda db, fx: db.update(fx.pokedex)),
+    ]
+    setups = {
+        "changesSince": changelog,
+        "checkProgressCounters": counters,
+        "disableChangeLog": changelog,
+        "disableProgressCounters": counters,
+        "lastChangeSeq": changelog,
+        "rebuildProgressCounters": counters,
+    }
+    return [(name, op, setups.get(name)) for name, op in benchmarks]
+
+def cli_benchmarks(tmpdir, dbpath, fx):
+    """
+    Returns a list of ``(name, setup, argv)`` triples of the CLI commands to
+    time, where ``setup`` is called (untimed) before each repetition and
+    returns the path to the database to run the command on
+    """
+    pokefile = os.path.join(tmpdir, 'pokemon.txt')
+    with open(pokefile, 'w') as fp:
+        for name in fx.names:
+            print(name, file=fp)
+    scratch = os.path.join(tmpdir, 'scratch.caughtdb')
+
+    def copy():
+        shutil.copyfile(dbpath, scratch)
+        return scratch
+
+    def logged():
+        path = copy()
+        db = open_db(path)
+        with db:
+            db.enableChangeLog()
+            db.markOwnedMany(fx.game, range(1, fx.game.dexsize+1))
+        db.close()
+        return path
+
+    def empty():
+        if os.path.exists(scratch):
+            os.unlink(scratch)
+        return scratch
+
+    games = [g.name for g in fx.games[:3]]
+    return [
+        ('get', lambda: dbpath,
+         ['get', '--games', ','.join(games), '1-%d' % (fx.end,)]),
+        ('list', lambda: dbpath, ['list', 'caught'] + games[:2]),
+        ('stats', lambda: dbpath, ['stats']),
+        ('add -F', copy, ['add', '-F', pokefile, fx.game.name]),
+        ('copy', copy, ['copy', fx.game.name, fx.games[-1].name]),
+        ('diff', logged, ['diff', '--format', 'ndjson']),
+        ('create', empty, ['create', fx.pokedex]),
+    ]
+
+def time_method(db, fx, op, setup, repeat, transaction=True):
+    times = []
+    for _ in range(repeat):
+        if not transaction:
+            start = default_timer()
+            op(db, fx)
+            times.append(default_timer() - start)
+            continue
+        try:
+            with db:
+                if setup is not None:
+                    setup(db)
+                start = default_timer()
+                op(db, fx)
+                times.append(default_timer() - start)
+                raise Rollback()
+        except Rollback:
+            pass
+    return times
+
+def time_cli(runner, backend, setup, argv, repeat):
+    times = []
+    for _ in range(repeat):
+        dbpath = setup()
+        start = default_timer()
+        r = runner.invoke(
+            caught_main,
+            ['--backend', backend, '-D', dbpath] + argv,
+            catch_exceptions=False,
+        )
+        times.append(default_timer() - start)
+        if r.exit_code != 0:
+            raise RuntimeError('caught %s failed:\n%s'
+                               % (' '.join(argv), r.output))
+    return times
+
+def summarize(times):
+    return {
+        "min_ms": min(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "repeat": len(times),
+    }
+
+def untested_methods(db, names):
+    """
+    Returns the names of the public methods of ``db`` that are not in
+    ``names`` or `UNTIMED`, following the convention that public methods are
+    camelCase and internal ones snake_case
+    """
+    return sorted(
+        n for n in dir(db)
+        if not n.startswith('_') and '_' not in n and n not in names
+            and n not in UNTIMED and inspect.ismethod(getattr(db, n))
+    )
+
+def run_scale(tmpdir, scale, args):
+    species, games, density = SCALES[scale]
+    pokedex = os.path.join(tmpdir, 'pokedex.tsv')
+    dbpath = os.path.join(tmpdir, 'bench.caughtdb')
+    sys.stderr.write('Building %s database (%d species, %d games) ...\n'
+                     % (scale, species, games))
+    write_pokedex(pokedex, species)
+    build_db(dbpath, pokedex, species, games, seed=0, density=density).close()
+    results = {}
+    for backend in args.backend:
+        db = open_db(dbpath, backend)
+        empty = open_db(os.path.join(tmpdir, 'empty-%s.caughtdb' % (backend,)),
+                        backend)
+        fx = Fixtures(db, empty, pokedex, species, args.calls)
+        methods = method_benchmarks()
+        missing = untested_methods(db, [name for name, _, _ in methods])
+        if missing:
+            sys.stderr.write('%s: not benchmarked: %s\n'
+                             % (backend, ', '.join(missing)))
+        results[backend] = {}
+        for name, op, setup in methods:
+            results[backend][name] = summarize(
+                time_method(db, fx, op, setup, args.repeat,
+                            transaction=name not in SELF_CONTAINED)
+            )
+        db.close()
+        empty.close()
+        runner = CliRunner()
+        for name, setup, argv in cli_benchmarks(tmpdir, dbpath, fx):
+            results[backend]['caught ' + name] = summarize(
+                time_cli(runner, backend, setup, argv, args.repeat)
+            )
+    return results
+
+def report(scale, results, baseline):
+    backends = sorted(results)
+    print('[%s]' % (scale,))
+    print('%-26s' % ('',) + ''.join('%26s' % (b,) for b in backends))
+    names = sorted(set().union(*(results[b] for b in backends)))
+    for name in names:
+        line = '%-26s' % (name,)
+        for b in backends:
+            r = results[b].get(name)
+            if r is None:
+                line += '%26s' % ('-',)
+                continue
+            cell = '%10.2f ms' % (r["min_ms"],)
+            try:
+                old = baseline[scale][b][name]["min_ms"]
+            except (KeyError, TypeError):
+                cell += ' ' * 9
+            else:
+                cell += ' (%+5.0f%%)' % ((r["min_ms"] / old - 1) * 100,)
+            line += '%26s' % (cell,)
+        print(line)
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES))
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--calls', type=int, default=200,
+                        help='Pokémon per call to the per-Pokémon methods')
+    parser.add_argument('--json', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='Compare against the results saved in FILE')
+    args = parser.parse_args()
+    args.scale = args.scale or ['small']
+    args.backend = args.backend or sorted(BACKENDS)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)["results"]
+    tmpdir = tempfile.mkdtemp()
+    # Keep compiled Pokédex indexes out of the user's cache:
+    os.environ['CAUGHT_CACHE_DIR'] = os.path.join(tmpdir, 'cache')
+    results = {}
+    try:
+        for scale in args.scale:
+            scaledir = os.path.join(tmpdir, scale)
+            os.mkdir(scaledir)
+            results[scale] = run_scale(scaledir, scale, args)
+            report(scale, results[scale], baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump({
+                "python": sys.version.split()[0],
+                "revision": git_revision(),
+                "repeat": args.repeat,
+                "calls": args.calls,
+                "scales": {s: dict(zip(('species', 'games', 'density'),
+                                       SCALES[s]))
+                           for s in args.scale},
+                "results": results,
+            }, fp, indent=4, sort_keys=True)
+
+
+class Rollback(Exception):
+    pass
+
+
+if __name__ == '__main__':
+    main()
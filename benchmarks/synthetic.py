@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Generation of synthetic Pokédexes and databases for benchmarking
+"""
+import random
+from   caught.database import CaughtDB, Game, Status
+
+def write_pokedex(path, species):
+    """
+    Writes a synthetic Pokédex TSV with ``species`` entries to ``path``.  Every
+    third species is given a synonym.
+    """
+    with open(path, 'w') as fp:
+        fp.write('# Synthetic Pokédex\n')
+        for dexno in range(1, species+1):
+            fields = [str(dexno), 'Species%d' % (dexno,)]
+            if dexno % 3 == 0:
+                fields.append('Alias%d' % (dexno,))
+            fp.write('\t'.join(fields) + '\n')
+
+def build_db(dbpath, pokedex, species, games, seed=None, density=0.6):
+    """
+    Creates a database at ``dbpath`` from the Pokédex TSV ``pokedex`` (which
+    must have ``species`` entries) with ``games`` games, each with a random
+    ``dexsize`` and a random selection of caught and owned Pokémon, with each
+    Pokémon in a game's dex having a probability of ``density`` of being
+    caught or owned (and a third of those owned).  Returns the `CaughtDB`.
+    """
+    rng = random.Random(seed)
+    db = CaughtDB(dbpath)
+    with db:
+        db.create(pokedex)
+        for i in range(1, games+1):
+            game = db.newGame(Game(
+                None,
+                'Game%d' % (i,),
+                'version%d' % (rng.randint(1, 7),),
+                'Player%d' % (i,),
+                rng.randint(species // 2, species),
+                ('g%d' % (i,),),
+            ))
+            caught, owned = [], []
+            for dexno in range(1, game.dexsize+1):
+                r = rng.random()
+                if r < density / 3:
+                    owned.append(dexno)
+                elif r < density:
+                    caught.append(dexno)
+            db.setStatusMany(game, caught, Status.CAUGHT)
+            db.setStatusMany(game, owned, Status.OWNED)
+    return db
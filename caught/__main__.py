@@ -1,30 +1,38 @@
 # -*- coding: utf-8 -*-
-import csv
-import heapq
 import json
 import os
 import os.path
+import shlex
 import sys
 import click
-from   six.moves import input, zip_longest
-from   .database import (
-    CaughtDB, Game, Status, NoSuchPokemonError, NoSuchGameError,
+# The database backend (and thus SQLAlchemy, if used) is only imported once a
+# subcommand is actually run, keeping `--help` and startup in general fast.
+from   .base import BACKENDS, COPY_MODES, DEFAULT_BUSY_TIMEOUT, JOURNAL_MODES, \
+                    open_db
+from   .models import Game, Status, MalformedFileError, NoSuchPokemonError, \
+                        NoSuchGameError
+from   .output import FORMATS, MACHINE_FORMATS, Tabulator, from_bytes
+from   .statusexpr import (
+    ALL_GAMES, And, StatusExprError, StatusIn, parse_status_expr,
+    parse_status_set,
+)
+from   .transfer import (
+    COMMIT_CHUNK_SIZE, CONFLICT_POLICIES, export_ndjson, import_ndjson,
 )
 
 DEFAULT_DBFILE = os.path.join(os.environ.get("HOME", os.curdir), '.caughtdb')
 
-statuses = {
-    "uncaught": {Status.UNCAUGHT},
-    "caught":   {Status.CAUGHT},
-    "caught+":  {Status.CAUGHT, Status.OWNED},
-    "owned":    {Status.OWNED},
-    "unowned":  {Status.UNCAUGHT, Status.CAUGHT}
-}
-
 POKEMON_NAME_LEN = 12
 
 NONEXISTENT = '##'
 
+#: Subcommands that cannot be run by ``caught batch``, as they manage their own
+#: transactions or connections or read standard input
+BATCH_EXCLUDED = ('batch', 'import', 'serve')
+
+#: The parameters of `main` that are passed to `open_db`
+DB_OPTIONS = ('dbfile', 'backend', 'journal_mode', 'busy_timeout')
+
 def warn(s):
     #sys.stderr.write(sys.argv[0] + ': ' + s + "\n")
     sys.stderr.write('Warning: ' + s + "\n")
@@ -42,32 +50,15 @@ def listPokemon(db, pokefiles, pokemon, maxno=None, warn_on_fail=False):
         for pokedata in getPokemon(db, poke, maxno, warn_on_fail):
             yield pokedata
 
-def splitHyphens(s):
-    i = s.find('-')
-    while i != -1:
-        if 0 < i < len(s)-1:
-            yield (s[:i], s[i+1:])
-        i = s.find('-', i+1)
-
 def getPokemon(db, poke, maxno=None, warn_on_fail=False):
     try:
-        pokedata = db.getPokemon(poke)
+        return db.nameResolver().resolve(poke, maxno)
     except NoSuchPokemonError as e:
-        for (a, b) in splitHyphens(poke):
-            try:
-                pokeA = db.getPokemon(a)
-                pokeB = db.getPokemon(b)
-            except NoSuchPokemonError:
-                continue
-            else:
-                return db.getPokemonRange(pokeA, pokeB, maxno)
         if warn_on_fail:
             warn(str(e))
             return []
         else:
             raise e
-    else:
-        return [pokedata]
 
 def getGame(db, game, warn_on_fail=False, force_gname=False):
     try:
@@ -84,72 +75,53 @@ def getGame(db, game, warn_on_fail=False, force_gname=False):
     else:
         return gamedata
 
+def output_format(use_json, fmt):
+    return 'json' if use_json else (fmt or 'table')
+
 def GameCSV(arg):
     ### TODO: Expand/customize (and add appropriate error handling?)
+    import csv
     return next(csv.reader([arg]))
 
 
-class Tabulator(object):
-    def __init__(self, minlengths, use_json=False):
-        self.minlengths = tuple(minlengths)
-        self.json = use_json
-        self.first = True
-        self.heads = None
-        self.widths = None
+@click.group()
+@click.option('-D', '--dbfile', default=DEFAULT_DBFILE)
+@click.option('--backend', type=click.Choice(sorted(BACKENDS)))
+@click.option('--journal-mode', type=click.Choice(JOURNAL_MODES),
+              envvar='CAUGHT_JOURNAL_MODE')
+@click.option('--busy-timeout', type=float, default=DEFAULT_BUSY_TIMEOUT,
+              envvar='CAUGHT_BUSY_TIMEOUT', show_default=True)
+@click.option('--trace-sql', is_flag=True)
+@click.option('--trace-sql-json', type=click.File('w'))
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True))
+@click.pass_context
+def main(ctx, dbfile, backend, journal_mode, busy_timeout, trace_sql,
+         trace_sql_json, profile):
+    ctx.obj = open_db(dbfile, backend, journal_mode=journal_mode,
+                      busy_timeout=busy_timeout)
+    if trace_sql or trace_sql_json is not None:
+        profiler = ctx.obj.startProfiling()
 
-    def header(self, heads):
-        if self.json:
-            self.heads = tuple(heads)
-            click.echo('{', nl=False)
-        else:
-            self.widths = [self.minlengths[0]]
-            click.echo(' ' * self.minlengths[0], nl=False)
-            for h, ml in zip_longest(heads, self.minlengths[1:], fillvalue=0):
-                if h == 0:
-                    break
-                h = from_bytes(h)
-                self.widths.append(max(len(h), ml))
-                click.echo(u'|%-*s' % (self.widths[-1], h), nl=False)
-            click.echo()
-            print('|'.join('-' * w for w in self.widths))
-
-    def row(self, values):
-        if self.heads is None and self.widths is None:
-            raise RuntimeError('Tabulator.row() called before Tabulator.header()')
-        if self.json:
-            if self.first:
-                self.first = False
-            else:
-                click.echo(',', nl=False)
-            values = tuple(values)
-            click.echo(
-                json.dumps(values[0]) + ':'
-                + json.dumps(dict(zip_longest(self.heads, values[1:]))),
-                nl=False,
-            )
-        else:
-            first = True
-            for val, width in zip_longest(values, self.widths):
-                if width is None:
-                    break
-                if first:
-                    first = False
-                else:
-                    click.echo('|', nl=False)
-                val = from_bytes(val)
-                click.echo(u'%-*s' % (width, val or ''), nl=False)
-            click.echo()
+        def report_sql():
+            if trace_sql:
+                profiler.report(sys.stderr)
+                objects = ctx.obj.objectCacheInfo()
+                sys.stderr.write('Game/Pokémon cache: %d hits, %d misses\n'
+                                 % (objects.hits, objects.misses))
+            if trace_sql_json is not None:
+                profiler.dump_json(trace_sql_json)
 
-    def end(self):
-        if self.json:
-            click.echo('}')
+        ctx.call_on_close(report_sql)
+    if profile is not None:
+        import cProfile
+        cprof = cProfile.Profile()
 
+        def dump_profile():
+            cprof.disable()
+            cprof.dump_stats(profile)
 
-@click.group()
-@click.option('-D', '--dbfile', default=DEFAULT_DBFILE)
-@click.pass_context
-def main(ctx, dbfile):
-    ctx.obj = CaughtDB(dbfile)
+        ctx.call_on_close(dump_profile)
+        cprof.enable()
 
 @main.command()
 @click.argument('pokedex')
@@ -158,6 +130,24 @@ def create(ctx, pokedex):
     with ctx.obj as db:
         db.create(pokedex)
 
+@main.command()
+@click.option('-q', '--quiet', is_flag=True)
+@click.argument('pokedex')
+@click.pass_context
+def update(ctx, quiet, pokedex):
+    with ctx.obj as db:
+        try:
+            changes = db.update(pokedex)
+        except MalformedFileError as e:
+            ctx.fail(str(e))
+    if not quiet:
+        print('%d Pokémon added, %d renamed, %d with changed synonyms' % (
+            changes.added, changes.renamed, changes.resynonymed,
+        ))
+        if changes.unlisted:
+            warn('%d Pokémon in the database are not in %s and were left'
+                 ' unchanged' % (changes.unlisted, pokedex))
+
 @main.command()
 @click.option('-i', '--ignore-dups', is_flag=True)
 @click.option('-q', '--quiet', is_flag=True)
@@ -184,7 +174,9 @@ def new(ctx, ignore_dups, quiet, version, player_name, dexsize, name, synonyms):
 @click.argument('games', nargs=-1, required=True)
 @click.pass_context
 def delete(ctx, force, force_gname, games):
+    from six.moves import input
     with ctx.obj as db:
+        doomed = []
         for g in games:
             game = getGame(db, g, warn_on_fail=True, force_gname=force_gname)
             if game is None:
@@ -200,7 +192,41 @@ def delete(ctx, force, force_gname, games):
                 else:
                     print('Invalid response.')
             if yesdel:
-                db.deleteGame(game)
+                doomed.append(game)
+        db.deleteGames(doomed)
+
+@main.command()
+@click.option('-G', 'force_gname', is_flag=True)
+@click.option('--mode', type=click.Choice(COPY_MODES), default='merge',
+              show_default=True)
+@click.option('-q', '--quiet', is_flag=True)
+@click.argument('source')
+@click.argument('dest')
+@click.pass_context
+def copy(ctx, force_gname, mode, quiet, source, dest):
+    with ctx.obj as db:
+        source = getGame(db, source, force_gname=force_gname)
+        dest = getGame(db, dest, force_gname=force_gname)
+        if source.gameID == dest.gameID:
+            raise click.UsageError('cannot copy a game onto itself')
+        changed = db.copyProgress(source, dest, mode=mode)
+        if not quiet:
+            print('%d statuses in %s changed' % (changed, dest.name))
+
+@main.command()
+@click.option('-d', '--delete', is_flag=True)
+@click.option('-G', 'force_gname', is_flag=True)
+@click.option('-q', '--quiet', is_flag=True)
+@click.argument('dest')
+@click.argument('sources', nargs=-1, required=True)
+@click.pass_context
+def merge(ctx, delete, force_gname, quiet, dest, sources):
+    with ctx.obj as db:
+        dest = getGame(db, dest, force_gname=force_gname)
+        sources = [getGame(db, g, force_gname=force_gname) for g in sources]
+        changed = db.mergeGames(sources, dest, delete=delete)
+        if not quiet:
+            print('%d statuses in %s changed' % (changed, dest.name))
 
 def set_cmd(group, name, method, domain, target):
     @group.command(name)
@@ -213,23 +239,29 @@ def set_cmd(group, name, method, domain, target):
     def cmd(ctx, game, pokefiles, pokemon, verbose, force_gname):
         with ctx.obj as db:
             game = getGame(db, game, force_gname=force_gname)
-            for pokedata in listPokemon(db, pokefiles, pokemon, maxno=game.dexsize):
-                if verbose:
-                    stat = db.getStatus(game, pokedata)
+            pokelist = list(listPokemon(db, pokefiles, pokemon,
+                                        maxno=game.dexsize))
+            if verbose:
+                stats = db.getStatuses(game, pokelist)
+                changed = []
+                for pokedata in pokelist:
+                    stat = stats[pokedata.dexno]
                     if stat in domain:
-                        method(db, game, pokedata)
+                        changed.append(pokedata)
+                        stats[pokedata.dexno] = target
                         print('%3d. %s: %s → %s'
                               % (pokedata.dexno, pokedata.name, stat, target))
                     else:
                         print('%3d. %s: %s' % (pokedata.dexno, pokedata.name, stat))
-                else:
-                    method(db, game, pokedata)
+                getattr(db, method)(game, changed)
+            else:
+                getattr(db, method)(game, pokelist)
 
 for name, method, domain, target in [
-    ('add',     CaughtDB.markCaught, (Status.UNCAUGHT,), Status.CAUGHT),
-    ('own',     CaughtDB.markOwned, (Status.UNCAUGHT, Status.CAUGHT), Status.OWNED),
-    ('release', CaughtDB.markReleased, (Status.OWNED,), Status.CAUGHT),
-    ('uncatch', CaughtDB.markUncaught, (Status.CAUGHT, Status.OWNED), Status.UNCAUGHT),
+    ('add',     'markCaughtMany', (Status.UNCAUGHT,), Status.CAUGHT),
+    ('own',     'markOwnedMany', (Status.UNCAUGHT, Status.CAUGHT), Status.OWNED),
+    ('release', 'markReleasedMany', (Status.OWNED,), Status.CAUGHT),
+    ('uncatch', 'markUncaughtMany', (Status.CAUGHT, Status.OWNED), Status.UNCAUGHT),
 ]: set_cmd(main, name, method, domain, target)
 
 @main.command()
@@ -237,31 +269,35 @@ for name, method, domain, target in [
 @click.option('-F', '--file', 'pokefiles', multiple=True, type=click.File('r'))
 @click.option('-G', 'force_gname', is_flag=True)
 @click.option('-J', '--json', 'use_json', is_flag=True)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS))
 @click.argument('pokemon', nargs=-1)
 @click.pass_context
-def get(ctx, games, pokefiles, use_json, pokemon, force_gname):
-    with ctx.obj as db:
+def get(ctx, games, pokefiles, use_json, fmt, pokemon, force_gname):
+    fmt = output_format(use_json, fmt)
+    with ctx.obj.reading() as db:
         if games:
             games = [getGame(db, g, force_gname=force_gname) for g in games]
         else:
             games = db.allGames()
         table = Tabulator(
             [POKEMON_NAME_LEN+5] + [2]*len(games),
-            use_json=use_json,
+            fmt   = fmt,
+            keys  = ('dexno', 'name'),
+            group = 'games',
         )
         table.header(g.name for g in games)
         maxno = max(g.dexsize for g in games)
         if pokefiles or pokemon:
-            pokemon = listPokemon(db, pokefiles, pokemon, maxno=maxno,
-                                  warn_on_fail=True)
+            dexnos = [int(p) for p in listPokemon(db, pokefiles, pokemon,
+                                                  maxno=maxno,
+                                                  warn_on_fail=True)]
         else:
-            pokemon = db.allPokemon(maxno=maxno)
-        for pokedata in pokemon:
-            stats = [db.getStatus(g, pokedata)
-                     if pokedata.dexno <= g.dexsize
-                     else None
-                     for g in games]
-            if use_json:
+            dexnos = None
+        for pokedata, stats in db.getStatusMatrix(games, dexnos):
+            if fmt in MACHINE_FORMATS:
+                table.row([pokedata.dexno, pokedata.name] +
+                          [s.name if s is not None else s for s in stats])
+            elif fmt == 'json':
                 table.row([pokedata.name] +
                           [s.name if s is not None else s for s in stats])
             else:
@@ -273,25 +309,33 @@ def get(ctx, games, pokefiles, use_json, pokemon, force_gname):
         table.end()
 
 @main.command('list')
+@click.option('-e', '--expr')
 @click.option('-G', 'force_gname', is_flag=True)
-@click.argument('status')
-@click.argument('game')
+@click.argument('status', required=False)
+@click.argument('games', nargs=-1)
 @click.pass_context
-def list_cmd(ctx, status, game, force_gname):
-    with ctx.obj as db:
-        game = getGame(db, game, force_gname=force_gname)
-        toList = set()
-        for stat in status.split('/'):
-            stat = status.strip().lower()
-            if stat in statuses:
-                toList |= statuses[stat]
-            else:
-                ctx.fail(stat + ': invalid status')
-        pokemon = []
-        for status in toList:
-            pokemon = heapq.merge(pokemon, db.getByStatus(game, status,
-                                                          game.dexsize))
-        for poke in pokemon:
+def list_cmd(ctx, expr, force_gname, status, games):
+    with ctx.obj.reading() as db:
+        def lookup(game):
+            if game == ALL_GAMES:
+                return ALL_GAMES
+            return getGame(db, game, force_gname=force_gname)
+        if expr is not None:
+            if status is not None:
+                ctx.fail('--expr cannot be combined with status & game arguments')
+            try:
+                query = parse_status_expr(expr, lookup)
+            except StatusExprError as e:
+                ctx.fail(str(e))
+        else:
+            if status is None or not games:
+                ctx.fail('a status and at least one game are required')
+            try:
+                stats = parse_status_set(status)
+            except ValueError as e:
+                ctx.fail(str(e))
+            query = And(tuple(StatusIn(stats, lookup(g)) for g in games))
+        for poke in db.iterByStatusExpr(query):
             print(str(poke))
 
 @main.command()
@@ -301,19 +345,20 @@ def list_cmd(ctx, status, game, force_gname):
 @click.argument('games', nargs=-1)
 @click.pass_context
 def games(ctx, games, use_json, stats, force_gname):
-    with ctx.obj as db:
+    with ctx.obj.reading() as db:
+        if games:
+            games = list(filter(None, [getGame(db, g, warn_on_fail=True,
+                                               force_gname=force_gname)
+                                       for g in games]))
+        else:
+            games = db.allGames()
         if stats:
+            counts = db.getGameCounts(games)
             def gameArgs(game):
-                caught, owned = db.getGameCount(game)
+                caught, owned = counts[game.gameID]
                 return (caught+owned, owned)
         else:
             gameArgs = lambda _: ()
-        if games:
-            games = filter(None, [getGame(db, g, warn_on_fail=True,
-                                          force_gname=force_gname)
-                                  for g in games])
-        else:
-            games = db.allGames()
         if use_json:
             jsonses = []
             for game in games:
@@ -326,28 +371,244 @@ def games(ctx, games, use_json, stats, force_gname):
 @main.command()
 @click.option('-G', 'force_gname', is_flag=True)
 @click.option('-J', '--json', 'use_json', is_flag=True)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS))
 @click.argument('games', nargs=-1)
 @click.pass_context
-def stats(ctx, games, use_json, force_gname):
-    with ctx.obj as db:
+def stats(ctx, games, use_json, fmt, force_gname):
+    with ctx.obj.reading() as db:
         if games:
-            games = filter(None, [getGame(db, g, warn_on_fail=True,
-                                          force_gname=force_gname)
-                                  for g in games])
+            games = list(filter(None, [getGame(db, g, warn_on_fail=True,
+                                               force_gname=force_gname)
+                                       for g in games]))
         else:
             games = db.allGames()
+        counts = db.getGameCounts(games)
         table = Tabulator(
             [max(len(from_bytes(g.name)) for g in games), 3, 3],
-            use_json=use_json,
+            fmt  = output_format(use_json, fmt),
+            keys = ('game',),
         )
         table.header(['caught or owned', 'owned', 'maximum'])
         for game in games:
-            caught, owned = db.getGameCount(game)
+            caught, owned = counts[game.gameID]
             table.row([game.name, caught+owned, owned, game.dexsize])
         table.end()
 
-def from_bytes(s):
-    return s.decode('utf-8') if isinstance(s, bytes) else s
+@main.command()
+@click.option('--check', is_flag=True)
+@click.option('--disable', is_flag=True)
+@click.pass_context
+def reindex(ctx, check, disable):
+    with ctx.obj as db:
+        if disable:
+            db.disableProgressCounters()
+            return
+        if check:
+            if not db.hasProgressCounters():
+                ctx.fail('progress counters are not enabled')
+            mismatches = db.checkProgressCounters()
+        elif db.hasProgressCounters():
+            mismatches = db.rebuildProgressCounters()
+        else:
+            db.enableProgressCounters()
+            mismatches = []
+        for gameID, stored, actual in mismatches:
+            print('Game %d: stored caught/owned %s, actual %d/%d' % (
+                gameID,
+                'missing' if stored is None else '%d/%d' % stored,
+                actual[0],
+                actual[1],
+            ))
+        if check and mismatches:
+            ctx.exit(1)
+
+@main.command()
+@click.option('--disable', is_flag=True)
+@click.pass_context
+def changelog(ctx, disable):
+    with ctx.obj as db:
+        if disable:
+            db.disableChangeLog()
+        else:
+            db.enableChangeLog()
+            print(db.lastChangeSeq())
+
+@main.command()
+@click.option('--since', type=click.IntRange(0, None), default=0)
+@click.option('--games', type=GameCSV)
+@click.option('-G', 'force_gname', is_flag=True)
+@click.option('-J', '--json', 'use_json', is_flag=True)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS))
+@click.pass_context
+def diff(ctx, since, games, force_gname, use_json, fmt):
+    with ctx.obj.reading() as db:
+        if not db.hasChangeLog():
+            ctx.fail('change log is not enabled')
+        if games:
+            games = [getGame(db, g, force_gname=force_gname) for g in games]
+        table = Tabulator([6, 4, 5, 8, 8], fmt=output_format(use_json, fmt),
+                          keys=('seq',))
+        table.header(['game', 'dexno', 'old', 'new'])
+        for change in db.changesSince(since, games or None):
+            table.row([change.seq, change.gameID, change.dexno,
+                       change.old.name, change.new.name])
+        table.end()
+
+@main.command('export')
+@click.option('-G', 'force_gname', is_flag=True)
+@click.option('-o', '--outfile', type=click.File('w'), default='-')
+@click.argument('games', nargs=-1)
+@click.pass_context
+def export_cmd(ctx, force_gname, outfile, games):
+    with ctx.obj.reading() as db:
+        if games:
+            games = list(filter(None, [getGame(db, g, warn_on_fail=True,
+                                               force_gname=force_gname)
+                                       for g in games]))
+        else:
+            games = None
+        with outfile:
+            export_ndjson(db, outfile, games)
+
+@main.command('import')
+@click.option('--on-conflict', type=click.Choice(CONFLICT_POLICIES),
+              default='error')
+@click.option('--commit-every', type=click.IntRange(1, None),
+              default=COMMIT_CHUNK_SIZE)
+@click.option('-q', '--quiet', is_flag=True)
+@click.option('-v', '--verbose', is_flag=True)
+@click.argument('infile', type=click.File('r'), default='-')
+@click.pass_context
+def import_cmd(ctx, on_conflict, commit_every, quiet, verbose, infile):
+    def report(st, prefix=''):
+        sys.stderr.write(
+            '%s%d games, %d statuses imported, %d skipped in %.2fs'
+            ' (%d rows/s)\n' % (
+                prefix, st.games, st.statuses, st.skipped, st.seconds,
+                st.statuses / st.seconds if st.seconds else 0,
+            )
+        )
+    with ctx.obj as db:
+        with infile:
+            try:
+                st = import_ndjson(
+                    db, infile,
+                    on_conflict  = on_conflict,
+                    commit_every = commit_every,
+                    progress     = report if verbose and not quiet else None,
+                )
+            except MalformedFileError as e:
+                ctx.fail(str(e))
+    if not quiet:
+        report(st, 'Done: ')
+
+@main.command()
+@click.option('--ndjson', is_flag=True)
+@click.option('--commit-every', type=click.IntRange(1, None))
+@click.option('--fail-fast', is_flag=True)
+@click.argument('infile', type=click.File('r'), default='-')
+@click.pass_context
+def batch(ctx, ndjson, commit_every, fail_fast, infile):
+    qty = failures = uncommitted = 0
+    with ctx.obj as db:
+        with infile:
+            for lineno, line in enumerate(infile, start=1):
+                try:
+                    argv = parse_batch_line(line, ndjson)
+                    if not argv:
+                        continue
+                    qty += 1
+                    run_batch_command(ctx, db, argv)
+                except click.exceptions.Exit as e:
+                    if e.exit_code != 0:
+                        error = 'exited with status %d' % (e.exit_code,)
+                    else:
+                        error = None
+                except click.ClickException as e:
+                    error = e.format_message()
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                else:
+                    error = None
+                if error is not None:
+                    failures += 1
+                    sys.stderr.write('%s: line %d: %s\n'
+                                     % (infile.name, lineno, error))
+                    if fail_fast:
+                        # Exiting inside the `with` block rolls back
+                        # everything since the last commit.
+                        ctx.exit(1)
+                uncommitted += 1
+                if commit_every is not None and uncommitted >= commit_every:
+                    db.commit()
+                    uncommitted = 0
+    if failures:
+        sys.stderr.write('%d of %d commands failed\n' % (failures, qty))
+        ctx.exit(1)
+
+@main.command()
+@click.option('--host')
+@click.option('-p', '--port', type=int)
+@click.option('--readers', type=click.IntRange(1, None))
+@click.option('-q', '--quiet', is_flag=True)
+@click.pass_context
+def serve(ctx, host, port, readers, quiet):
+    # Imported here so that http.server is not loaded by every other command:
+    from .server import (
+        DEFAULT_HOST, DEFAULT_PORT, DEFAULT_READERS, CaughtServer,
+    )
+    # The database options given to `main`:
+    options = {k: ctx.parent.params[k] for k in DB_OPTIONS}
+    ctx.obj.close()
+    server = CaughtServer(
+        (host or DEFAULT_HOST, DEFAULT_PORT if port is None else port),
+        lambda: open_db(**options),
+        readers = readers or DEFAULT_READERS,
+        quiet   = quiet,
+    )
+    sys.stderr.write('Serving on http://%s:%d/\n' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def parse_batch_line(line, ndjson):
+    """
+    Returns the arguments of the command on a line of ``caught batch``'s
+    input (either a shell-style command line or, if ``ndjson`` is true, a
+    JSON array of strings), or an empty list for a blank line or comment.  A
+    leading ``caught`` is dropped.
+    """
+    if ndjson:
+        line = line.strip()
+        if not line:
+            return []
+        argv = json.loads(line)
+        if not isinstance(argv, list) \
+                or not all(isinstance(a, str) for a in argv):
+            raise ValueError('expected a JSON array of strings')
+    else:
+        argv = shlex.split(line, comments=True)
+    if argv[:1] == ['caught']:
+        argv = argv[1:]
+    return argv
+
+def run_batch_command(ctx, db, argv):
+    """
+    Runs the subcommand ``argv`` on the open database ``db`` for ``caught
+    batch``.  The subcommand's ``with ctx.obj`` block runs in a savepoint
+    rather than a transaction of its own, so a failing command's changes are
+    undone without affecting the rest of the batch.
+    """
+    name = argv[0]
+    cmd = main.get_command(ctx, name)
+    if cmd is None or name in BATCH_EXCLUDED:
+        raise click.UsageError('%s: not a batch command' % (name,))
+    with cmd.make_context(name, argv[1:], parent=ctx,
+                          obj=db.savepoint()) as sub:
+        cmd.invoke(sub)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,1070 @@
+# -*- coding: utf-8 -*-
+"""
+The backend-independent parts of the `CaughtDB` API, shared by the SQLAlchemy
+backend in `caught.database` and the stdlib `sqlite3` backend in
+`caught.litedb`.  Like `caught.models`, this module does not depend on
+SQLAlchemy.
+"""
+from   collections import OrderedDict, defaultdict, namedtuple
+import importlib
+from   itertools import islice
+import random
+import time
+from   .dexindex import load_pokedex, open_index
+from   .profiling import QueryProfiler
+from   .models import (
+    DatabaseLockedError, Game, MalformedFileError, NameResolver, Pokemon,
+    Status, read_pokedex,
+)
+from   .statusexpr import ALL_GAMES, status_expr_games
+
+#: The table recording the SHA-256 digest of the Pokédex TSV file that the
+#: Pokémon tables were loaded from, if they are known to match it exactly
+POKEDEX_SOURCE_DDL = '''
+    CREATE TABLE IF NOT EXISTS pokedex_source (
+        digest VARCHAR(64) NOT NULL
+    )
+'''
+
+#: The tables of the database schema, as emitted by SQLAlchemy for
+#: `caught.database.schema`.  Indexes are created by `MIGRATIONS`.
+SCHEMA_DDL = [
+    '''
+    CREATE TABLE IF NOT EXISTS games (
+        "gameID" INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        version VARCHAR(255),
+        player_name VARCHAR(255),
+        dexsize INTEGER NOT NULL,
+        PRIMARY KEY ("gameID"),
+        UNIQUE (name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS pokemon (
+        dexno INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        PRIMARY KEY (dexno),
+        UNIQUE (name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS caught (
+        "gameID" INTEGER NOT NULL,
+        dexno INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        PRIMARY KEY ("gameID", dexno),
+        FOREIGN KEY("gameID") REFERENCES games ("gameID"),
+        FOREIGN KEY(dexno) REFERENCES pokemon (dexno)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS game_names (
+        "gameID" INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL CHECK (name = lower(name)),
+        FOREIGN KEY("gameID") REFERENCES games ("gameID"),
+        UNIQUE (name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS pokemon_names (
+        dexno INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL CHECK (name = lower(name)),
+        FOREIGN KEY(dexno) REFERENCES pokemon (dexno),
+        UNIQUE (name)
+    )
+    ''',
+    POKEDEX_SOURCE_DDL,
+]
+
+#: The explicit indexes in the schema, as a mapping from index names to
+#: ``(table, DDL)`` pairs
+INDEXES = {
+    'ix_pokemon_names_dexno': (
+        'pokemon_names',
+        'CREATE INDEX IF NOT EXISTS ix_pokemon_names_dexno'
+        ' ON pokemon_names (dexno, name)',
+    ),
+    'ix_game_names_gameID': (
+        'game_names',
+        'CREATE INDEX IF NOT EXISTS "ix_game_names_gameID"'
+        ' ON game_names ("gameID", name)',
+    ),
+    'ix_caught_status': (
+        'caught',
+        'CREATE INDEX IF NOT EXISTS ix_caught_status'
+        ' ON caught ("gameID", status, dexno)',
+    ),
+}
+
+#: The optional ``game_progress`` table, as emitted by SQLAlchemy for
+#: `caught.database.game_progress_tbl`
+PROGRESS_DDL = '''
+    CREATE TABLE game_progress (
+        "gameID" INTEGER NOT NULL,
+        caught INTEGER NOT NULL,
+        owned INTEGER NOT NULL,
+        PRIMARY KEY ("gameID")
+    )
+'''
+
+#: Triggers that keep ``game_progress`` in sync with ``caught`` and ``games``.
+#: Rows are added to ``game_progress`` with ``WHERE NOT EXISTS`` rather than
+#: ``INSERT OR IGNORE``, as SQLite lets the conflict handling of the statement
+#: firing a trigger override that of the statements inside it, making ``OR
+#: IGNORE`` fail when fired by an upsert.
+PROGRESS_TRIGGERS = {
+    name: ddl.format(CAUGHT=int(Status.CAUGHT), OWNED=int(Status.OWNED))
+    for name, ddl in {
+        'game_progress_caught_insert': '''
+            CREATE TRIGGER game_progress_caught_insert AFTER INSERT ON caught
+            BEGIN
+                INSERT INTO game_progress (gameID, caught, owned)
+                    SELECT NEW.gameID, 0, 0 WHERE NOT EXISTS (
+                        SELECT 1 FROM game_progress WHERE gameID = NEW.gameID
+                    );
+                UPDATE game_progress
+                    SET caught = caught + (NEW.status = {CAUGHT}),
+                        owned  = owned  + (NEW.status = {OWNED})
+                    WHERE gameID = NEW.gameID;
+            END
+        ''',
+        'game_progress_caught_update': '''
+            CREATE TRIGGER game_progress_caught_update
+            AFTER UPDATE OF gameID, status ON caught
+            BEGIN
+                UPDATE game_progress
+                    SET caught = caught - (OLD.status = {CAUGHT}),
+                        owned  = owned  - (OLD.status = {OWNED})
+                    WHERE gameID = OLD.gameID;
+                INSERT INTO game_progress (gameID, caught, owned)
+                    SELECT NEW.gameID, 0, 0 WHERE NOT EXISTS (
+                        SELECT 1 FROM game_progress WHERE gameID = NEW.gameID
+                    );
+                UPDATE game_progress
+                    SET caught = caught + (NEW.status = {CAUGHT}),
+                        owned  = owned  + (NEW.status = {OWNED})
+                    WHERE gameID = NEW.gameID;
+            END
+        ''',
+        'game_progress_caught_delete': '''
+            CREATE TRIGGER game_progress_caught_delete AFTER DELETE ON caught
+            BEGIN
+                UPDATE game_progress
+                    SET caught = caught - (OLD.status = {CAUGHT}),
+                        owned  = owned  - (OLD.status = {OWNED})
+                    WHERE gameID = OLD.gameID;
+            END
+        ''',
+        'game_progress_game_insert': '''
+            CREATE TRIGGER game_progress_game_insert AFTER INSERT ON games
+            BEGIN
+                INSERT INTO game_progress (gameID, caught, owned)
+                    SELECT NEW.gameID, 0, 0 WHERE NOT EXISTS (
+                        SELECT 1 FROM game_progress WHERE gameID = NEW.gameID
+                    );
+            END
+        ''',
+        'game_progress_game_delete': '''
+            CREATE TRIGGER game_progress_game_delete AFTER DELETE ON games
+            BEGIN
+                DELETE FROM game_progress WHERE gameID = OLD.gameID;
+            END
+        ''',
+    }.items()
+}
+
+#: A query returning whether the ``game_progress`` table exists
+PROGRESS_EXISTS_SQL = "SELECT count(*) FROM sqlite_master" \
+                      " WHERE type = 'table' AND name = 'game_progress'"
+
+#: The statement populating an empty ``game_progress`` table from ``caught``
+PROGRESS_REBUILD_SQL = '''
+    INSERT INTO game_progress (gameID, caught, owned)
+    SELECT games.gameID,
+           count(CASE WHEN caught.status = {CAUGHT} THEN 1 END),
+           count(CASE WHEN caught.status = {OWNED} THEN 1 END)
+    FROM games LEFT OUTER JOIN caught ON games.gameID = caught.gameID
+    GROUP BY games.gameID
+'''.format(CAUGHT=int(Status.CAUGHT), OWNED=int(Status.OWNED))
+
+#: The migrations for upgrading a database's schema, in order; applying
+#: ``MIGRATIONS[i]`` to a database at schema version ``i`` brings it up to
+#: version ``i+1``.  Each migration is a list of SQL statements that must be
+#: safe to run on a freshly-created database, or of ``(condition, statements)``
+#: pairs whose statements are only run if the SQL ``condition`` returns a
+#: nonzero value.
+MIGRATIONS = [
+    # 1: Covering indexes for looking up names by ID and caught Pokémon by
+    # status
+    [INDEXES[ix][1] for ix in (
+        'ix_pokemon_names_dexno', 'ix_game_names_gameID', 'ix_caught_status',
+    )],
+    # 2: The record of which compiled Pokédex index matches the database
+    [POKEDEX_SOURCE_DDL],
+    # 3: Replace the original progress counter triggers, which made upserts
+    # fail, and recount the progress from scratch
+    [(PROGRESS_EXISTS_SQL,
+      ['DROP TRIGGER IF EXISTS ' + trigger for trigger in PROGRESS_TRIGGERS]
+      + list(PROGRESS_TRIGGERS.values())
+      + ['DELETE FROM game_progress', PROGRESS_REBUILD_SQL])],
+]
+
+#: The current schema version, stored in the database's ``user_version``
+SCHEMA_VERSION = len(MIGRATIONS)
+
+#: The optional ``status_changes`` table, as emitted by SQLAlchemy for
+#: `caught.database.status_changes_tbl`.  ``AUTOINCREMENT`` keeps sequence
+#: numbers from being reused even if the latest changes are deleted.
+CHANGE_LOG_DDL = '''
+    CREATE TABLE status_changes (
+        seq INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        "gameID" INTEGER NOT NULL,
+        dexno INTEGER NOT NULL,
+        old_status INTEGER NOT NULL,
+        new_status INTEGER NOT NULL
+    )
+'''
+
+#: A query returning whether the ``status_changes`` table exists
+CHANGE_LOG_EXISTS_SQL = "SELECT count(*) FROM sqlite_master" \
+                        " WHERE type = 'table' AND name = 'status_changes'"
+
+#: Triggers that append a row to ``status_changes`` for every change to a
+#: status in ``caught``, in the same transaction as the change.  A Pokémon
+#: without a row in ``caught`` is uncaught.
+CHANGE_LOG_TRIGGERS = {
+    name: ddl.format(UNCAUGHT=int(Status.UNCAUGHT))
+    for name, ddl in {
+        'status_changes_insert': '''
+            CREATE TRIGGER status_changes_insert AFTER INSERT ON caught
+            BEGIN
+                INSERT INTO status_changes
+                        (gameID, dexno, old_status, new_status)
+                    VALUES (NEW.gameID, NEW.dexno, {UNCAUGHT}, NEW.status);
+            END
+        ''',
+        'status_changes_update': '''
+            CREATE TRIGGER status_changes_update
+            AFTER UPDATE OF status ON caught
+            WHEN OLD.status != NEW.status
+            BEGIN
+                INSERT INTO status_changes
+                        (gameID, dexno, old_status, new_status)
+                    VALUES (NEW.gameID, NEW.dexno, OLD.status, NEW.status);
+            END
+        ''',
+        'status_changes_delete': '''
+            CREATE TRIGGER status_changes_delete AFTER DELETE ON caught
+            BEGIN
+                INSERT INTO status_changes
+                        (gameID, dexno, old_status, new_status)
+                    VALUES (OLD.gameID, OLD.dexno, OLD.status, {UNCAUGHT});
+            END
+        ''',
+    }.items()
+}
+
+#: Maximum number of values to pass to a single SQL ``IN`` operator
+IN_CHUNK_SIZE = 500
+
+#: Maximum number of runs of consecutive dexnos to match in a single SQL
+#: statement
+RANGE_CHUNK_SIZE = 100
+
+#: Number of rows to fetch from the database at a time when iterating over
+#: Pokémon with the ``iter*`` methods
+FETCH_CHUNK_SIZE = 1000
+
+#: The names of a chunk of Pokémon are fetched with a single range query if
+#: the span of their dexnos is less than this many times the number of
+#: Pokémon, and by dexno otherwise, so that sparse results do not fetch the
+#: names of the Pokémon in between
+DENSE_NAMES_RATIO = 2
+
+#: Number of rows to write per ``executemany`` call when loading data in bulk
+#: (by `CaughtDB.create` and `CaughtDBBase.setStatusRows`)
+LOAD_CHUNK_SIZE = 10000
+
+#: Template for the temporary names given to Pokémon being renamed by
+#: `CaughtDBBase.update`, so that names can be swapped between Pokémon without
+#: violating the uniqueness constraint on ``pokemon.name``
+RENAME_PLACEHOLDER = u'\x00%d'
+
+#: Bounds used in place of an absent end of a range of dexnos
+MIN_DEXNO = -(1 << 63)
+MAX_DEXNO = (1 << 63) - 1
+
+#: Default number of seconds for a connection to wait for another
+#: connection's lock on the database to be released before giving up
+DEFAULT_BUSY_TIMEOUT = 5.0
+
+#: Number of further attempts made to begin or commit a write transaction
+#: after waiting out the busy timeout, and the initial delay (in seconds,
+#: doubled after each attempt) between them
+BUSY_RETRIES = 3
+BUSY_BACKOFF = 0.05
+
+#: The journal modes that a database can be switched to when opened (see
+#: `open_db`): SQLite's write-ahead log, which lets readers and a writer
+#: proceed at the same time, and its default rollback journal
+JOURNAL_MODES = ('wal', 'delete')
+
+#: The ways `CaughtDBBase.copyProgress` can combine one game's statuses with
+#: another's: keeping the better of the two statuses for each Pokémon,
+#: letting the copied statuses win, or replacing the destination's statuses
+#: outright
+COPY_MODES = ('merge', 'overwrite', 'replace')
+
+#: Maximum number of keys (IDs and lowercased names) in a database's cache of
+#: `Game` and `Pokemon` objects
+OBJECT_CACHE_SIZE = 4096
+
+#: Statistics on a backend's compiled-statement cache or a database's object
+#: cache, as returned by `CaughtDBBase.statementCacheInfo` and
+#: `CaughtDBBase.objectCacheInfo`
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+#: A summary of the changes made by `CaughtDBBase.update`: the number of
+#: Pokémon added, the number renamed, the number whose synonyms changed, and
+#: the number in the database that were absent from the new Pokédex (which
+#: are left untouched)
+PokedexChanges = namedtuple('PokedexChanges', 'added renamed resynonymed unlisted')
+
+#: An entry in the change log returned by `CaughtDBBase.changesSince`: the
+#: entry's sequence number, the gameID and dexno whose status changed, and
+#: the old & new `Status`
+StatusChange = namedtuple('StatusChange', 'seq gameID dexno old new')
+
+#: The available database backends, as a mapping from backend names to
+#: ``(module, class name)`` pairs
+BACKENDS = {
+    "sqlalchemy": ('caught.database', 'CaughtDB'),
+    "sqlite3":    ('caught.litedb', 'LiteCaughtDB'),
+}
+
+DEFAULT_BACKEND = 'sqlalchemy'
+
+#: URL schemes accepted by `open_db` and the backends they select
+URL_SCHEMES = {
+    "sqlite":  'sqlalchemy',
+    "sqlite3": 'sqlite3',
+}
+
+def open_db(dbfile, backend=None, **options):
+    """
+    Returns a `CaughtDB`-like object for the database at ``dbfile`` using the
+    named backend (one of the keys of `BACKENDS`).  ``dbfile`` may also be a
+    URL of the form ``sqlite:///path`` or ``sqlite3:///path``, in which case
+    the scheme selects the backend if ``backend`` is `None`.
+
+    The remaining keyword arguments are passed to the backend's constructor:
+
+    ``journal_mode``
+        If not `None`, switch the database to the given journal mode (one of
+        `JOURNAL_MODES`); the mode is stored in the database file and stays
+        in effect for later connections
+
+    ``busy_timeout``
+        The number of seconds to wait for a lock on the database (default:
+        `DEFAULT_BUSY_TIMEOUT`)
+    """
+    scheme, sep, path = dbfile.partition(':///')
+    if sep and scheme in URL_SCHEMES:
+        dbfile = path
+        if backend is None:
+            backend = URL_SCHEMES[scheme]
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    try:
+        module, clsname = BACKENDS[backend]
+    except KeyError:
+        raise ValueError('%s: unknown database backend' % (backend,))
+    return getattr(importlib.import_module(module), clsname)(dbfile, **options)
+
+
+class CaughtDBBase(object):
+    """
+    The methods of the `CaughtDB` API that are implemented in terms of the
+    backend-specific methods
+    """
+
+    def savepoint(self):
+        """
+        Returns a context manager that runs its block (which must be inside
+        the database's ``with`` block) within a SQL savepoint, so that if the
+        block raises an exception, only its changes are rolled back and the
+        enclosing transaction carries on.  Entering it returns the database.
+        """
+        return Savepoint(self)
+
+    def reading(self):
+        """
+        Returns a context manager that can be used in place of the database's
+        own ``with`` block by code that only reads from the database.  The
+        block runs in a read-only transaction, which sees a consistent
+        snapshot of the database and does not take the write lock, so (in WAL
+        mode) it neither waits for nor holds up writers.  Entering it returns
+        the database.
+        """
+        return ReadTransaction(self)
+
+    def retry_busy(self, func):  # internal function
+        """
+        Calls ``func`` (which begins or commits a write transaction) until it
+        does not fail with a "database is locked" error, up to `BUSY_RETRIES`
+        more times, sleeping between attempts.  Raises a
+        `DatabaseLockedError` if the last attempt also fails.
+        """
+        delay = BUSY_BACKOFF
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return func()
+            except Exception as e:
+                if not is_busy_error(e):
+                    raise
+                if attempt == BUSY_RETRIES:
+                    raise DatabaseLockedError(BUSY_RETRIES + 1)
+            # Jitter keeps competing writers from retrying in lockstep:
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+
+    def reset_session(self):  # internal function
+        """ Resets the per-connection state at the start of a transaction """
+        # Other processes may have changed the Pokédex since the last
+        # connection:
+        self.resolver = None
+        # Whether the progress counters are enabled; determined on first use
+        self.progress = None
+        # Whether the change log is enabled; likewise
+        self.changelog = None
+        # Connection-level PRAGMAs to restore once the transaction is over:
+        self.saved_pragmas = {}
+        # The number of savepoints currently open in the transaction:
+        self.savepoints = 0
+
+    def nameResolver(self):
+        """
+        Returns a `NameResolver` for the Pokédex in the database.  If the
+        Pokémon tables are known to match a Pokédex file whose compiled index
+        is in the cache, the index is memory-mapped & used directly;
+        otherwise, the resolver is built from the database.  The resolver is
+        loaded on first use and reused until the Pokédex is modified or a new
+        connection is opened.
+        """
+        if self.resolver is None:
+            digest = self.get_dex_digest()
+            if digest is not None:
+                self.resolver = open_index(digest)
+            if self.resolver is None:
+                self.resolver = NameResolver(self.allPokemon())
+        return self.resolver
+
+    def startProfiling(self, profiler=None):
+        """
+        Begins recording the SQL statements executed by the database with a
+        `QueryProfiler` (a new one if ``profiler`` is not given), which is
+        returned.  Recording continues across ``with`` blocks until
+        `stopProfiling` is called.  While profiling, the results of each
+        query are fetched in full as soon as it is executed, so that the time
+        taken to fetch them is included.
+        """
+        self.stopProfiling()
+        if profiler is None:
+            profiler = QueryProfiler()
+        profiler.db = self
+        self.profiler = profiler
+        self.start_profiling()
+        return profiler
+
+    def stopProfiling(self):
+        """
+        Stops recording SQL statements and returns the `QueryProfiler` that
+        was recording them, or `None` if profiling was not enabled
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            self.stop_profiling()
+            self.profiler = None
+        return profiler
+
+    def statementCacheInfo(self):
+        """
+        Returns a `CacheInfo` describing the use of the backend's
+        compiled-statement cache since the database was opened, or `None` if
+        the backend does not keep track
+        """
+        return None
+
+    def objectCacheInfo(self):
+        """
+        Returns a `CacheInfo` describing the use of the database's cache of
+        `Game` and `Pokemon` objects since the database was opened
+        """
+        return self.objects.info()
+
+    def check_data_version(self, version):  # internal function
+        """
+        Empties the object cache if SQLite's ``data_version`` for the
+        connection, read at the start of a transaction, shows that another
+        connection has changed the database since the last transaction
+        """
+        if version != self.data_version:
+            self.objects.clear()
+            self.data_version = version
+
+    def getPokemon(self, name):
+        """
+        Returns the `Pokemon` object for the Pokémon with the given name.
+        Raises a `NoSuchPokemonError` if there is no such Pokémon.
+        """
+        poke = self.objects.get(Pokemon, name.lower())
+        if poke is None:
+            poke = self.load_pokemon(self.pokemon_name_dexno(name))
+            self.objects.add(poke)
+        return poke
+
+    def getPokemonByDexno(self, dexno):
+        dexno = int(dexno)
+        poke = self.objects.get(Pokemon, dexno)
+        if poke is None:
+            poke = self.load_pokemon(dexno)
+            self.objects.add(poke)
+        return poke
+
+    def getGame(self, name):
+        """
+        Returns the `Game` object for the game with the given name.  Raises a
+        `NoSuchGameError` if there is no such game.
+        """
+        game = self.objects.get(Game, name.lower())
+        if game is None:
+            game = self.load_game(self.game_name_id(name))
+            self.objects.add(game)
+        return game
+
+    def getGameByID(self, gameID):
+        gameID = int(gameID)
+        game = self.objects.get(Game, gameID)
+        if game is None:
+            game = self.load_game(gameID)
+            self.objects.add(game)
+        return game
+
+    def allPokemon(self, maxno=None):
+        return list(self.iterAllPokemon(maxno))
+
+    def getPokemonRange(self, pokeA, pokeB, maxno=None):
+        return list(self.iterPokemonRange(pokeA, pokeB, maxno))
+
+    def allGames(self):
+        return list(self.iterAllGames())
+
+    def getStatusRange(self, game, start=None, end=None):  # inclusive range
+        return list(self.iterStatusRange(game, start, end))
+
+    def getByStatus(self, game, status, maxno=None):
+        return list(self.iterByStatus(game, status, maxno))
+
+    def iterByStatusExpr(self, expr):
+        """
+        Returns an iterator of the `Pokemon`, in dexno order, that satisfy the
+        parsed status expression ``expr`` (see `caught.statusexpr`), fetched
+        with a single query.  Only Pokémon within the dex of at least one of
+        the games in the expression are considered, so that negated atoms do
+        not match the entire Pokédex.
+        """
+        games = list(status_expr_games(expr))
+        if any(g == ALL_GAMES for g in games):
+            games = self.allGames()
+        maxno = max(g.dexsize for g in games) if games else 0
+        return self.iter_pokemon(self.status_expr_rows(expr, maxno))
+
+    def getByStatusExpr(self, expr):
+        return list(self.iterByStatusExpr(expr))
+
+    def getGameCount(self, game):
+        return self.getGameCounts([game])[int(game)]
+
+    def getStatusMatrix(self, games, dexnos=None):
+        """
+        Returns an iterator of ``(pokemon, statuses)`` pairs, where
+        ``statuses`` is a list of the `Status` of ``pokemon`` in each of
+        ``games`` in order, or `None` for each game whose ``dexsize`` is less
+        than the Pokémon's dexno.  All of the statuses are fetched with a
+        single query.
+
+        If ``dexnos`` is `None`, every Pokémon up to the largest ``dexsize`` of
+        ``games`` is returned in dexno order; otherwise, the Pokémon with the
+        given dexnos are returned in the order given.
+        """
+        games = [g if isinstance(g, Game) else self.getGameByID(g)
+                 for g in games]
+        if dexnos is None:
+            maxno = max(g.dexsize for g in games) if games else 0
+            for poke, statuses in self.fetch_pokemon(
+                self.status_matrix_rows(games, maxno=maxno)
+            ):
+                yield (poke, matrix_statuses(statuses))
+        else:
+            dexnos = [int(d) for d in dexnos]
+            if not dexnos:
+                return
+            matrix = {}
+            wanted = sorted(set(dexnos))
+            synonyms = self.get_pokemon_names_for(wanted)
+            for i in range(0, len(wanted), IN_CHUNK_SIZE):
+                for row in self.status_matrix_rows(
+                    games,
+                    dexnos=wanted[i:i+IN_CHUNK_SIZE],
+                ):
+                    matrix[row[0]] = matrix_row(row, synonyms)
+            for d in dexnos:
+                if d in matrix:
+                    yield matrix[d]
+
+    def fetch_pokemon(self, rows):  # internal function
+        """
+        Iterates over ``rows`` (a cursor over rows in dexno order, each
+        consisting of a dexno, a name, and zero or more other columns) in
+        chunks of `FETCH_CHUNK_SIZE` rows and yields a pair of a `Pokemon` and
+        a tuple of the other columns for each row.  The Pokémon's names are
+        fetched with one query per chunk.
+        """
+        while True:
+            chunk = rows.fetchmany(FETCH_CHUNK_SIZE)
+            if not chunk:
+                break
+            synonyms = self.get_pokemon_names_for([row[0] for row in chunk])
+            for row in chunk:
+                yield (
+                    Pokemon(row[0], row[1], synonyms[row[0]]),
+                    tuple(row[2:]),
+                )
+
+    def get_pokemon_names_for(self, dexnos):  # internal function
+        """
+        Returns a `dict` mapping each dexno in the sorted list ``dexnos`` to
+        the sorted list of its names, fetched with a single range query if
+        the dexnos are dense (see `DENSE_NAMES_RATIO`) or else with queries
+        for just the given dexnos
+        """
+        if not dexnos:
+            return defaultdict(list)
+        elif dexnos[-1] - dexnos[0] < DENSE_NAMES_RATIO * len(dexnos):
+            return self.get_pokemon_names_range(dexnos[0], dexnos[-1])
+        else:
+            return self.get_pokemon_names_in(dexnos)
+
+    def iter_pokemon(self, rows):  # internal function
+        """
+        Returns an iterator of `Pokemon` objects for a cursor of ``(dexno,
+        name)`` rows in dexno order, fetched as by `fetch_pokemon`
+        """
+        return (poke for poke, _ in self.fetch_pokemon(rows))
+
+    def status_range_bounds(self, game, start, end):  # internal function
+        """
+        Normalizes the arguments to `getStatusRange` into a `Game` and an
+        inclusive range of dexnos clipped to the game's ``dexsize``
+        """
+        if not isinstance(game, Game):
+            ### TODO: Rethink this:
+            game = self.getGameByID(game)
+        if start is None and end is None:
+            start, end = 1, game.dexsize
+        elif end is None:
+            start, end = 1, start
+        elif start is None:
+            ### TODO: Should this be an error instead?
+            start = 1
+        return (game, int(start), min(int(end), game.dexsize))
+
+    def update(self, pokedex):
+        """
+        Brings the Pokémon tables up to date with the TSV file ``pokedex``,
+        adding new Pokémon, renaming existing ones, and adding & removing
+        synonyms as needed.  The file is compared against the database in a
+        single pass, after which only the changes are written, in bulk.
+        Pokémon in the database but not in the file are left as they are.
+
+        Raises a `MalformedFileError` (before anything is written) if the file
+        cannot be parsed, if any dexno or (case-insensitive) name is used more
+        than once in it, or if it gives a Pokémon a name belonging to a
+        Pokémon not in the file.  Returns a `PokedexChanges`.
+        """
+        current = {}
+        owners = {}
+        for poke in self.iterAllPokemon():
+            current[poke.dexno] = poke
+            for name in poke.synonyms:
+                owners[name] = poke.dexno
+        seen_dexnos = set()
+        # Names in the file that currently belong to other Pokémon, as
+        # `(lineno, name, owner)` triples:
+        taken = []
+        new_pokemon, renames, added_names, removed_names = [], [], [], []
+        resynonymed = 0
+        for lineno, poke, names in read_pokedex(pokedex):
+            seen_dexnos.add(poke.dexno)
+            names = set(names)
+            old = current.get(poke.dexno)
+            if old is None:
+                new_pokemon.append((poke.dexno, poke.name))
+                oldnames = set()
+            else:
+                if old.name != poke.name:
+                    renames.append((poke.dexno, poke.name))
+                oldnames = set(old.synonyms)
+                if names - {poke.name.lower()} \
+                        != oldnames - {old.name.lower()}:
+                    resynonymed += 1
+                removed_names.extend(
+                    (poke.dexno, name) for name in oldnames - names
+                )
+            for name in names - oldnames:
+                owner = owners.get(name)
+                if owner is not None and owner != poke.dexno:
+                    taken.append((lineno, name, owner))
+                added_names.append((poke.dexno, name))
+        # A name may only move to a different Pokémon if the file also takes
+        # it away from its current one:
+        for lineno, name, owner in taken:
+            if owner not in seen_dexnos:
+                raise MalformedFileError(
+                    pokedex, lineno,
+                    '%s: name already used by Pokémon #%d' % (name, owner),
+                )
+        self.resolver = None
+        self.objects.discard(Pokemon, {
+            dexno for dexno, _ in renames + added_names + removed_names
+        })
+        self.write_pokedex_changes(
+            new_pokemon, renames, added_names, removed_names,
+        )
+        unlisted = len(set(current) - seen_dexnos)
+        # The database only matches the file if nothing was left out of it:
+        self.set_dex_digest(None if unlisted else load_pokedex(pokedex).digest)
+        return PokedexChanges(
+            added       = len(new_pokemon),
+            renamed     = len(renames),
+            resynonymed = resynonymed,
+            unlisted    = unlisted,
+        )
+
+    def setStatusRows(self, rows, keep_best=False):
+        """
+        Sets the statuses given by ``rows``, an iterable of ``(game, dexno,
+        status)`` triples, using ``executemany`` calls of up to
+        `LOAD_CHUNK_SIZE` rows.  If ``keep_best`` is true, a Pokémon's status
+        is only changed if the new one is better, as when merging with
+        `copyProgress`.
+        """
+        upserts, deletes = [], []
+        for game, dexno, status in rows:
+            status = check_status(status)
+            if status != int(Status.UNCAUGHT):
+                upserts.append((int(game), int(dexno), status))
+            elif not keep_best:
+                deletes.append((int(game), int(dexno)))
+            if len(upserts) + len(deletes) >= LOAD_CHUNK_SIZE:
+                self.write_status_rows(upserts, deletes, keep_best)
+                upserts, deletes = [], []
+        self.write_status_rows(upserts, deletes, keep_best)
+
+    def copyProgress(self, src, dst, mode='merge'):
+        """
+        Copies the statuses of the Pokémon in game ``src`` to game ``dst``,
+        skipping those beyond ``dst``'s dexsize, with a single ``INSERT ...
+        SELECT`` upsert.  ``mode`` is one of `COPY_MODES`: ``'merge'`` keeps
+        whichever of the two statuses is better for each Pokémon,
+        ``'overwrite'`` gives every Pokémon caught or owned in ``src`` the
+        same status in ``dst``, and ``'replace'`` also marks everything else
+        in ``dst`` uncaught.  Returns the number of statuses in ``dst`` that
+        were changed.
+        """
+        if mode not in COPY_MODES:
+            raise ValueError('%s: unknown copy mode' % (mode,))
+        if int(src) == int(dst):
+            raise ValueError('cannot copy a game onto itself')
+        changed = 0
+        if mode == 'replace':
+            changed += self.clear_progress(int(src), int(dst))
+        changed += self.upsert_progress([int(src)], int(dst), mode == 'merge')
+        return changed
+
+    def mergeGames(self, games, into, delete=False):
+        """
+        Merges the statuses of the Pokémon in each of ``games`` into game
+        ``into``, keeping the best status each Pokémon has in any of them and
+        skipping those beyond ``into``'s dexsize.  If ``delete`` is true, the
+        merged games (other than ``into``) are then deleted.  Returns the
+        number of statuses in ``into`` that were set or changed.
+        """
+        sources = sorted({int(g) for g in games} - {int(into)})
+        # Taking the best status is order-independent, so the games can be
+        # merged in chunks:
+        changed = sum(
+            self.upsert_progress(chunk, int(into), True)
+            for chunk in chunked(sources, IN_CHUNK_SIZE)
+        )
+        if delete:
+            self.deleteGames(sources)
+        return changed
+
+    def deleteGame(self, game):
+        self.deleteGames([game])
+
+    def deleteGames(self, games):
+        """
+        Deletes the given games along with their synonyms and statuses, using
+        one ``DELETE`` per table for every `IN_CHUNK_SIZE` games
+        """
+        gameIDs = sorted({int(g) for g in games})
+        for chunk in chunked(gameIDs, IN_CHUNK_SIZE):
+            self.delete_games(chunk)
+        self.objects.discard(Game, gameIDs)
+
+    def changesSince(self, seq=0, games=None):
+        """
+        Returns an iterator of the `StatusChange` entries in the change log
+        with sequence numbers greater than ``seq``, in order, optionally
+        restricted to those for the given games.  The entries are fetched
+        `FETCH_CHUNK_SIZE` at a time, so the cost is proportional to the
+        number of changes since ``seq`` rather than to the size of the
+        database.  Raises a `RuntimeError` if the change log is not enabled.
+        """
+        if not self.hasChangeLog():
+            raise RuntimeError('Change log is not enabled')
+        if games is not None:
+            games = sorted({int(g) for g in games})
+            if not games:
+                return iter(())
+        return self.iter_changes(self.change_rows(int(seq), games))
+
+    def iter_changes(self, rows):  # internal function
+        while True:
+            chunk = rows.fetchmany(FETCH_CHUNK_SIZE)
+            if not chunk:
+                break
+            for seq, gameID, dexno, old, new in chunk:
+                yield StatusChange(
+                    seq, gameID, dexno,
+                    Status.fromValue(old), Status.fromValue(new),
+                )
+
+    def markOwned(self, game, poke):  # * → owned
+        self.setStatus(game, poke, Status.OWNED)
+
+    def markOwnedMany(self, game, pokemon):  # * → owned
+        self.setStatusMany(game, pokemon, Status.OWNED)
+
+    def markUncaught(self, game, poke):  # * → uncaught
+        self.setStatus(game, poke, Status.UNCAUGHT)
+
+    def markUncaughtMany(self, game, pokemon):  # * → uncaught
+        self.setStatusMany(game, pokemon, Status.UNCAUGHT)
+
+
+class ReadTransaction(object):
+    """ A read-only transaction; see `CaughtDBBase.reading` """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.read_only = True
+        try:
+            return self.db.__enter__()
+        except BaseException:
+            self.db.read_only = False
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self.db.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.db.read_only = False
+
+
+class Savepoint(object):
+    """ A savepoint within a database's transaction; see `CaughtDBBase.savepoint` """
+
+    #: Used to give each savepoint a unique name
+    counter = 0
+
+    def __init__(self, db):
+        self.db = db
+        Savepoint.counter += 1
+        self.name = 'sp_%d' % (Savepoint.counter,)
+
+    def reading(self):
+        # A read inside a savepoint simply runs in the enclosing transaction.
+        return self
+
+    def __enter__(self):
+        self.db.begin_savepoint(self.name)
+        self.db.savepoints += 1
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.db.savepoints -= 1
+        if exc_type is None:
+            self.db.release_savepoint(self.name)
+        else:
+            self.db.rollback_savepoint(self.name)
+            # The rolled-back changes may have included the Pokédex, the
+            # progress counters, or the change log:
+            self.db.resolver = None
+            self.db.progress = None
+            self.db.changelog = None
+            self.db.objects.clear()
+        return False
+
+
+class IdentityMap(object):
+    """
+    A bounded least-recently-used cache of the `Game` and `Pokemon` objects
+    looked up through a database, each stored under its ID (gameID or dexno)
+    and every one of its names in lowercase, that counts how many lookups
+    were hits and misses
+    """
+
+    def __init__(self, maxsize=OBJECT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cls, key):
+        """
+        Returns the object of type ``cls`` with the ID or lowercased name
+        ``key``, or `None` if it is not cached
+        """
+        try:
+            obj = self.data.pop((cls, key))
+        except KeyError:
+            self.misses += 1
+            return None
+        self.data[(cls, key)] = obj
+        self.hits += 1
+        return obj
+
+    def add(self, obj):
+        cls = type(obj)
+        keys = [object_id(obj), obj.name.lower()]
+        keys.extend(syn.lower() for syn in obj.synonyms)
+        for key in keys:
+            self.data.pop((cls, key), None)
+            self.data[(cls, key)] = obj
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def discard(self, cls, ids=None):
+        """
+        Removes the objects of type ``cls`` with the given IDs (default: all
+        of them) from the cache
+        """
+        if ids is not None:
+            ids = set(ids)
+        for (keycls, key), obj in list(self.data.items()):
+            if keycls is cls and (ids is None or object_id(obj) in ids):
+                del self.data[(keycls, key)]
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data))
+
+
+def migration_statements(migrations, scalar):
+    """
+    Returns an iterator over the SQL statements of the given `MIGRATIONS`
+    entries, using ``scalar`` to run the queries of any conditional steps.
+    The iterator is lazy, so conditions see the effects of the statements
+    before them.
+    """
+    for migration in migrations:
+        for step in migration:
+            if isinstance(step, tuple):
+                condition, statements = step
+                if scalar(condition):
+                    for sql in statements:
+                        yield sql
+            else:
+                yield step
+
+
+def chunked(iterable, size):
+    """ Yields successive lists of up to ``size`` items from ``iterable`` """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def object_id(obj):
+    """ Returns the gameID of a `Game` or the dexno of a `Pokemon` """
+    return obj.gameID if isinstance(obj, Game) else obj.dexno
+
+def is_busy_error(e):
+    """
+    Returns true if the exception ``e`` (from either backend's driver) reports
+    that the database was locked by another connection
+    """
+    msg = str(e)
+    return 'database is locked' in msg or 'database is busy' in msg
+
+def check_status(status):
+    """
+    Converts ``status`` to an `int`, raising a `ValueError` if it is not the
+    value of a `Status`
+    """
+    status = int(status)
+    if status not in tuple(int(s) for s in Status.STATUSES):
+        raise ValueError('%d: not a valid status' % (status,))
+    return status
+
+def dexno_ranges(pokemon):
+    """
+    Returns a sorted list of the maximal inclusive ``(start, end)`` runs of
+    consecutive dexnos among ``pokemon`` (an iterable of `Pokemon` objects
+    and/or dexnos)
+    """
+    ranges = []
+    for dexno in sorted(set(int(p) for p in pokemon)):
+        if ranges and ranges[-1][1] + 1 == dexno:
+            ranges[-1][1] = dexno
+        else:
+            ranges.append([dexno, dexno])
+    return [tuple(r) for r in ranges]
+
+def matrix_row(row, synonyms):
+    """
+    Converts a row returned by a backend's ``status_matrix_rows`` into a
+    ``(pokemon, statuses)`` pair
+    """
+    dexno, name = row[0], row[1]
+    return (Pokemon(dexno, name, synonyms[dexno]), matrix_statuses(row[2:]))
+
+def matrix_statuses(values):
+    """
+    Converts the status values returned by a backend's ``status_matrix_rows``
+    into a list of `Status` objects, leaving `None` values as-is
+    """
+    return [None if s is None else Status.fromValue(s) for s in values]
+
+def group_names(rows):
+    """
+    Groups an iterable of ``(ID, name)`` pairs into a `defaultdict` mapping
+    each ID to a list of its names in the order they were encountered
+    """
+    names = defaultdict(list)
+    for key, name in rows:
+        names[key].append(name)
+    return names
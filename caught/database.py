@@ -1,7 +1,25 @@
 # -*- coding: utf-8 -*-
-from   collections import namedtuple
-import json
+from   collections import OrderedDict
+from   timeit import default_timer
 import sqlalchemy as S
+from   sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from   .base import (  # noqa: F401
+    CHANGE_LOG_EXISTS_SQL, CHANGE_LOG_TRIGGERS, DEFAULT_BUSY_TIMEOUT,
+    IN_CHUNK_SIZE, JOURNAL_MODES, LOAD_CHUNK_SIZE, MAX_DEXNO, MIGRATIONS,
+    MIN_DEXNO, PROGRESS_EXISTS_SQL, PROGRESS_TRIGGERS, RANGE_CHUNK_SIZE,
+    RENAME_PLACEHOLDER, SCHEMA_VERSION, CacheInfo, CaughtDBBase, IdentityMap,
+    check_status, chunked, dexno_ranges, group_names, load_pokedex,
+    migration_statements,
+)
+from   .models import (  # noqa: F401
+    CaughtDBError, DatabaseLockedError, DuplicateNameError, Game,
+    MalformedFileError, NameResolver, NoSuchGameError, NoSuchPokemonError,
+    Pokemon, SchemaVersionError, Status, check_pokedex,
+)
+from   .statusexpr import ALL_GAMES, And, Not, Or, StatusIn
+
+#: Number of compiled statements to keep in each engine's cache
+STATEMENT_CACHE_SIZE = 256
 
 schema = S.MetaData()
 
@@ -46,53 +64,544 @@ caught_tbl = S.Table('caught', schema,
     S.Column('status', S.Integer, nullable=False),
 )
 
-class CaughtDB(object):
-    def __init__(self, dbpath):
-        self.engine = S.create_engine(S.engine.url.URL(
-            drivername = 'sqlite',
-            database   = dbpath,
-        ))
-        schema.create_all(self.engine)
+pokedex_source_tbl = S.Table('pokedex_source', schema,
+    S.Column('digest', S.Unicode(64), nullable=False),
+)
+
+# Covering indexes for looking up names by ID and caught Pokémon by status:
+S.Index('ix_pokemon_names_dexno', pokemon_names_tbl.c.dexno, pokemon_names_tbl.c.name)
+S.Index('ix_game_names_gameID', game_names_tbl.c.gameID, game_names_tbl.c.name)
+S.Index('ix_caught_status', caught_tbl.c.gameID, caught_tbl.c.status, caught_tbl.c.dexno)
+
+# The optional per-game progress counters and change log are kept out of
+# `schema` so that they are only created when explicitly enabled.
+progress_schema = S.MetaData()
+
+game_progress_tbl = S.Table('game_progress', progress_schema,
+    S.Column('gameID', S.Integer, primary_key=True, nullable=False),
+    S.Column('caught', S.Integer, nullable=False),
+    S.Column('owned', S.Integer, nullable=False),
+)
+
+status_changes_tbl = S.Table('status_changes', progress_schema,
+    S.Column('seq', S.Integer, primary_key=True),
+    S.Column('gameID', S.Integer, nullable=False),
+    S.Column('dexno', S.Integer, nullable=False),
+    S.Column('old_status', S.Integer, nullable=False),
+    S.Column('new_status', S.Integer, nullable=False),
+    sqlite_autoincrement=True,
+)
+
+# Prebuilt statements for the queries that are run once per Pokémon or game.
+# Their parameters are supplied as `bindparam`s at execution time, so each one
+# is only compiled once per engine and is afterwards fetched from the engine's
+# `StatementCache`.
+
+name_dexno_stmt = S.select([pokemon_names_tbl.c.dexno])\
+                   .where(pokemon_names_tbl.c.name == S.bindparam('name'))
+
+pokemon_name_stmt = S.select([pokemon_tbl.c.name])\
+                     .where(pokemon_tbl.c.dexno == S.bindparam('dexno'))
+
+pokemon_range_stmt = S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name])\
+                      .where(pokemon_tbl.c.dexno.between(
+                          S.bindparam('start'),
+                          S.bindparam('end'),
+                      )).order_by(S.asc(pokemon_tbl.c.dexno))
+
+max_dexno_stmt = S.select([pokemon_tbl.c.dexno])\
+                  .order_by(S.desc(pokemon_tbl.c.dexno))\
+                  .limit(1)
+
+pokemon_names_stmt = S.select([pokemon_names_tbl.c.name])\
+                      .where(pokemon_names_tbl.c.dexno == S.bindparam('dexno'))\
+                      .order_by(S.asc(pokemon_names_tbl.c.name))
+
+pokemon_names_range_stmt = S.select([
+                                pokemon_names_tbl.c.dexno,
+                                pokemon_names_tbl.c.name,
+                            ]).where(pokemon_names_tbl.c.dexno.between(
+                                S.bindparam('start'),
+                                S.bindparam('end'),
+                            )).order_by(S.asc(pokemon_names_tbl.c.dexno),
+                                        S.asc(pokemon_names_tbl.c.name))
+
+pokemon_names_in_stmt = S.select([
+                             pokemon_names_tbl.c.dexno,
+                             pokemon_names_tbl.c.name,
+                         ]).where(pokemon_names_tbl.c.dexno.in_(
+                             S.bindparam('dexnos', expanding=True),
+                         )).order_by(S.asc(pokemon_names_tbl.c.dexno),
+                                     S.asc(pokemon_names_tbl.c.name))
+
+count_game_name_stmt = S.select([S.func.count()])\
+                        .select_from(game_names_tbl)\
+                        .where(game_names_tbl.c.name == S.bindparam('name'))
+
+game_name_id_stmt = S.select([game_names_tbl.c.gameID])\
+                     .where(game_names_tbl.c.name == S.bindparam('name'))
+
+game_stmt = S.select([games_tbl])\
+             .where(games_tbl.c.gameID == S.bindparam('gameID'))
+
+all_games_stmt = S.select([games_tbl]).order_by(S.asc(games_tbl.c.gameID))
+
+all_game_ids_stmt = S.select([games_tbl.c.gameID])
+
+game_names_stmt = S.select([game_names_tbl.c.name])\
+                   .where(game_names_tbl.c.gameID == S.bindparam('gameID'))\
+                   .order_by(S.asc(game_names_tbl.c.name))
+
+all_game_names_stmt = S.select([game_names_tbl.c.gameID, game_names_tbl.c.name])\
+                       .order_by(S.asc(game_names_tbl.c.gameID),
+                                 S.asc(game_names_tbl.c.name))
+
+delete_games_stmts = [
+    tbl.delete().where(tbl.c.gameID.in_(S.bindparam('games', expanding=True)))
+    for tbl in (caught_tbl, game_names_tbl, games_tbl)
+]
+
+progress_stmt = S.select([
+                    game_progress_tbl.c.gameID,
+                    game_progress_tbl.c.caught,
+                    game_progress_tbl.c.owned,
+                ])
+
+progress_in_stmt = progress_stmt.where(
+    game_progress_tbl.c.gameID.in_(S.bindparam('games', expanding=True))
+)
+
+changes_stmt = S.select([
+                   status_changes_tbl.c.seq,
+                   status_changes_tbl.c.gameID,
+                   status_changes_tbl.c.dexno,
+                   status_changes_tbl.c.old_status,
+                   status_changes_tbl.c.new_status,
+               ]).where(status_changes_tbl.c.seq > S.bindparam('seq'))\
+                 .order_by(S.asc(status_changes_tbl.c.seq))
+
+changes_in_stmt = changes_stmt.where(
+    status_changes_tbl.c.gameID.in_(S.bindparam('games', expanding=True))
+)
+
+count_caught_stmt = S.select([
+                        caught_tbl.c.gameID,
+                        caught_tbl.c.status,
+                        S.func.count(),
+                    ]).group_by(caught_tbl.c.gameID, caught_tbl.c.status)
+
+count_caught_in_stmt = count_caught_stmt.where(
+    caught_tbl.c.gameID.in_(S.bindparam('games', expanding=True))
+)
+
+status_stmt = S.select([caught_tbl.c.status])\
+               .where(caught_tbl.c.gameID == S.bindparam('gameID'))\
+               .where(caught_tbl.c.dexno  == S.bindparam('dexno'))
+
+game_caught = S.select([caught_tbl])\
+               .where(caught_tbl.c.gameID == S.bindparam('gameID'))\
+               .alias('game_caught')
+
+status_range_stmt = S.select([
+                        pokemon_tbl.c.dexno,
+                        pokemon_tbl.c.name,
+                        S.func.IFNULL(game_caught.c.status, int(Status.UNCAUGHT)),
+                    ]).select_from(pokemon_tbl.outerjoin(game_caught))\
+                      .where(pokemon_tbl.c.dexno.between(
+                          S.bindparam('start'),
+                          S.bindparam('end'),
+                      )).order_by(S.asc(pokemon_tbl.c.dexno))
+
+by_status_stmt = S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name])\
+                  .select_from(pokemon_tbl.join(game_caught))\
+                  .where(game_caught.c.status == S.bindparam('status'))\
+                  .where(pokemon_tbl.c.dexno <= S.bindparam('maxno'))\
+                  .order_by(S.asc(pokemon_tbl.c.dexno))
+
+uncaught_stmt = S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name])\
+                 .select_from(pokemon_tbl.outerjoin(game_caught))\
+                 .where(game_caught.c.status.is_(None))\
+                 .where(pokemon_tbl.c.dexno <= S.bindparam('maxno'))\
+                 .order_by(S.asc(pokemon_tbl.c.dexno))
+
+delete_pokemon_name_stmt = pokemon_names_tbl.delete()\
+    .where(pokemon_names_tbl.c.dexno == S.bindparam('dexno'))\
+    .where(pokemon_names_tbl.c.name  == S.bindparam('name'))
+
+delete_status_stmt = caught_tbl.delete()\
+                      .where(caught_tbl.c.gameID == S.bindparam('gameID'))\
+                      .where(caught_tbl.c.dexno  == S.bindparam('dexno'))
+
+upsert_status_stmt = sqlite_insert(caught_tbl)
+upsert_status_stmt = upsert_status_stmt.on_conflict_do_update(
+    index_elements = [caught_tbl.c.gameID, caught_tbl.c.dexno],
+    set_           = {"status": upsert_status_stmt.excluded.status},
+)
+
+merge_status_stmt = sqlite_insert(caught_tbl)
+merge_status_stmt = merge_status_stmt.on_conflict_do_update(
+    index_elements = [caught_tbl.c.gameID, caught_tbl.c.dexno],
+    set_           = {"status": merge_status_stmt.excluded.status},
+    where          = merge_status_stmt.excluded.status > caught_tbl.c.status,
+)
+
+insert_status_stmt = sqlite_insert(caught_tbl).on_conflict_do_nothing()
+
+caught_rows_stmt = S.select([
+                       caught_tbl.c.gameID,
+                       caught_tbl.c.dexno,
+                       caught_tbl.c.status,
+                   ]).order_by(S.asc(caught_tbl.c.gameID),
+                               S.asc(caught_tbl.c.dexno))
+
+caught_rows_in_stmt = caught_rows_stmt.where(
+    caught_tbl.c.gameID.in_(S.bindparam('games', expanding=True))
+)
+
+# The names of the parameters in the WHERE clause of an UPDATE may not be the
+# names of any of the table's columns.
+release_stmt = caught_tbl.update().values(status=int(Status.CAUGHT))\
+                .where(caught_tbl.c.gameID == S.bindparam('game'))\
+                .where(caught_tbl.c.dexno  == S.bindparam('poke'))\
+                .where(caught_tbl.c.status == int(Status.OWNED))
+
+rename_pokemon_stmt = pokemon_tbl.update()\
+                       .values(name=S.bindparam('newname'))\
+                       .where(pokemon_tbl.c.dexno == S.bindparam('poke'))
+
+
+class StatementCache(object):
+    """
+    A bounded least-recently-used mapping for use as a SQLAlchemy engine's
+    ``compiled_cache`` that counts how many lookups were hits and misses
+    """
+
+    def __init__(self, maxsize=STATEMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data))
+
+
+class ProfiledConnection(object):
+    """
+    A wrapper around a SQLAlchemy `~sqlalchemy.engine.Connection` that
+    records the statements executed through its `execute` and
+    `exec_driver_sql` methods with a `QueryProfiler`.  Each query's results
+    are frozen (fetched in full) as part of the timed execution, as in
+    `caught.profiling.ProfiledConnection`.
+    """
+
+    def __init__(self, conn, profiler):
+        self.conn = conn
+        self.profiler = profiler
+
+    def execute(self, *args, **kwargs):
+        return self.timed(self.conn.execute, *args, **kwargs)
+
+    def exec_driver_sql(self, *args, **kwargs):
+        return self.timed(self.conn.exec_driver_sql, *args, **kwargs)
+
+    def timed(self, method, *args, **kwargs):  # internal function
+        start = default_timer()
+        result = method(*args, **kwargs)
+        statement = result.context.statement
+        if result.returns_rows:
+            frozen = result.freeze()
+            qty = len(frozen.data)
+            result = frozen()
+        else:
+            qty = result.rowcount
+        self.profiler.record(statement, default_timer() - start, qty)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class CaughtDB(CaughtDBBase):
+    def __init__(self, dbpath, journal_mode=None,
+                 busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        if journal_mode is not None and journal_mode not in JOURNAL_MODES:
+            raise ValueError('%s: unsupported journal mode' % (journal_mode,))
+        self.read_only = False
+        self.profiler = None
+        self.conn = None
+        self.statement_cache = StatementCache()
+        self.objects = IdentityMap()
+        self.data_version = None
+        engine = S.create_engine(
+            S.engine.URL.create('sqlite', database=dbpath),
+            connect_args = {"timeout": busy_timeout},
+        )
+
+        # pysqlite only begins a transaction before the first DML statement,
+        # and always with a plain BEGIN, so its transaction handling is turned
+        # off and transactions are begun explicitly instead:
+        @S.event.listens_for(engine, 'connect')
+        def connect(dbapi_conn, _):
+            dbapi_conn.isolation_level = None
+
+        @S.event.listens_for(engine, 'begin')
+        def begin(conn):
+            self.begin_transaction(conn)
+
+        self.engine = engine.execution_options(
+            compiled_cache=self.statement_cache,
+        )
+        with self.engine.connect() as conn:
+            if journal_mode is not None:
+                self.retry_busy(lambda: conn.execute(
+                    'PRAGMA journal_mode = %s' % (journal_mode,)
+                ).scalar())
+            version = conn.execute('PRAGMA user_version').scalar()
+        # Databases stamped with the current schema version are known to
+        # already have all of the tables & indexes, so checking for them can
+        # be skipped:
+        if version != SCHEMA_VERSION:
+            schema.create_all(self.engine)
+            self.migrate()
+
+    def migrate(self):
+        """
+        Upgrades the database's schema to `SCHEMA_VERSION` by applying any
+        pending `MIGRATIONS` in a single transaction, and returns the schema
+        version the database was at beforehand.  Raises a `SchemaVersionError`
+        if the database is from a newer version of this program.
+        """
+        with self.engine.begin() as conn:
+            version = conn.execute('PRAGMA user_version').scalar()
+            if version > SCHEMA_VERSION:
+                raise SchemaVersionError(version, SCHEMA_VERSION)
+            for sql in migration_statements(
+                MIGRATIONS[version:], lambda q: conn.execute(q).scalar(),
+            ):
+                conn.execute(sql)
+            if version < SCHEMA_VERSION:
+                conn.execute('PRAGMA user_version = %d' % (SCHEMA_VERSION,))
+        return version
+
+    def close(self):
+        self.engine.dispose()
+
+    def start_profiling(self):  # internal function
+        if self.conn is not None and not self.conn.closed:
+            self.conn = ProfiledConnection(self.conn, self.profiler)
+
+    def stop_profiling(self):  # internal function
+        if isinstance(self.conn, ProfiledConnection):
+            self.conn = self.conn.conn
+
+    def profiled(self, conn):  # internal function
+        """
+        Returns ``conn`` wrapped in a `ProfiledConnection` if profiling is
+        enabled, or else ``conn`` itself
+        """
+        if self.profiler is None:
+            return conn
+        return ProfiledConnection(conn, self.profiler)
+
+    def statementCacheInfo(self):
+        return self.statement_cache.info()
+
+    def commit(self):
+        """
+        Commits the changes made so far in the current ``with`` block and
+        begins a new transaction
+        """
+        self.commit_transaction()
+        self.trans = self.conn.begin()
+
+    def begin_transaction(self, conn):  # internal function
+        """ Begins a transaction on ``conn``; called by the engine """
+        conn = self.profiled(conn)
+        if self.read_only:
+            conn.exec_driver_sql('BEGIN')
+        else:
+            # Taking the write lock up front means that a writer never has to
+            # upgrade a read lock mid-transaction, which fails immediately
+            # (without waiting) if another connection is also writing.
+            self.retry_busy(lambda: conn.exec_driver_sql('BEGIN IMMEDIATE'))
+        self.begin_changes = conn.connection.total_changes
+        self.check_data_version(
+            conn.exec_driver_sql('PRAGMA data_version').scalar()
+        )
+
+    def commit_transaction(self):  # internal function
+        # With a rollback journal, committing waits for readers to finish, and
+        # the transaction is still open if that times out; committing through
+        # the driver first lets that be retried, after which SQLAlchemy's own
+        # commit has nothing left to do.
+        self.retry_busy(self.conn.connection.commit)
+        self.trans.commit()
+
+    def begin_savepoint(self, name):  # internal function
+        self.conn.execute('SAVEPOINT %s' % (name,))
+
+    def release_savepoint(self, name):  # internal function
+        self.conn.execute('RELEASE SAVEPOINT %s' % (name,))
+
+    def rollback_savepoint(self, name):  # internal function
+        self.conn.execute('ROLLBACK TO SAVEPOINT %s' % (name,))
+        self.conn.execute('RELEASE SAVEPOINT %s' % (name,))
 
     def __enter__(self):
-        self.conn = self.engine.connect()
+        self.reset_session()
+        # Each ``with`` block gets a new connection, whose data_version cannot
+        # be compared with that of the last one:
+        self.data_version = None
+        self.conn = self.profiled(self.engine.connect())
         self.trans = self.conn.begin()
+        if self.read_only:
+            self.saved_pragmas.setdefault('query_only', 0)
+            self.conn.execute('PRAGMA query_only = ON')
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         if exc_type is None:
-            self.trans.commit()
+            self.commit_transaction()
         else:
             self.trans.rollback()
+            self.objects.clear()
+        for pragma, value in self.saved_pragmas.items():
+            self.conn.execute('PRAGMA %s = %s' % (pragma, value))
         self.conn.close()
         return False
 
     def create(self, pokedex=None):
+        """
+        Populates the Pokémon tables from the TSV file ``pokedex``.  The
+        file's compiled index (see `caught.dexindex`) is loaded from the cache
+        or else compiled, validating the whole file, before anything is
+        written to the database, after which the index's entries are streamed
+        into the database in chunks of `LOAD_CHUNK_SIZE`.
+        """
         #schema.create_all(engine)
-        if pokedex is not None:
-            for poke in Pokemon.fromTSVFile(pokedex):
-                self.conn.execute(
-                    pokemon_tbl.insert().values(dexno=poke.dexno,name=poke.name)
-                )
-                self.conn.execute(pokemon_names_tbl.insert(), [{
-                    "dexno": poke.dexno,
-                    "name": name.lower(),
-                } for name in (str(poke.dexno), poke.name) + poke.synonyms])
+        if pokedex is None:
+            return
+        self.resolver = None
+        self.objects.discard(Pokemon)
+        dex = load_pokedex(pokedex)
+        if not self.savepoints \
+                and self.conn.connection.total_changes == self.begin_changes:
+            # SQLite only lets the synchronous level be changed outside of a
+            # transaction, so this can only be relaxed if nothing has been
+            # written yet (in which case the empty transaction can be
+            # restarted) and no savepoint (which the restart would release)
+            # is open; it is restored when the transaction ends.
+            self.commit_transaction()
+            self.saved_pragmas.setdefault(
+                'synchronous',
+                self.conn.execute('PRAGMA synchronous').scalar(),
+            )
+            self.conn.execute('PRAGMA synchronous = OFF')
+            self.trans = self.conn.begin()
+        # Indexes are rebuilt once at the end of the load rather than being
+        # updated on every insert:
+        indexes = [ix for tbl in (pokemon_tbl, pokemon_names_tbl)
+                      for ix in tbl.indexes]
+        for ix in indexes:
+            ix.drop(self.conn, checkfirst=True)
+        for rows in chunked(dex.pokemonRows(), LOAD_CHUNK_SIZE):
+            self.conn.execute(pokemon_tbl.insert(), [
+                {"dexno": dexno, "name": name} for dexno, name in rows
+            ])
+        for rows in chunked(dex.nameRows(), LOAD_CHUNK_SIZE):
+            self.conn.execute(pokemon_names_tbl.insert(), [
+                {"dexno": dexno, "name": name} for dexno, name in rows
+            ])
+        for ix in indexes:
+            ix.create(self.conn)
+        self.set_dex_digest(dex.digest)
+
+    def get_dex_digest(self):  # internal function
+        """
+        Returns the digest of the Pokédex file that the Pokémon tables match,
+        or `None` if not known
+        """
+        return self.conn.execute(
+            S.select([pokedex_source_tbl.c.digest]).limit(1)
+        ).scalar()
+
+    def set_dex_digest(self, digest):  # internal function
+        self.conn.execute(pokedex_source_tbl.delete())
+        if digest is not None:
+            self.conn.execute(pokedex_source_tbl.insert(), {"digest": digest})
+
+    def write_pokedex_changes(self, new_pokemon, renames, added_names,
+                              removed_names):  # internal function
+        """
+        Applies the changes to the Pokémon tables computed by `update`: the
+        ``(dexno, name)`` pairs in ``new_pokemon`` are inserted into
+        ``pokemon``, those in ``renames`` are updated, and those in
+        ``added_names`` and ``removed_names`` are inserted into & deleted from
+        ``pokemon_names``
+        """
+        if removed_names:
+            self.conn.execute(delete_pokemon_name_stmt, [
+                {"dexno": d, "name": n} for d, n in removed_names
+            ])
+        if renames:
+            self.conn.execute(rename_pokemon_stmt, [
+                {"poke": d, "newname": RENAME_PLACEHOLDER % d}
+                for d, _ in renames
+            ])
+            self.conn.execute(rename_pokemon_stmt, [
+                {"poke": d, "newname": n} for d, n in renames
+            ])
+        if new_pokemon:
+            self.conn.execute(pokemon_tbl.insert(), [
+                {"dexno": d, "name": n} for d, n in new_pokemon
+            ])
+        if added_names:
+            self.conn.execute(pokemon_names_tbl.insert(), [
+                {"dexno": d, "name": n} for d, n in added_names
+            ])
 
     def newGame(self, game, ignore_dups=False):
         # `game.gameID` is ignored.
         r = self.conn.execute(
-            S.select([S.func.count()]).select_from(game_names_tbl)
-             .where(game_names_tbl.c.name == game.name.lower())
+            count_game_name_stmt, {"name": game.name.lower()}
         ).scalar()
         if r > 0:
             raise DuplicateNameError('Game', game.name)
-        gameID = self.conn.execute(games_tbl.insert().values(
-            name        = game.name,
-            version     = game.version,
-            player_name = game.player_name,
-            dexsize     = game.dexsize,
-        )).inserted_primary_key[0]
+        gameID = self.conn.execute(games_tbl.insert(), {
+            "name":        game.name,
+            "version":     game.version,
+            "player_name": game.player_name,
+            "dexsize":     game.dexsize,
+        }).inserted_primary_key[0]
         usedSynonyms = set()
         for syn in [game.name] + list(game.synonyms):
             syn = syn.lower()
@@ -100,7 +609,7 @@ class CaughtDB(object):
                 continue
             try:
                 self.conn.execute(
-                    game_names_tbl.insert().values(gameID=gameID, name=syn)
+                    game_names_tbl.insert(), {"gameID": gameID, "name": syn}
                 )
             except S.exc.DBAPIError:
                 if not ignore_dups:
@@ -111,98 +620,59 @@ class CaughtDB(object):
         return Game(gameID, game.name, game.version, game.player_name,
                     game.dexsize, tuple(sorted(usedSynonyms)))
 
-    def deleteGame(self, game):
-        self.conn.execute(
-            caught_tbl.delete().where(caught_tbl.c.gameID == int(game))
-        )
-        self.conn.execute(
-            game_names_tbl.delete().where(game_names_tbl.c.gameID == int(game))
-        )
-        self.conn.execute(
-            games_tbl.delete().where(games_tbl.c.gameID == int(game))
-        )
+    def delete_games(self, gameIDs):  # internal function
+        for stmt in delete_games_stmts:
+            self.conn.execute(stmt, {"games": gameIDs})
 
-    def getPokemon(self, name):
-        """
-        Returns the `Pokemon` object for the Pokémon with the given name.
-        Raises a `NoSuchPokemonError` if there is no such Pokémon.
-        """
-        r = self.conn.execute(
-            S.select([pokemon_names_tbl.c.dexno])
-             .where(pokemon_names_tbl.c.name == name.lower())
-        )
+    def pokemon_name_dexno(self, name):  # internal function
+        r = self.conn.execute(name_dexno_stmt, {"name": name.lower()})
         try:
             dexno, = r.fetchone()
         except TypeError:
             raise NoSuchPokemonError(name)
-        return self.getPokemonByDexno(dexno)
+        return dexno
 
-    def getPokemonByDexno(self, dexno):
-        dexno = int(dexno)
-        r = self.conn.execute(
-            S.select([pokemon_tbl.c.name]).where(pokemon_tbl.c.dexno == dexno)
-        )
+    def load_pokemon(self, dexno):  # internal function
+        r = self.conn.execute(pokemon_name_stmt, {"dexno": dexno})
         try:
             name, = r.fetchone()
         except TypeError:
             raise NoSuchPokemonError(dexno=dexno)
         return Pokemon(dexno, name, self.get_pokemon_names(dexno))
 
-    def getPokemonRange(self, pokeA, pokeB, maxno=None):
+    def iterPokemonRange(self, pokeA, pokeB, maxno=None):
         pokeA = int(pokeA)
         pokeB = int(pokeB)
         if maxno is not None:
             pokeB = min(pokeB, maxno)
-        return [
-            Pokemon(dexno, name, self.get_pokemon_names(dexno))
-            for dexno, name in self.conn.execute(
-                S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name])
-                 .where(pokeA <= pokemon_tbl.c.dexno)
-                 .where(pokemon_tbl.c.dexno <= pokeB)
-                 .order_by(S.asc(pokemon_tbl.c.dexno))
-            )
-        ]
+        return self.iter_pokemon(self.conn.execute(
+            pokemon_range_stmt, {"start": pokeA, "end": pokeB}
+        ))
 
-    def allPokemon(self, maxno=None):
-        query = S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name]) \
-                 .order_by(S.asc(pokemon_tbl.c.dexno))
-        if maxno is not None:
-            query = query.where(pokemon_tbl.c.dexno <= maxno)
-        return [Pokemon(dexno, name, self.get_pokemon_names(dexno))
-                for dexno, name in self.conn.execute(query)]
+    def iterAllPokemon(self, maxno=None):
+        return self.iter_pokemon(self.conn.execute(pokemon_range_stmt, {
+            "start": MIN_DEXNO,
+            "end":   MAX_DEXNO if maxno is None else int(maxno),
+        }))
 
     def pokemonQty(self):
         """
         Returns the largest Pokémon ``dexno`` in the database, i.e., the
         largest possible ``dexsize`` value
         """
-        return self.conn.execute(
-            ### S.select(S.func.max(pokemon_tbl.c.dexno))
-            S.select([pokemon_tbl.c.dexno])
-             .order_by(S.desc(pokemon_tbl.c.dexno))
-             .limit(1)
-        ).scalar()
+        ### S.select(S.func.max(pokemon_tbl.c.dexno))
+        return self.conn.execute(max_dexno_stmt).scalar()
 
-    def getGame(self, name):
-        """
-        Returns the `Game` object for the game with the given name.  Raises a
-        `NoSuchGameError` if there is no such game.
-        """
-        r = self.conn.execute(
-            S.select([game_names_tbl.c.gameID])
-             .where(game_names_tbl.c.name == name.lower())
-        )
+    def game_name_id(self, name):  # internal function
+        r = self.conn.execute(game_name_id_stmt, {"name": name.lower()})
         try:
             gameID, = r.fetchone()
         except TypeError:
             raise NoSuchGameError(name)
-        return self.getGameByID(gameID)
+        return gameID
 
-    def getGameByID(self, gameID):
-        gameID = int(gameID)
-        game = self.conn.execute(
-            S.select([games_tbl]).where(games_tbl.c.gameID == gameID)
-        ).first()
+    def load_game(self, gameID):  # internal function
+        game = self.conn.execute(game_stmt, {"gameID": gameID}).first()
         if game is None:
             raise NoSuchGameError(gameID=gameID)
         return Game(
@@ -214,295 +684,542 @@ class CaughtDB(object):
             self.get_game_names(gameID),
         )
 
-    def getGameCount(self, game):
-        caught = self.conn.execute(
-            S.select([S.func.count()]).select_from(caught_tbl)
-             .where(caught_tbl.c.gameID == int(game))
-             .where(caught_tbl.c.status == int(Status.CAUGHT))
-        ).scalar()
-        owned = self.conn.execute(
-            S.select([S.func.count()]).select_from(caught_tbl)
-             .where(caught_tbl.c.gameID == int(game))
-             .where(caught_tbl.c.status == int(Status.OWNED))
-        ).scalar()
-        return (caught, owned)
+    def getGameCounts(self, games=None):
+        """
+        Returns a `dict` mapping the gameID of each game in ``games`` (default:
+        all games) to a ``(caught, owned)`` pair of the number of Pokémon
+        caught but not owned and the number of Pokémon owned in that game.
 
-    def allGames(self):
-        return [Game(
+        If the progress counters are enabled, the counts are read directly
+        from them; otherwise, they are computed with a single query over
+        ``caught``.
+        """
+        if not self.hasProgressCounters():
+            return self.count_caught(games)
+        if games is None:
+            counts = {g: (0, 0) for g, in self.conn.execute(all_game_ids_stmt)}
+            r = self.conn.execute(progress_stmt)
+        else:
+            counts = {int(g): (0, 0) for g in games}
+            r = self.conn.execute(progress_in_stmt, {"games": list(counts)})
+        for gameID, caught, owned in r:
+            if gameID in counts:
+                counts[gameID] = (caught, owned)
+        return counts
+
+    def hasProgressCounters(self):
+        """
+        Returns whether the ``game_progress`` counters are enabled in the
+        database
+        """
+        if self.progress is None:
+            self.progress = bool(self.conn.exec_driver_sql(
+                PROGRESS_EXISTS_SQL
+            ).scalar())
+        return self.progress
+
+    def enableProgressCounters(self):
+        """
+        Creates the ``game_progress`` table along with the triggers that keep
+        it up to date, and then populates it from ``caught``.  Does nothing
+        if the counters are already enabled.
+        """
+        if self.hasProgressCounters():
+            return
+        game_progress_tbl.create(self.conn)
+        for ddl in PROGRESS_TRIGGERS.values():
+            self.conn.execute(ddl)
+        self.progress = True
+        self.rebuildProgressCounters()
+
+    def disableProgressCounters(self):
+        """ Drops the ``game_progress`` table and its triggers """
+        for trigger in PROGRESS_TRIGGERS:
+            self.conn.execute('DROP TRIGGER IF EXISTS ' + trigger)
+        game_progress_tbl.drop(self.conn, checkfirst=True)
+        self.progress = False
+
+    def rebuildProgressCounters(self):
+        """
+        Recomputes the ``game_progress`` counters from ``caught`` and returns
+        the discrepancies found beforehand, as returned by
+        `checkProgressCounters`.  Raises a `RuntimeError` if the counters are
+        not enabled.
+        """
+        mismatches = self.checkProgressCounters()
+        self.conn.execute(game_progress_tbl.delete())
+        self.conn.execute(game_progress_tbl.insert().from_select(
+            ['gameID', 'caught', 'owned'],
+            S.select([
+                games_tbl.c.gameID,
+                S.func.count(S.case([
+                    (caught_tbl.c.status == int(Status.CAUGHT), 1),
+                ])),
+                S.func.count(S.case([
+                    (caught_tbl.c.status == int(Status.OWNED), 1),
+                ])),
+            ]).select_from(games_tbl.outerjoin(caught_tbl))
+              .group_by(games_tbl.c.gameID),
+        ))
+        return mismatches
+
+    def checkProgressCounters(self):
+        """
+        Compares the ``game_progress`` counters against the actual contents of
+        ``caught`` and returns a list of ``(gameID, stored, actual)`` triples,
+        one for each game whose stored ``(caught, owned)`` counts (`None` if
+        missing) differ from the actual counts.  Raises a `RuntimeError` if
+        the counters are not enabled.
+        """
+        if not self.hasProgressCounters():
+            raise RuntimeError('Progress counters are not enabled')
+        stored = {gameID: (caught, owned) for gameID, caught, owned
+                  in self.conn.execute(progress_stmt)}
+        return [(gameID, stored.get(gameID), counts)
+                for gameID, counts in sorted(self.count_caught().items())
+                if stored.get(gameID) != counts]
+
+    def hasChangeLog(self):
+        """ Returns whether the ``status_changes`` log is enabled """
+        if self.changelog is None:
+            self.changelog = bool(self.conn.exec_driver_sql(
+                CHANGE_LOG_EXISTS_SQL
+            ).scalar())
+        return self.changelog
+
+    def enableChangeLog(self):
+        """
+        Creates the ``status_changes`` table along with the triggers that
+        append to it whenever a status changes.  Only changes made from then
+        on are logged.  Does nothing if the log is already enabled.
+        """
+        if self.hasChangeLog():
+            return
+        status_changes_tbl.create(self.conn)
+        for ddl in CHANGE_LOG_TRIGGERS.values():
+            self.conn.execute(ddl)
+        self.changelog = True
+
+    def disableChangeLog(self):
+        """ Drops the ``status_changes`` table and its triggers """
+        for trigger in CHANGE_LOG_TRIGGERS:
+            self.conn.execute('DROP TRIGGER IF EXISTS ' + trigger)
+        status_changes_tbl.drop(self.conn, checkfirst=True)
+        self.changelog = False
+
+    def lastChangeSeq(self):
+        """
+        Returns the sequence number of the latest entry in the change log, or
+        0 if it is empty.  Raises a `RuntimeError` if the change log is not
+        enabled.
+        """
+        if not self.hasChangeLog():
+            raise RuntimeError('Change log is not enabled')
+        return self.conn.execute(
+            S.select([S.func.max(status_changes_tbl.c.seq)])
+        ).scalar() or 0
+
+    def change_rows(self, seq, gameIDs=None):  # internal function
+        if gameIDs is None:
+            return self.conn.execute(changes_stmt, {"seq": seq})
+        else:
+            return self.conn.execute(changes_in_stmt,
+                                     {"seq": seq, "games": gameIDs})
+
+    def count_caught(self, games=None):  # internal function
+        """
+        Computes the values returned by `getGameCounts` with a single query
+        over ``caught``
+        """
+        if games is None:
+            counts = {g: [0, 0] for g, in self.conn.execute(all_game_ids_stmt)}
+            r = self.conn.execute(count_caught_stmt)
+        else:
+            counts = {int(g): [0, 0] for g in games}
+            r = self.conn.execute(count_caught_in_stmt, {"games": list(counts)})
+        for gameID, status, qty in r:
+            if gameID in counts:
+                if status == int(Status.CAUGHT):
+                    counts[gameID][0] = qty
+                elif status == int(Status.OWNED):
+                    counts[gameID][1] = qty
+        return {gameID: tuple(c) for gameID, c in counts.items()}
+
+    def iterAllGames(self):
+        synonyms = self.get_all_game_names()
+        return (Game(
             game["gameID"],
             game["name"],
             game["version"],
             game["player_name"],
             game["dexsize"],
-            self.get_game_names(game["gameID"])
-        ) for game in self.conn.execute(
-            S.select([games_tbl]).order_by(S.asc(games_tbl.c.gameID))
-        )]
+            synonyms[game["gameID"]],
+        ) for game in self.conn.execute(all_games_stmt))
 
     def getStatus(self, game, poke):
         status = self.conn.execute(
-            S.select([caught_tbl.c.status])
-             .where(caught_tbl.c.gameID == int(game))
-             .where(caught_tbl.c.dexno  == int(poke))
+            status_stmt, {"gameID": int(game), "dexno": int(poke)}
         ).scalar()
         return Status.UNCAUGHT if status is None else Status.fromValue(status)
 
-    def getStatusRange(self, game, start=None, end=None):  # inclusive range
-        if not isinstance(game, Game):
-            ### TODO: Rethink this:
-            game = self.getGameByID(game)
-        if start is None and end is None:
-            start, end = 1, game.dexsize
-        elif end is None:
-            start, end = 1, start
-        elif start is None:
-            ### TODO: Should this be an error instead?
-            start = 1
-        start = int(start)
-        end = min(int(end), game.dexsize)
-        game_caught = S.select([caught_tbl])\
-                       .where(caught_tbl.c.gameID == int(game))\
-                       .alias('game_caught')
-        return [(
-            Pokemon(dexno, name, self.get_pokemon_names(dexno)),
-            Status.fromValue(status),
-        ) for dexno, name, status in self.conn.execute(
-            S.select([
-                pokemon_tbl.c.dexno,
-                pokemon_tbl.c.name,
-                S.func.IFNULL(game_caught.c.status, int(Status.UNCAUGHT)),
-            ]).select_from(pokemon_tbl.outerjoin(game_caught))
-              .where(start <= pokemon_tbl.c.dexno)
-              .where(pokemon_tbl.c.dexno <= end)
-              .order_by(S.asc(pokemon_tbl.c.dexno))
-        )]
+    def iterStatusRange(self, game, start=None, end=None):  # inclusive range
+        game, start, end = self.status_range_bounds(game, start, end)
+        return (
+            (poke, Status.fromValue(status))
+            for poke, (status,) in self.fetch_pokemon(self.conn.execute(
+                status_range_stmt,
+                {"gameID": int(game), "start": start, "end": end},
+            ))
+        )
 
-    def getByStatus(self, game, status, maxno=None):
+    def iterByStatus(self, game, status, maxno=None):
         status = int(status)
-        game_caught = S.select([caught_tbl])\
-                       .where(caught_tbl.c.gameID == int(game))\
-                       .alias('game_caught')
-        query = S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name])\
-                  .select_from(pokemon_tbl.join(
-                    game_caught,
-                    isouter=(status == int(Status.UNCAUGHT)),
-                  )).order_by(S.asc(pokemon_tbl.c.dexno))
+        params = {
+            "gameID": int(game),
+            "maxno":  MAX_DEXNO if maxno is None else int(maxno),
+        }
         if status == int(Status.UNCAUGHT):
-            query = query.where(game_caught.c.status == None)  # noqa: E711
+            r = self.conn.execute(uncaught_stmt, params)
         else:
-            query = query.where(game_caught.c.status == status)
-        if maxno is not None:
-            query = query.where(pokemon_tbl.c.dexno <= int(maxno))
-        return [
-            Pokemon(dexno, name, self.get_pokemon_names(dexno))
-            for dexno, name in self.conn.execute(query)
-        ]
+            params["status"] = status
+            r = self.conn.execute(by_status_stmt, params)
+        return self.iter_pokemon(r)
+
+    def iterCaught(self, games=None):
+        """
+        Returns an iterator of ``(gameID, dexno, status)`` triples for every
+        Pokémon caught or owned in ``games`` (default: all games), ordered by
+        gameID and then dexno, read lazily from the database
+        """
+        if games is None:
+            r = self.conn.execute(caught_rows_stmt)
+        else:
+            r = self.conn.execute(
+                caught_rows_in_stmt, {"games": [int(g) for g in games]}
+            )
+        return ((gameID, dexno, Status.fromValue(status))
+                for gameID, dexno, status in r)
+
+    def getStatuses(self, game, pokemon):
+        """
+        Returns a `dict` mapping the dexno of each Pokémon in ``pokemon`` (an
+        iterable of `Pokemon` objects and/or dexnos) to its `Status` in
+        ``game``.  The statuses are fetched with a single query per
+        `RANGE_CHUNK_SIZE` runs of consecutive dexnos.
+        """
+        statuses = {int(p): Status.UNCAUGHT for p in pokemon}
+        for pred in range_predicates(caught_tbl.c.dexno, statuses):
+            for dexno, status in self.conn.execute(
+                S.select([caught_tbl.c.dexno, caught_tbl.c.status])
+                 .where(caught_tbl.c.gameID == int(game))
+                 .where(pred)
+            ):
+                statuses[dexno] = Status.fromValue(status)
+        return statuses
 
     def setStatus(self, game, poke, status):
-        status = int(status)
-        if status not in tuple(int(s) for s in Status.STATUSES):
-            raise ValueError('%d: not a valid status' % (status,))
+        status = check_status(status)
+        params = {"gameID": int(game), "dexno": int(poke)}
+        if status == int(Status.UNCAUGHT):
+            self.conn.execute(delete_status_stmt, params)
+        else:
+            params["status"] = status
+            self.conn.execute(upsert_status_stmt, params)
+
+    def setStatusMany(self, game, pokemon, status):
+        """
+        Sets the status of every Pokémon in ``pokemon`` (an iterable of
+        `Pokemon` objects and/or dexnos) in ``game`` to ``status`` using one
+        statement per `RANGE_CHUNK_SIZE` runs of consecutive dexnos
+        """
+        status = check_status(status)
         if status == int(Status.UNCAUGHT):
+            for pred in range_predicates(caught_tbl.c.dexno, pokemon):
+                self.conn.execute(
+                    caught_tbl.delete().where(caught_tbl.c.gameID == int(game))
+                                       .where(pred)
+                )
+        else:
+            for pred in range_predicates(pokemon_tbl.c.dexno, pokemon):
+                upsert = self.insert_caught_from(game, status, pred)
+                self.conn.execute(upsert.on_conflict_do_update(
+                    index_elements = [caught_tbl.c.gameID, caught_tbl.c.dexno],
+                    set_           = {"status": upsert.excluded.status},
+                ))
+
+    def write_status_rows(self, upserts, deletes, keep_best=False):  # internal function
+        """
+        Upserts the ``(gameID, dexno, status)`` triples in ``upserts`` into
+        ``caught`` (keeping the existing status where it is better if
+        ``keep_best`` is true) and deletes the ``(gameID, dexno)`` pairs in
+        ``deletes``, with one ``executemany`` call each
+        """
+        if upserts:
+            stmt = merge_status_stmt if keep_best else upsert_status_stmt
+            self.conn.execute(stmt, [
+                {"gameID": g, "dexno": d, "status": s} for g, d, s in upserts
+            ])
+        if deletes:
+            self.conn.execute(delete_status_stmt, [
+                {"gameID": g, "dexno": d} for g, d in deletes
+            ])
+
+    def markCaught(self, game, poke):  # uncaught → caught
+        self.conn.execute(insert_status_stmt, {
+            "gameID": int(game),
+            "dexno":  int(poke),
+            "status": int(Status.CAUGHT),
+        })
+
+    def markCaughtMany(self, game, pokemon):  # uncaught → caught
+        for pred in range_predicates(pokemon_tbl.c.dexno, pokemon):
             self.conn.execute(
-                caught_tbl.delete().where(caught_tbl.c.gameID == int(game))
-                                   .where(caught_tbl.c.dexno  == int(poke))
+                self.insert_caught_from(game, Status.CAUGHT, pred)
+                    .on_conflict_do_nothing()
             )
-        elif self.getStatus(game, poke) == Status.UNCAUGHT:
-            self.conn.execute(caught_tbl.insert().values(
-                gameID = int(game),
-                dexno  = int(poke),
-                status = status,
-            ))
-        else:
+
+    def markReleased(self, game, poke):  # owned → caught
+        self.conn.execute(release_stmt, {"game": int(game), "poke": int(poke)})
+
+    def markReleasedMany(self, game, pokemon):  # owned → caught
+        for pred in range_predicates(caught_tbl.c.dexno, pokemon):
             self.conn.execute(
-                caught_tbl.update().values(status=status)
+                caught_tbl.update().values(status=int(Status.CAUGHT))
                                    .where(caught_tbl.c.gameID == int(game))
-                                   .where(caught_tbl.c.dexno  == int(poke))
+                                   .where(caught_tbl.c.status == int(Status.OWNED))
+                                   .where(pred)
             )
 
-    def markCaught(self, game, poke):  # uncaught → caught
-        if self.getStatus(game, poke) == Status.UNCAUGHT:
-            self.conn.execute(caught_tbl.insert().values(
-                gameID = int(game),
-                dexno  = int(poke),
-                status = int(Status.CAUGHT),
-            ))
+    def upsert_progress(self, sources, dst, keep_best):  # internal function
+        """
+        Copies the best status of each Pokémon in the games with gameIDs
+        ``sources`` to game ``dst`` (up to its dexsize), keeping ``dst``'s
+        status where it is better if ``keep_best`` is true, and returns the
+        number of rows inserted or changed
+        """
+        upsert = sqlite_insert(caught_tbl).from_select(
+            ['gameID', 'dexno', 'status'],
+            S.select([
+                S.literal(dst),
+                caught_tbl.c.dexno,
+                S.func.max(caught_tbl.c.status),
+            ]).where(caught_tbl.c.dexno <= S.select([games_tbl.c.dexsize])
+                                            .where(games_tbl.c.gameID == dst)
+                                            .scalar_subquery())
+              .where(caught_tbl.c.gameID.in_(sources))
+              .group_by(caught_tbl.c.dexno),
+        )
+        if keep_best:
+            status = S.func.max(caught_tbl.c.status, upsert.excluded.status)
+            changed = upsert.excluded.status > caught_tbl.c.status
+        else:
+            status = upsert.excluded.status
+            changed = upsert.excluded.status != caught_tbl.c.status
+        return self.conn.execute(upsert.on_conflict_do_update(
+            index_elements = [caught_tbl.c.gameID, caught_tbl.c.dexno],
+            set_           = {"status": status},
+            where          = changed,
+        )).rowcount
+
+    def clear_progress(self, src, dst):  # internal function
+        """
+        Marks uncaught every Pokémon in game ``dst`` that is not caught or
+        owned in game ``src`` within ``dst``'s dexsize, and returns the number
+        of statuses changed
+        """
+        source = caught_tbl.alias('source')
+        return self.conn.execute(
+            caught_tbl.delete()
+                      .where(caught_tbl.c.gameID == dst)
+                      .where(S.or_(
+                          caught_tbl.c.dexno > S.select([games_tbl.c.dexsize])
+                                                .where(games_tbl.c.gameID
+                                                       == dst)
+                                                .scalar_subquery(),
+                          caught_tbl.c.dexno.notin_(
+                              S.select([source.c.dexno])
+                               .where(source.c.gameID == src)
+                          ),
+                      ))
+        ).rowcount
+
+    def insert_caught_from(self, game, status, pred):  # internal function
+        """
+        Returns an ``INSERT INTO caught ... SELECT`` statement that gives every
+        Pokémon whose dexno matches ``pred`` the given status in ``game``
+        """
+        return sqlite_insert(caught_tbl).from_select(
+            ['gameID', 'dexno', 'status'],
+            S.select([
+                S.literal(int(game)),
+                pokemon_tbl.c.dexno,
+                S.literal(int(status)),
+            ]).where(pred),
+        )
 
-    def markOwned(self, game, poke):  # * → owned
-        self.setStatus(game, poke, Status.OWNED)
+    def status_matrix_rows(self, games, maxno=None, dexnos=None):  # internal function
+        """
+        Returns the rows of the query behind `getStatusMatrix` for either all
+        Pokémon up to ``maxno`` in dexno order or for the given dexnos (in
+        any order).  Each row consists of a dexno, a name, and a status value
+        (or `None`) for each game.
 
-    def markReleased(self, game, poke):  # owned → caught
-        self.conn.execute(
-            caught_tbl.update().values(status=int(Status.CAUGHT))
-                               .where(caught_tbl.c.gameID == int(game))
-                               .where(caught_tbl.c.dexno  == int(poke))
-                               .where(caught_tbl.c.status == int(Status.OWNED))
-        )
+        The query's shape depends only on the number of games, so it is
+        compiled once per distinct number of games.
+        """
+        columns = [pokemon_tbl.c.dexno, pokemon_tbl.c.name]
+        params = {"games": [int(g) for g in games]}
+        for i, g in enumerate(games):
+            params["gameID_%d" % i] = int(g)
+            params["dexsize_%d" % i] = g.dexsize
+            columns.append(S.case([(
+                pokemon_tbl.c.dexno <= S.bindparam('dexsize_%d' % i),
+                S.func.IFNULL(
+                    S.func.max(S.case([(
+                        caught_tbl.c.gameID == S.bindparam('gameID_%d' % i),
+                        caught_tbl.c.status,
+                    )])),
+                    int(Status.UNCAUGHT),
+                ),
+            )]))
+        query = S.select(columns).select_from(pokemon_tbl.outerjoin(
+                    caught_tbl,
+                    S.and_(
+                        caught_tbl.c.dexno == pokemon_tbl.c.dexno,
+                        caught_tbl.c.gameID.in_(
+                            S.bindparam('games', expanding=True)
+                        ),
+                    ),
+                )).group_by(pokemon_tbl.c.dexno)
+        if dexnos is None:
+            query = query.where(pokemon_tbl.c.dexno <= S.bindparam('maxno'))\
+                         .order_by(S.asc(pokemon_tbl.c.dexno))
+            params["maxno"] = maxno
+        else:
+            query = query.where(pokemon_tbl.c.dexno.in_(
+                S.bindparam('dexnos', expanding=True)
+            ))
+            params["dexnos"] = list(dexnos)
+        return self.conn.execute(query, params)
 
-    def markUncaught(self, game, poke):  # * → uncaught
-        self.setStatus(game, poke, Status.UNCAUGHT)
+    def status_expr_rows(self, expr, maxno):  # internal function
+        """
+        Returns the ``(dexno, name)`` rows, in dexno order, of the Pokémon up
+        to ``maxno`` that satisfy the parsed status expression ``expr``
+        """
+        return self.conn.execute(
+            S.select([pokemon_tbl.c.dexno, pokemon_tbl.c.name])
+             .where(pokemon_tbl.c.dexno <= maxno)
+             .where(status_expr_clause(expr))
+             .order_by(S.asc(pokemon_tbl.c.dexno))
+        )
 
     def get_pokemon_names(self, dexno):  # internal function
         return [n for n, in self.conn.execute(
-            S.select([pokemon_names_tbl.c.name])
-             .where(pokemon_names_tbl.c.dexno == dexno)
-             .order_by(S.asc(pokemon_names_tbl.c.name))
+            pokemon_names_stmt, {"dexno": dexno}
         )]
 
     def get_game_names(self, gameID):  # internal function
         return [n for n, in self.conn.execute(
-            S.select([game_names_tbl.c.name])
-             .where(game_names_tbl.c.gameID == gameID)
-             .order_by(S.asc(game_names_tbl.c.name))
+            game_names_stmt, {"gameID": gameID}
         )]
 
+    def get_pokemon_names_range(self, start=None, end=None):  # internal function
+        """
+        Returns a `dict` mapping each dexno in the inclusive range from
+        ``start`` to ``end`` (either of which may be `None` to leave that side
+        unbounded) to the sorted list of its names, fetched with a single
+        query.  Dexnos without any names map to an empty list.
+        """
+        return group_names(self.conn.execute(pokemon_names_range_stmt, {
+            "start": MIN_DEXNO if start is None else int(start),
+            "end":   MAX_DEXNO if end is None else int(end),
+        }))
 
-class Status(namedtuple('Status', 'value name checks')):
-    __slots__ = ()
-
-    def __int__(self):
-        return self.value
-
-    def __str__(self):
-        return self.name
-
-    def __repr__(self):
-        return self.__class__.__name__ + '.' + self.name.upper()
-
-    @classmethod
-    def fromValue(cls, val):
-        return cls.STATUSES[val]
-
-### TODO: Improve the checkmarks:
-Status.UNCAUGHT = Status(0, 'uncaught', '  ')
-Status.CAUGHT = Status(1, 'caught', '✓ ')
-Status.OWNED = Status(2, 'owned', '✓✓')
-Status.STATUSES = (Status.UNCAUGHT, Status.CAUGHT, Status.OWNED)
-Status.CHECKS_LEN = 2
-
-
-class Game(namedtuple('Game', 'gameID name version player_name dexsize synonyms')):
-    # `version` and `player_name` are the only attributes that should ever be
-    # `None`.
-    __slots__ = ()
-
-    def __int__(self):
-        return self.gameID
-
-    def __str__(self):
-        return self.name
-
-    def asYAML(self, caught_or_owned=None, owned=None):
-        version = 'null' if self.version is None else self.version
-        player_name = 'null' if self.player_name is None else self.player_name
-        yml = '''
-- game ID: %d
-  name: %s
-  version: %s
-  player name: %s
-  dexsize: %d
-  synonyms:
-%s
-'''.strip() % (self.gameID, self.name, version, player_name, self.dexsize,
-               ''.join('    - ' + syn + '\n' for syn in self.synonyms))
-        if caught_or_owned is not None:
-            yml += '  caught or owned: ' + str(caught_or_owned) + '\n'
-        if owned is not None:
-            yml += '  owned: ' + str(owned) + '\n'
-        return yml
-
-    def asDict(self, caught_or_owned=None, owned=None):
-        d = {
-                "game ID":     self.gameID,
-                "name":        self.name,
-                "version":     self.version,
-                "player name": self.player_name,
-                "dexsize":     self.dexsize,
-                "synonyms":    list(self.synonyms)
-            }
-        if caught_or_owned is not None:
-            d["caught or owned"] = caught_or_owned
-        if owned is not None:
-            d["owned"] = owned
-        return d
-
-    def asJSON(self, caught_or_owned=None, owned=None):
-        return json.dumps(self.asDict(caught_or_owned, owned))
-
-
-class Pokemon(namedtuple('Pokemon', 'dexno name synonyms')):
-    __slots__ = ()
-
-    def __int__(self):
-        return self.dexno
-
-    def __str__(self):
-        return self.name
-
-    @classmethod
-    def fromTSVFile(cls, pokedex):
-        with open(pokedex) as dex:
-            for (lineno, line) in enumerate(dex, start=1):
-                line = line.strip()
-                if line == '' or line[0] == '#':
-                    continue
-                fields = line.split('\t')
-                if len(fields) < 2:
-                    raise MalformedFileError(pokedex, lineno, 'too few fields')
-                try:
-                    dexno = int(fields[0])
-                except ValueError:
-                    raise MalformedFileError(pokedex, lineno,
-                                             fields[0] + ': not a number')
-                yield cls(dexno, fields[1], tuple(fields[2:]))
-
-
-class CaughtDBError(Exception):
-    pass
-
-
-class NoSuchGameError(CaughtDBError, LookupError):
-    def __init__(self, name=None, gameID=None):
-        self.name = name
-        self.gameID = gameID
-        super(NoSuchGameError, self).__init__(name, gameID)
-
-    def __str__(self):
-        if self.gameID is None:
-            return 'No such game name: %r' % (self.name,)
-        else:
-            return 'No such gameID: %d' % (self.gameID,)
-
-
-class NoSuchPokemonError(CaughtDBError, LookupError):
-    def __init__(self, name=None, dexno=None):
-        self.name = name
-        self.dexno = dexno
-        super(NoSuchPokemonError, self).__init__(name, dexno)
-
-    def __str__(self):
-        if self.dexno is None:
-            return 'No such Pokémon name: %r' % (self.name,)
-        else:
-            return 'No such dexno: %d' % (self.dexno,)
-
-
-class MalformedFileError(CaughtDBError, ValueError):
-    def __init__(self, filename, lineno, reason):
-        self.filename = filename
-        self.lineno = lineno
-        self.reason = reason
-        super(MalformedFileError, self).__init__(filename, lineno, reason)
-
-    def __str__(self):
-        return '%s: line %d: %s' % (self.filename, self.lineno, self.reason)
-
+    def get_pokemon_names_in(self, dexnos):  # internal function
+        """
+        Returns a `dict` mapping each of the given dexnos (in increasing
+        order) to the sorted list of its names, fetched `IN_CHUNK_SIZE`
+        dexnos at a time.  Dexnos without any names map to an empty list.
+        """
+        return group_names(
+            row for chunk in chunked(dexnos, IN_CHUNK_SIZE)
+                for row in self.conn.execute(pokemon_names_in_stmt,
+                                             {"dexnos": chunk})
+        )
 
-class DuplicateNameError(CaughtDBError, ValueError):
-    def __init__(self, objType, name):
-        self.objType = objType
-        self.name = name
-        super(DuplicateNameError, self).__init__(objType, name)
+    def get_all_game_names(self):  # internal function
+        """
+        Returns a `dict` mapping each gameID to the sorted list of its names,
+        fetched with a single query
+        """
+        return group_names(self.conn.execute(all_game_names_stmt))
+
+
+def status_expr_clause(expr):
+    """
+    Compiles a parsed status expression into a SQL expression over
+    ``pokemon`` that is true for the Pokémon satisfying it.  Each atom
+    becomes an ``EXISTS`` over ``caught`` (or, for ``*``, over ``games``)
+    correlated with the enclosing query.
+    """
+    if isinstance(expr, And):
+        return S.and_(*[status_expr_clause(e) for e in expr.args])
+    elif isinstance(expr, Or):
+        return S.or_(*[status_expr_clause(e) for e in expr.args])
+    elif isinstance(expr, Not):
+        return S.not_(status_expr_clause(expr.arg))
+    elif expr.game == ALL_GAMES:
+        every = games_tbl.alias()
+        in_dex = S.exists().where(every.c.dexsize >= pokemon_tbl.c.dexno)\
+                  .correlate_except(every)
+        others = frozenset(Status.STATUSES) - expr.statuses
+        return S.and_(
+            in_dex,
+            ~in_dex.where(status_in_clause(others, every.c.gameID)),
+        )
+    else:
+        return S.and_(
+            pokemon_tbl.c.dexno <= expr.game.dexsize,
+            status_in_clause(expr.statuses, int(expr.game)),
+        )
 
-    def __str__(self):
-        return 'Duplicate %s name: %r' % (self.objType, self.name)
+def status_in_clause(statuses, gameID):
+    """
+    Returns a SQL expression that is true for the Pokémon in ``pokemon``
+    whose status in the game with ID ``gameID`` (an `int` or a column) is one
+    of ``statuses``
+    """
+    wanted = set(int(s) for s in statuses)
+    if not wanted:
+        return S.false()
+    elif len(wanted) == len(Status.STATUSES):
+        return S.true()
+    caught = caught_tbl.alias()
+    # The correlation has to be explicit, as this may be nested two levels
+    # deep inside the query over ``pokemon``:
+    match = S.exists().where(caught.c.gameID == gameID)\
+                      .where(caught.c.dexno == pokemon_tbl.c.dexno)\
+                      .correlate_except(caught)
+    if int(Status.UNCAUGHT) in wanted:
+        # A Pokémon is uncaught if it has no row in `caught`, so match the
+        # Pokémon that do not have one of the other statuses instead:
+        others = set(int(s) for s in Status.STATUSES) - wanted
+        return ~match.where(caught.c.status.in_(sorted(others)))
+    else:
+        return match.where(caught.c.status.in_(sorted(wanted)))
+
+
+def range_predicates(column, pokemon):
+    """
+    Returns a list of SQL expressions that together match ``column`` against
+    every dexno in ``pokemon``, each one covering at most `RANGE_CHUNK_SIZE`
+    runs of consecutive dexnos
+    """
+    ranges = dexno_ranges(pokemon)
+    return [
+        S.or_(*[
+            column == start if start == end else column.between(start, end)
+            for start, end in ranges[i:i+RANGE_CHUNK_SIZE]
+        ]) for i in range(0, len(ranges), RANGE_CHUNK_SIZE)
+    ]
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled Pokédex indexes: a binary form of a Pokédex TSV file that can be
+memory-mapped and searched in place, so that a Pokédex can be loaded without
+parsing it.  Indexes are cached on disk under `cache_dir()`, named after the
+SHA-256 digest of the contents of the TSV file they were compiled from, and
+are recompiled automatically whenever that file changes.
+
+An index file consists of (with all integers little-endian):
+
+- a header giving the magic number, format version, number of Pokémon,
+  number of names, and size of the name strings
+- one ``(dexno, name offset, name length, first name, name count)`` record
+  per Pokémon, sorted by dexno, in which the last two fields give the slice of
+  the by-dexno name list holding the Pokémon's names
+- one ``(name offset, name length, dexno)`` record per lowercased name
+  (including each Pokémon's dexno), sorted by the names' UTF-8 encodings
+- the by-dexno name list: the indices into the name records of every name,
+  grouped by dexno and sorted by name within each group
+- the UTF-8 encoded names, with offsets measured from the start of this
+  section
+"""
+import errno
+import hashlib
+import mmap
+import os
+import os.path
+import struct
+import tempfile
+from   .models import NameResolver, NoSuchPokemonError, Pokemon, read_pokedex
+
+MAGIC = b'CAUGHTDX'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sIIII')
+POKEMON_RECORD = struct.Struct('<qIIII')
+NAME_RECORD = struct.Struct('<IIq')
+NAME_INDEX = struct.Struct('<I')
+
+#: The extension given to cached index files
+INDEX_EXT = '.dex'
+
+#: Renames a file, replacing any existing file at the destination (Python 2
+#: has no `os.replace`, but its `os.rename` does the same on POSIX)
+replace_file = getattr(os, 'replace', os.rename)
+
+def cache_dir():
+    """
+    Returns the directory in which compiled Pokédex indexes are cached: the
+    value of the :envvar:`CAUGHT_CACHE_DIR` environment variable if set, or
+    else :file:`caught` in the user's cache directory
+    """
+    path = os.environ.get('CAUGHT_CACHE_DIR')
+    if not path:
+        path = os.path.join(
+            os.environ.get('XDG_CACHE_HOME')
+                or os.path.join(os.path.expanduser('~'), '.cache'),
+            'caught',
+        )
+    return path
+
+def pokedex_digest(pokedex):
+    """ Returns the hex SHA-256 digest of the contents of the file ``pokedex`` """
+    h = hashlib.sha256()
+    with open(pokedex, 'rb') as fp:
+        for block in iter(lambda: fp.read(65536), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def index_path(digest, cachedir=None):
+    """
+    Returns the path at which the index for a TSV file with the given digest
+    is cached
+    """
+    return os.path.join(cachedir or cache_dir(), digest + INDEX_EXT)
+
+def compile_pokedex(pokedex):
+    """
+    Parses & validates the TSV file ``pokedex`` and returns the contents of a
+    compiled index for it as a `bytes` object.  Raises a `MalformedFileError`
+    under the same conditions as `check_pokedex`.
+    """
+    pokemon = []
+    names = []
+    for _, poke, pnames in read_pokedex(pokedex):
+        pokemon.append((poke.dexno, poke.name.encode('utf-8')))
+        names.extend((n.encode('utf-8'), poke.dexno) for n in pnames)
+    pokemon.sort()
+    names.sort()
+    strings = bytearray()
+    name_records = []
+    for name, dexno in names:
+        name_records.append(NAME_RECORD.pack(len(strings), len(name), dexno))
+        strings.extend(name)
+    bydex = sorted(range(len(names)), key=lambda i: (names[i][1], names[i][0]))
+    pokemon_records = []
+    first = 0
+    for dexno, name in pokemon:
+        qty = 0
+        while first + qty < len(bydex) and names[bydex[first+qty]][1] == dexno:
+            qty += 1
+        pokemon_records.append(
+            POKEMON_RECORD.pack(dexno, len(strings), len(name), first, qty)
+        )
+        strings.extend(name)
+        first += qty
+    return b''.join(
+        [HEADER.pack(MAGIC, FORMAT_VERSION, len(pokemon), len(names),
+                     len(strings))]
+        + pokemon_records
+        + name_records
+        + [NAME_INDEX.pack(i) for i in bydex]
+        + [bytes(strings)]
+    )
+
+def load_pokedex(pokedex, cachedir=None):
+    """
+    Returns a `DexIndex` for the TSV file ``pokedex``, loading it from the
+    cache if an index for the file's current contents has already been
+    compiled, or else compiling it and saving it to the cache.  If the cache
+    cannot be written to, the freshly-compiled index is used from memory.
+    """
+    digest = pokedex_digest(pokedex)
+    index = open_index(digest, cachedir)
+    if index is not None:
+        return index
+    data = compile_pokedex(pokedex)
+    path = index_path(digest, cachedir)
+    try:
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file & rename it into place so that other
+        # processes never see a partially-written index:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+                                   suffix=INDEX_EXT + '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            replace_file(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+    return DexIndex(data, digest)
+
+def open_index(digest, cachedir=None):
+    """
+    Returns the cached `DexIndex` for the TSV file with the given digest, or
+    `None` if it has not been compiled or is unreadable
+    """
+    try:
+        return DexIndex.open(index_path(digest, cachedir), digest)
+    except (OSError, ValueError):
+        return None
+
+
+class DexIndex(NameResolver):
+    """
+    A compiled Pokédex index, searched in place in a `bytes` object or
+    memory map.  It can be used in place of a `NameResolver`.
+    """
+
+    def __init__(self, buf, digest=None):
+        # `NameResolver.__init__` is not called, as its dictionaries are
+        # replaced by binary searches of ``buf``.
+        self.buf = buf
+        self.digest = digest
+        if len(buf) < HEADER.size:
+            raise ValueError('Not a compiled Pokédex index')
+        magic, version, self.qty, self.name_qty, strings_size \
+            = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Not a compiled Pokédex index')
+        self.pokemon_start = HEADER.size
+        self.names_start = self.pokemon_start + self.qty * POKEMON_RECORD.size
+        self.bydex_start = self.names_start + self.name_qty * NAME_RECORD.size
+        self.strings_start = self.bydex_start + self.name_qty * NAME_INDEX.size
+        if len(buf) != self.strings_start + strings_size:
+            raise ValueError('Compiled Pokédex index is the wrong size')
+
+    @classmethod
+    def open(cls, path, digest=None):
+        """ Memory-maps the index file at ``path`` """
+        with open(path, 'rb') as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf, digest)
+
+    def __len__(self):
+        return self.qty
+
+    def string(self, offset, length):  # internal function
+        start = self.strings_start + offset
+        return self.buf[start:start+length]
+
+    def pokemon_record(self, i):  # internal function
+        return POKEMON_RECORD.unpack_from(
+            self.buf, self.pokemon_start + i * POKEMON_RECORD.size,
+        )
+
+    def name_record(self, i):  # internal function
+        return NAME_RECORD.unpack_from(
+            self.buf, self.names_start + i * NAME_RECORD.size,
+        )
+
+    def pokemon_at(self, i):  # internal function
+        """ Returns the `Pokemon` for the ``i``-th Pokémon record """
+        dexno, offset, length, first, qty = self.pokemon_record(i)
+        synonyms = []
+        for j in range(first, first+qty):
+            nameno, = NAME_INDEX.unpack_from(
+                self.buf, self.bydex_start + j * NAME_INDEX.size,
+            )
+            noffset, nlength, _ = self.name_record(nameno)
+            synonyms.append(self.string(noffset, nlength).decode('utf-8'))
+        return Pokemon(dexno, self.string(offset, length).decode('utf-8'),
+                       synonyms)
+
+    def position(self, dexno):  # internal function
+        """
+        Returns the index of the first Pokémon record with a dexno greater
+        than or equal to ``dexno``
+        """
+        lo, hi = 0, self.qty
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.pokemon_record(mid)[0] < dexno:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def findDexno(self, name):
+        key = name.lower().encode('utf-8')
+        lo, hi = 0, self.name_qty
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, length, dexno = self.name_record(mid)
+            s = self.string(offset, length)
+            if s < key:
+                lo = mid + 1
+            elif s > key:
+                hi = mid
+            else:
+                return dexno
+        return None
+
+    def getPokemonByDexno(self, dexno):
+        dexno = int(dexno)
+        i = self.position(dexno)
+        if i >= self.qty or self.pokemon_record(i)[0] != dexno:
+            raise NoSuchPokemonError(dexno=dexno)
+        return self.pokemon_at(i)
+
+    def getPokemonRange(self, pokeA, pokeB, maxno=None):
+        pokeA = int(pokeA)
+        pokeB = int(pokeB)
+        if maxno is not None:
+            pokeB = min(pokeB, maxno)
+        if pokeA > pokeB:
+            return []
+        return [self.pokemon_at(i) for i in
+                range(self.position(pokeA), self.position(pokeB + 1))]
+
+    def iterPokemon(self):
+        """
+        Returns an iterator of the `Pokemon` in the index in dexno order, with
+        ``synonyms`` containing all of their lowercased names in the same
+        manner as `CaughtDB.allPokemon`
+        """
+        return (self.pokemon_at(i) for i in range(self.qty))
+
+    def pokemonRows(self):
+        """
+        Returns an iterator of ``(dexno, name)`` pairs for the Pokémon in the
+        index, in dexno order
+        """
+        for i in range(self.qty):
+            dexno, offset, length, _, _ = self.pokemon_record(i)
+            yield (dexno, self.string(offset, length).decode('utf-8'))
+
+    def nameRows(self):
+        """
+        Returns an iterator of ``(dexno, name)`` pairs for every lowercased
+        name in the index, sorted by name
+        """
+        for i in range(self.name_qty):
+            offset, length, dexno = self.name_record(i)
+            yield (dexno, self.string(offset, length).decode('utf-8'))
@@ -0,0 +1,887 @@
+# -*- coding: utf-8 -*-
+"""
+A lightweight implementation of the `CaughtDB` API built directly on the
+standard library's `sqlite3` module.  Every query is a fixed parameterized SQL
+string (or one of a small number of shapes), so statements are prepared once
+and then reused from the driver's statement cache.
+"""
+from   itertools import count
+import sqlite3
+from   .base import (
+    CHANGE_LOG_DDL, CHANGE_LOG_EXISTS_SQL, CHANGE_LOG_TRIGGERS,
+    DEFAULT_BUSY_TIMEOUT, IN_CHUNK_SIZE, INDEXES, JOURNAL_MODES,
+    LOAD_CHUNK_SIZE, MAX_DEXNO, MIGRATIONS, MIN_DEXNO, PROGRESS_DDL,
+    PROGRESS_EXISTS_SQL, PROGRESS_REBUILD_SQL, PROGRESS_TRIGGERS,
+    RANGE_CHUNK_SIZE, RENAME_PLACEHOLDER, SCHEMA_DDL, SCHEMA_VERSION,
+    CaughtDBBase, IdentityMap, check_status, chunked, dexno_ranges,
+    group_names, load_pokedex, migration_statements,
+)
+from   .models import (
+    DuplicateNameError, Game, NoSuchGameError, NoSuchPokemonError, Pokemon,
+    SchemaVersionError, Status,
+)
+from   .profiling import ProfiledConnection
+from   .statusexpr import ALL_GAMES, And, Not, Or
+
+#: Number of prepared statements to keep in each connection's cache
+STATEMENT_CACHE_SIZE = 256
+
+UNCAUGHT = int(Status.UNCAUGHT)
+CAUGHT = int(Status.CAUGHT)
+OWNED = int(Status.OWNED)
+
+SQL_NAME_DEXNO = 'SELECT dexno FROM pokemon_names WHERE name = ?'
+SQL_POKEMON_NAME = 'SELECT name FROM pokemon WHERE dexno = ?'
+SQL_POKEMON_RANGE = 'SELECT dexno, name FROM pokemon' \
+                    ' WHERE ? <= dexno AND dexno <= ? ORDER BY dexno'
+SQL_ALL_POKEMON = 'SELECT dexno, name FROM pokemon ORDER BY dexno'
+SQL_ALL_POKEMON_MAX = 'SELECT dexno, name FROM pokemon WHERE dexno <= ?' \
+                      ' ORDER BY dexno'
+SQL_MAX_DEXNO = 'SELECT dexno FROM pokemon ORDER BY dexno DESC LIMIT 1'
+SQL_INSERT_POKEMON = 'INSERT INTO pokemon (dexno, name) VALUES (?, ?)'
+SQL_INSERT_POKEMON_NAME = 'INSERT INTO pokemon_names (dexno, name)' \
+                          ' VALUES (?, ?)'
+SQL_DEX_DIGEST = 'SELECT digest FROM pokedex_source LIMIT 1'
+
+SQL_RENAME_POKEMON = 'UPDATE pokemon SET name = ? WHERE dexno = ?'
+SQL_DELETE_POKEMON_NAME = 'DELETE FROM pokemon_names' \
+                          ' WHERE dexno = ? AND name = ?'
+SQL_COUNT_GAME_NAME = 'SELECT count(*) FROM game_names WHERE name = ?'
+SQL_INSERT_GAME = 'INSERT INTO games (name, version, player_name, dexsize)' \
+                  ' VALUES (?, ?, ?, ?)'
+SQL_INSERT_GAME_NAME = 'INSERT INTO game_names (gameID, name) VALUES (?, ?)'
+SQL_NAME_GAMEID = 'SELECT gameID FROM game_names WHERE name = ?'
+SQL_GAME = 'SELECT gameID, name, version, player_name, dexsize FROM games' \
+           ' WHERE gameID = ?'
+SQL_ALL_GAMES = 'SELECT gameID, name, version, player_name, dexsize' \
+                ' FROM games ORDER BY gameID'
+SQL_ALL_GAMEIDS = 'SELECT gameID FROM games'
+#: The tables to delete a game's rows from, in order
+GAME_TABLES = ('caught', 'game_names', 'games')
+
+SQL_STATUS = 'SELECT status FROM caught WHERE gameID = ? AND dexno = ?'
+SQL_STATUS_RANGE = '''
+    SELECT pokemon.dexno, pokemon.name, IFNULL(caught.status, {UNCAUGHT})
+    FROM pokemon LEFT OUTER JOIN caught
+        ON pokemon.dexno = caught.dexno AND caught.gameID = ?
+    WHERE ? <= pokemon.dexno AND pokemon.dexno <= ?
+    ORDER BY pokemon.dexno
+'''.format(UNCAUGHT=UNCAUGHT)
+SQL_UNCAUGHT = '''
+    SELECT pokemon.dexno, pokemon.name
+    FROM pokemon LEFT OUTER JOIN caught
+        ON pokemon.dexno = caught.dexno AND caught.gameID = ?
+    WHERE caught.status IS NULL AND pokemon.dexno <= ?
+    ORDER BY pokemon.dexno
+'''
+SQL_BY_STATUS = '''
+    SELECT pokemon.dexno, pokemon.name
+    FROM pokemon JOIN caught ON pokemon.dexno = caught.dexno
+    WHERE caught.gameID = ? AND caught.status = ? AND pokemon.dexno <= ?
+    ORDER BY pokemon.dexno
+'''
+SQL_DELETE_STATUS = 'DELETE FROM caught WHERE gameID = ? AND dexno = ?'
+SQL_UPSERT_STATUS = '''
+    INSERT INTO caught (gameID, dexno, status) VALUES (?, ?, ?)
+    ON CONFLICT (gameID, dexno) DO UPDATE SET status = excluded.status
+'''
+SQL_INSERT_CAUGHT = 'INSERT INTO caught (gameID, dexno, status)' \
+                    ' VALUES (?, ?, {CAUGHT}) ON CONFLICT DO NOTHING' \
+                    .format(CAUGHT=CAUGHT)
+SQL_UPSERT_PROGRESS = '''
+    INSERT INTO caught (gameID, dexno, status)
+    SELECT ?, dexno, max(status) FROM caught
+    WHERE dexno <= (SELECT dexsize FROM games WHERE gameID = ?)
+      AND gameID IN ({sources})
+    GROUP BY dexno
+    ON CONFLICT (gameID, dexno) DO UPDATE SET {update}
+'''
+SQL_CLEAR_PROGRESS = '''
+    DELETE FROM caught WHERE gameID = ?
+      AND (dexno > (SELECT dexsize FROM games WHERE gameID = ?)
+           OR dexno NOT IN (SELECT dexno FROM caught WHERE gameID = ?))
+'''
+SQL_KEEP_BEST = 'status = max(status, excluded.status)' \
+                ' WHERE excluded.status > status'
+SQL_MERGE_STATUS = '''
+    INSERT INTO caught (gameID, dexno, status) VALUES (?, ?, ?)
+    ON CONFLICT (gameID, dexno) DO UPDATE SET {}
+'''.format(SQL_KEEP_BEST)
+SQL_OVERWRITE = 'status = excluded.status WHERE excluded.status != status'
+SQL_CAUGHT_ROWS = 'SELECT gameID, dexno, status FROM caught'
+SQL_RELEASE = 'UPDATE caught SET status = {CAUGHT}' \
+              ' WHERE gameID = ? AND dexno = ? AND status = {OWNED}' \
+              .format(CAUGHT=CAUGHT, OWNED=OWNED)
+
+SQL_POKEMON_NAMES = 'SELECT name FROM pokemon_names WHERE dexno = ?' \
+                    ' ORDER BY name'
+SQL_GAME_NAMES = 'SELECT name FROM game_names WHERE gameID = ? ORDER BY name'
+SQL_POKEMON_NAMES_RANGE = 'SELECT dexno, name FROM pokemon_names' \
+                          ' WHERE ? <= dexno AND dexno <= ?' \
+                          ' ORDER BY dexno, name'
+SQL_POKEMON_NAMES_IN = 'SELECT dexno, name FROM pokemon_names WHERE dexno IN'
+SQL_ALL_GAME_NAMES = 'SELECT gameID, name FROM game_names' \
+                     ' ORDER BY gameID, name'
+
+SQL_PROGRESS = 'SELECT gameID, caught, owned FROM game_progress'
+SQL_COUNT_CAUGHT = 'SELECT gameID, status, count(*) FROM caught' \
+                   ' GROUP BY gameID, status'
+
+SQL_LAST_CHANGE = 'SELECT max(seq) FROM status_changes'
+SQL_CHANGES = 'SELECT seq, gameID, dexno, old_status, new_status' \
+              ' FROM status_changes WHERE seq > ?'
+
+
+class LiteCaughtDB(CaughtDBBase):
+    def __init__(self, dbpath, journal_mode=None,
+                 busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        if journal_mode is not None and journal_mode not in JOURNAL_MODES:
+            raise ValueError('%s: unsupported journal mode' % (journal_mode,))
+        self.dbpath = dbpath
+        self.read_only = False
+        self.profiler = None
+        self.objects = IdentityMap()
+        self.data_version = None
+        # Transactions are managed explicitly by `__enter__` and `__exit__`.
+        # The connection may be handed from thread to thread (e.g., by the
+        # connection pool in `caught.server`) as long as only one thread uses
+        # it at a time.
+        self.conn = sqlite3.connect(
+            dbpath,
+            timeout           = busy_timeout,
+            isolation_level   = None,
+            cached_statements = STATEMENT_CACHE_SIZE,
+            check_same_thread = False,
+        )
+        if journal_mode is not None:
+            self.retry_busy(lambda: self.scalar(
+                'PRAGMA journal_mode = %s' % (journal_mode,)
+            ))
+        version = self.scalar('PRAGMA user_version')
+        # Databases stamped with the current schema version are known to
+        # already have all of the tables & indexes, so checking for them can
+        # be skipped:
+        if version != SCHEMA_VERSION:
+            for ddl in SCHEMA_DDL:
+                self.conn.execute(ddl)
+            self.migrate()
+
+    def migrate(self):
+        """
+        Upgrades the database's schema to `SCHEMA_VERSION` by applying any
+        pending `MIGRATIONS` in a single transaction, and returns the schema
+        version the database was at beforehand.  Raises a `SchemaVersionError`
+        if the database is from a newer version of this program.
+        """
+        self.retry_busy(lambda: self.conn.execute('BEGIN IMMEDIATE'))
+        try:
+            version = self.scalar('PRAGMA user_version')
+            if version > SCHEMA_VERSION:
+                raise SchemaVersionError(version, SCHEMA_VERSION)
+            for sql in migration_statements(MIGRATIONS[version:],
+                                            self.scalar):
+                self.conn.execute(sql)
+            if version < SCHEMA_VERSION:
+                self.conn.execute('PRAGMA user_version = %d'
+                                  % (SCHEMA_VERSION,))
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        else:
+            self.conn.execute('COMMIT')
+        return version
+
+    def close(self):
+        self.conn.close()
+
+    def start_profiling(self):  # internal function
+        self.conn = ProfiledConnection(self.conn, self.profiler)
+
+    def stop_profiling(self):  # internal function
+        self.conn = self.conn.conn
+
+    def __enter__(self):
+        self.reset_session()
+        self.begin_transaction()
+        return self
+
+    def commit(self):
+        """
+        Commits the changes made so far in the current ``with`` block and
+        begins a new transaction
+        """
+        self.commit_transaction()
+        self.begin_transaction()
+
+    def begin_transaction(self):  # internal function
+        if self.read_only:
+            self.conn.execute('BEGIN')
+            self.saved_pragmas.setdefault('query_only', 0)
+            self.conn.execute('PRAGMA query_only = ON')
+        else:
+            # Taking the write lock up front means that a writer never has to
+            # upgrade a read lock mid-transaction, which fails immediately
+            # (without waiting) if another connection is also writing.
+            self.retry_busy(lambda: self.conn.execute('BEGIN IMMEDIATE'))
+        self.begin_changes = self.conn.total_changes
+        self.check_data_version(self.scalar('PRAGMA data_version'))
+
+    def commit_transaction(self):  # internal function
+        # With a rollback journal, committing waits for readers to finish, and
+        # the transaction is still open if that times out.
+        self.retry_busy(lambda: self.conn.execute('COMMIT'))
+
+    def begin_savepoint(self, name):  # internal function
+        self.conn.execute('SAVEPOINT %s' % (name,))
+
+    def release_savepoint(self, name):  # internal function
+        self.conn.execute('RELEASE SAVEPOINT %s' % (name,))
+
+    def rollback_savepoint(self, name):  # internal function
+        self.conn.execute('ROLLBACK TO SAVEPOINT %s' % (name,))
+        self.conn.execute('RELEASE SAVEPOINT %s' % (name,))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit_transaction()
+        else:
+            self.conn.execute('ROLLBACK')
+            self.objects.clear()
+        for pragma, value in self.saved_pragmas.items():
+            self.conn.execute('PRAGMA %s = %s' % (pragma, value))
+        return False
+
+    def create(self, pokedex=None):
+        """
+        Populates the Pokémon tables from the TSV file ``pokedex``.  The
+        file's compiled index (see `caught.dexindex`) is loaded from the cache
+        or else compiled, validating the whole file, before anything is
+        written to the database, after which the index's entries are streamed
+        into the database in chunks of `LOAD_CHUNK_SIZE`.
+        """
+        if pokedex is None:
+            return
+        self.resolver = None
+        self.objects.discard(Pokemon)
+        dex = load_pokedex(pokedex)
+        if not self.savepoints \
+                and self.conn.total_changes == self.begin_changes:
+            # SQLite only lets the synchronous level be changed outside of a
+            # transaction, so this can only be relaxed if nothing has been
+            # written yet (in which case the empty transaction can be
+            # restarted) and no savepoint (which the restart would release)
+            # is open; it is restored when the transaction ends.
+            self.commit_transaction()
+            self.saved_pragmas.setdefault(
+                'synchronous',
+                self.scalar('PRAGMA synchronous'),
+            )
+            self.conn.execute('PRAGMA synchronous = OFF')
+            self.begin_transaction()
+        # Indexes are rebuilt once at the end of the load rather than being
+        # updated on every insert:
+        indexes = [(ix, ddl) for ix, (tbl, ddl) in INDEXES.items()
+                   if tbl in ('pokemon', 'pokemon_names')]
+        for ix, _ in indexes:
+            self.conn.execute('DROP INDEX IF EXISTS "%s"' % (ix,))
+        for rows in chunked(dex.pokemonRows(), LOAD_CHUNK_SIZE):
+            self.conn.executemany(SQL_INSERT_POKEMON, rows)
+        for rows in chunked(dex.nameRows(), LOAD_CHUNK_SIZE):
+            self.conn.executemany(SQL_INSERT_POKEMON_NAME, rows)
+        for _, ddl in indexes:
+            self.conn.execute(ddl)
+        self.set_dex_digest(dex.digest)
+
+    def get_dex_digest(self):  # internal function
+        """
+        Returns the digest of the Pokédex file that the Pokémon tables match,
+        or `None` if not known
+        """
+        return self.scalar(SQL_DEX_DIGEST)
+
+    def set_dex_digest(self, digest):  # internal function
+        self.conn.execute('DELETE FROM pokedex_source')
+        if digest is not None:
+            self.conn.execute('INSERT INTO pokedex_source (digest) VALUES (?)',
+                              (digest,))
+
+    def write_pokedex_changes(self, new_pokemon, renames, added_names,
+                              removed_names):  # internal function
+        """
+        Applies the changes to the Pokémon tables computed by `update`: the
+        ``(dexno, name)`` pairs in ``new_pokemon`` are inserted into
+        ``pokemon``, those in ``renames`` are updated, and those in
+        ``added_names`` and ``removed_names`` are inserted into & deleted from
+        ``pokemon_names``
+        """
+        self.conn.executemany(SQL_DELETE_POKEMON_NAME, removed_names)
+        self.conn.executemany(SQL_RENAME_POKEMON, [
+            (RENAME_PLACEHOLDER % d, d) for d, _ in renames
+        ])
+        self.conn.executemany(SQL_RENAME_POKEMON, [(n, d) for d, n in renames])
+        self.conn.executemany(SQL_INSERT_POKEMON, new_pokemon)
+        self.conn.executemany(SQL_INSERT_POKEMON_NAME, added_names)
+
+    def newGame(self, game, ignore_dups=False):
+        # `game.gameID` is ignored.
+        if self.scalar(SQL_COUNT_GAME_NAME, (game.name.lower(),)) > 0:
+            raise DuplicateNameError('Game', game.name)
+        gameID = self.conn.execute(SQL_INSERT_GAME, (
+            game.name,
+            game.version,
+            game.player_name,
+            game.dexsize,
+        )).lastrowid
+        usedSynonyms = set()
+        for syn in [game.name] + list(game.synonyms):
+            syn = syn.lower()
+            if syn in usedSynonyms:
+                continue
+            try:
+                self.conn.execute(SQL_INSERT_GAME_NAME, (gameID, syn))
+            except sqlite3.DatabaseError:
+                if not ignore_dups:
+                    raise DuplicateNameError('Game', syn)
+            else:
+                usedSynonyms.add(syn)
+        usedSynonyms.remove(game.name.lower())
+        return Game(gameID, game.name, game.version, game.player_name,
+                    game.dexsize, tuple(sorted(usedSynonyms)))
+
+    def delete_games(self, gameIDs):  # internal function
+        for table in GAME_TABLES:
+            self.conn.execute(
+                'DELETE FROM ' + table + ' WHERE gameID IN ('
+                    + placeholders(len(gameIDs)) + ')',
+                gameIDs,
+            )
+
+    def pokemon_name_dexno(self, name):  # internal function
+        row = self.conn.execute(SQL_NAME_DEXNO, (name.lower(),)).fetchone()
+        if row is None:
+            raise NoSuchPokemonError(name)
+        return row[0]
+
+    def load_pokemon(self, dexno):  # internal function
+        row = self.conn.execute(SQL_POKEMON_NAME, (dexno,)).fetchone()
+        if row is None:
+            raise NoSuchPokemonError(dexno=dexno)
+        return Pokemon(dexno, row[0], self.get_pokemon_names(dexno))
+
+    def iterPokemonRange(self, pokeA, pokeB, maxno=None):
+        pokeA = int(pokeA)
+        pokeB = int(pokeB)
+        if maxno is not None:
+            pokeB = min(pokeB, maxno)
+        return self.iter_pokemon(
+            self.conn.execute(SQL_POKEMON_RANGE, (pokeA, pokeB))
+        )
+
+    def iterAllPokemon(self, maxno=None):
+        if maxno is None:
+            rows = self.conn.execute(SQL_ALL_POKEMON)
+        else:
+            rows = self.conn.execute(SQL_ALL_POKEMON_MAX, (int(maxno),))
+        return self.iter_pokemon(rows)
+
+    def pokemonQty(self):
+        """
+        Returns the largest Pokémon ``dexno`` in the database, i.e., the
+        largest possible ``dexsize`` value
+        """
+        return self.scalar(SQL_MAX_DEXNO)
+
+    def game_name_id(self, name):  # internal function
+        row = self.conn.execute(SQL_NAME_GAMEID, (name.lower(),)).fetchone()
+        if row is None:
+            raise NoSuchGameError(name)
+        return row[0]
+
+    def load_game(self, gameID):  # internal function
+        row = self.conn.execute(SQL_GAME, (gameID,)).fetchone()
+        if row is None:
+            raise NoSuchGameError(gameID=gameID)
+        return Game(*row + (self.get_game_names(gameID),))
+
+    def getGameCounts(self, games=None):
+        """
+        Returns a `dict` mapping the gameID of each game in ``games`` (default:
+        all games) to a ``(caught, owned)`` pair of the number of Pokémon
+        caught but not owned and the number of Pokémon owned in that game.
+
+        If the progress counters are enabled, the counts are read directly
+        from them; otherwise, they are computed with a single query over
+        ``caught``.
+        """
+        if not self.hasProgressCounters():
+            return self.count_caught(games)
+        if games is None:
+            counts = {g: (0, 0) for g, in self.conn.execute(SQL_ALL_GAMEIDS)}
+            rows = self.conn.execute(SQL_PROGRESS)
+        else:
+            counts = {int(g): (0, 0) for g in games}
+            rows = self.select_in(SQL_PROGRESS + ' WHERE gameID IN', counts)
+        for gameID, caught, owned in rows:
+            if gameID in counts:
+                counts[gameID] = (caught, owned)
+        return counts
+
+    def hasProgressCounters(self):
+        """
+        Returns whether the ``game_progress`` counters are enabled in the
+        database
+        """
+        if self.progress is None:
+            self.progress = bool(self.scalar(PROGRESS_EXISTS_SQL))
+        return self.progress
+
+    def enableProgressCounters(self):
+        """
+        Creates the ``game_progress`` table along with the triggers that keep
+        it up to date, and then populates it from ``caught``.  Does nothing
+        if the counters are already enabled.
+        """
+        if self.hasProgressCounters():
+            return
+        self.conn.execute(PROGRESS_DDL)
+        for ddl in PROGRESS_TRIGGERS.values():
+            self.conn.execute(ddl)
+        self.progress = True
+        self.rebuildProgressCounters()
+
+    def disableProgressCounters(self):
+        """ Drops the ``game_progress`` table and its triggers """
+        for trigger in PROGRESS_TRIGGERS:
+            self.conn.execute('DROP TRIGGER IF EXISTS ' + trigger)
+        self.conn.execute('DROP TABLE IF EXISTS game_progress')
+        self.progress = False
+
+    def rebuildProgressCounters(self):
+        """
+        Recomputes the ``game_progress`` counters from ``caught`` and returns
+        the discrepancies found beforehand, as returned by
+        `checkProgressCounters`.  Raises a `RuntimeError` if the counters are
+        not enabled.
+        """
+        mismatches = self.checkProgressCounters()
+        self.conn.execute('DELETE FROM game_progress')
+        self.conn.execute(PROGRESS_REBUILD_SQL)
+        return mismatches
+
+    def checkProgressCounters(self):
+        """
+        Compares the ``game_progress`` counters against the actual contents of
+        ``caught`` and returns a list of ``(gameID, stored, actual)`` triples,
+        one for each game whose stored ``(caught, owned)`` counts (`None` if
+        missing) differ from the actual counts.  Raises a `RuntimeError` if
+        the counters are not enabled.
+        """
+        if not self.hasProgressCounters():
+            raise RuntimeError('Progress counters are not enabled')
+        stored = {gameID: (caught, owned) for gameID, caught, owned
+                  in self.conn.execute(SQL_PROGRESS)}
+        return [(gameID, stored.get(gameID), counts)
+                for gameID, counts in sorted(self.count_caught().items())
+                if stored.get(gameID) != counts]
+
+    def hasChangeLog(self):
+        """ Returns whether the ``status_changes`` log is enabled """
+        if self.changelog is None:
+            self.changelog = bool(self.scalar(CHANGE_LOG_EXISTS_SQL))
+        return self.changelog
+
+    def enableChangeLog(self):
+        """
+        Creates the ``status_changes`` table along with the triggers that
+        append to it whenever a status changes.  Only changes made from then
+        on are logged.  Does nothing if the log is already enabled.
+        """
+        if self.hasChangeLog():
+            return
+        self.conn.execute(CHANGE_LOG_DDL)
+        for ddl in CHANGE_LOG_TRIGGERS.values():
+            self.conn.execute(ddl)
+        self.changelog = True
+
+    def disableChangeLog(self):
+        """ Drops the ``status_changes`` table and its triggers """
+        for trigger in CHANGE_LOG_TRIGGERS:
+            self.conn.execute('DROP TRIGGER IF EXISTS ' + trigger)
+        self.conn.execute('DROP TABLE IF EXISTS status_changes')
+        self.changelog = False
+
+    def lastChangeSeq(self):
+        """
+        Returns the sequence number of the latest entry in the change log, or
+        0 if it is empty.  Raises a `RuntimeError` if the change log is not
+        enabled.
+        """
+        if not self.hasChangeLog():
+            raise RuntimeError('Change log is not enabled')
+        return self.scalar(SQL_LAST_CHANGE) or 0
+
+    def change_rows(self, seq, gameIDs=None):  # internal function
+        if gameIDs is None:
+            return self.conn.execute(SQL_CHANGES + ' ORDER BY seq', (seq,))
+        else:
+            return self.conn.execute(
+                SQL_CHANGES + ' AND gameID IN (' + placeholders(len(gameIDs))
+                    + ') ORDER BY seq',
+                [seq] + gameIDs,
+            )
+
+    def count_caught(self, games=None):  # internal function
+        """
+        Computes the values returned by `getGameCounts` with a single query
+        over ``caught``
+        """
+        if games is None:
+            counts = {g: [0, 0] for g, in self.conn.execute(SQL_ALL_GAMEIDS)}
+            rows = self.conn.execute(SQL_COUNT_CAUGHT)
+        else:
+            counts = {int(g): [0, 0] for g in games}
+            rows = self.select_in(
+                'SELECT gameID, status, count(*) FROM caught WHERE gameID IN',
+                counts,
+                ' GROUP BY gameID, status',
+            )
+        for gameID, status, qty in rows:
+            if gameID in counts:
+                if status == CAUGHT:
+                    counts[gameID][0] = qty
+                elif status == OWNED:
+                    counts[gameID][1] = qty
+        return {gameID: tuple(c) for gameID, c in counts.items()}
+
+    def iterAllGames(self):
+        synonyms = self.get_all_game_names()
+        return (Game(*row + (synonyms[row[0]],))
+                for row in self.conn.execute(SQL_ALL_GAMES))
+
+    def getStatus(self, game, poke):
+        row = self.conn.execute(SQL_STATUS, (int(game), int(poke))).fetchone()
+        return Status.UNCAUGHT if row is None else Status.fromValue(row[0])
+
+    def iterStatusRange(self, game, start=None, end=None):  # inclusive range
+        game, start, end = self.status_range_bounds(game, start, end)
+        return (
+            (poke, Status.fromValue(status))
+            for poke, (status,) in self.fetch_pokemon(self.conn.execute(
+                SQL_STATUS_RANGE,
+                (int(game), start, end),
+            ))
+        )
+
+    def iterByStatus(self, game, status, maxno=None):
+        status = int(status)
+        maxno = MAX_DEXNO if maxno is None else int(maxno)
+        if status == UNCAUGHT:
+            rows = self.conn.execute(SQL_UNCAUGHT, (int(game), maxno))
+        else:
+            rows = self.conn.execute(SQL_BY_STATUS, (int(game), status, maxno))
+        return self.iter_pokemon(rows)
+
+    def iterCaught(self, games=None):
+        """
+        Returns an iterator of ``(gameID, dexno, status)`` triples for every
+        Pokémon caught or owned in ``games`` (default: all games), ordered by
+        gameID and then dexno, read lazily from the database
+        """
+        if games is None:
+            r = self.conn.execute(SQL_CAUGHT_ROWS + ' ORDER BY gameID, dexno')
+        else:
+            games = [int(g) for g in games]
+            r = self.conn.execute(
+                SQL_CAUGHT_ROWS + ' WHERE gameID IN ('
+                    + placeholders(len(games)) + ') ORDER BY gameID, dexno',
+                games,
+            )
+        return ((gameID, dexno, Status.fromValue(status))
+                for gameID, dexno, status in r)
+
+    def getStatuses(self, game, pokemon):
+        """
+        Returns a `dict` mapping the dexno of each Pokémon in ``pokemon`` (an
+        iterable of `Pokemon` objects and/or dexnos) to its `Status` in
+        ``game``.  The statuses are fetched with a single query per
+        `RANGE_CHUNK_SIZE` runs of consecutive dexnos.
+        """
+        statuses = {int(p): Status.UNCAUGHT for p in pokemon}
+        for pred, params in range_predicates('dexno', statuses):
+            for dexno, status in self.conn.execute(
+                'SELECT dexno, status FROM caught WHERE gameID = ? AND '
+                    + pred,
+                [int(game)] + params,
+            ):
+                statuses[dexno] = Status.fromValue(status)
+        return statuses
+
+    def setStatus(self, game, poke, status):
+        status = check_status(status)
+        if status == UNCAUGHT:
+            self.conn.execute(SQL_DELETE_STATUS, (int(game), int(poke)))
+        else:
+            self.conn.execute(SQL_UPSERT_STATUS, (int(game), int(poke), status))
+
+    def setStatusMany(self, game, pokemon, status):
+        """
+        Sets the status of every Pokémon in ``pokemon`` (an iterable of
+        `Pokemon` objects and/or dexnos) in ``game`` to ``status`` using one
+        statement per `RANGE_CHUNK_SIZE` runs of consecutive dexnos
+        """
+        status = check_status(status)
+        if status == UNCAUGHT:
+            for pred, params in range_predicates('dexno', pokemon):
+                self.conn.execute(
+                    'DELETE FROM caught WHERE gameID = ? AND ' + pred,
+                    [int(game)] + params,
+                )
+        else:
+            for pred, params in range_predicates('dexno', pokemon):
+                self.conn.execute(
+                    'INSERT INTO caught (gameID, dexno, status)'
+                    ' SELECT ?, dexno, ? FROM pokemon WHERE ' + pred +
+                    ' ON CONFLICT (gameID, dexno)'
+                    ' DO UPDATE SET status = excluded.status',
+                    [int(game), status] + params,
+                )
+
+    def write_status_rows(self, upserts, deletes, keep_best=False):  # internal function
+        """
+        Upserts the ``(gameID, dexno, status)`` triples in ``upserts`` into
+        ``caught`` (keeping the existing status where it is better if
+        ``keep_best`` is true) and deletes the ``(gameID, dexno)`` pairs in
+        ``deletes``, with one ``executemany`` call each
+        """
+        if upserts:
+            self.conn.executemany(
+                SQL_MERGE_STATUS if keep_best else SQL_UPSERT_STATUS,
+                upserts,
+            )
+        if deletes:
+            self.conn.executemany(SQL_DELETE_STATUS, deletes)
+
+    def upsert_progress(self, sources, dst, keep_best):  # internal function
+        """
+        Copies the best status of each Pokémon in the games with gameIDs
+        ``sources`` to game ``dst`` (up to its dexsize), keeping ``dst``'s
+        status where it is better if ``keep_best`` is true, and returns the
+        number of rows inserted or changed
+        """
+        sql = SQL_UPSERT_PROGRESS.format(
+            sources = placeholders(len(sources)),
+            update  = SQL_KEEP_BEST if keep_best else SQL_OVERWRITE,
+        )
+        return self.conn.execute(sql, [dst, dst] + list(sources)).rowcount
+
+    def clear_progress(self, src, dst):  # internal function
+        """
+        Marks uncaught every Pokémon in game ``dst`` that is not caught or
+        owned in game ``src`` within ``dst``'s dexsize, and returns the number
+        of statuses changed
+        """
+        return self.conn.execute(SQL_CLEAR_PROGRESS, (dst, dst, src)).rowcount
+
+    def markCaught(self, game, poke):  # uncaught → caught
+        self.conn.execute(SQL_INSERT_CAUGHT, (int(game), int(poke)))
+
+    def markCaughtMany(self, game, pokemon):  # uncaught → caught
+        for pred, params in range_predicates('dexno', pokemon):
+            self.conn.execute(
+                'INSERT INTO caught (gameID, dexno, status)'
+                ' SELECT ?, dexno, ? FROM pokemon WHERE ' + pred +
+                ' ON CONFLICT DO NOTHING',
+                [int(game), CAUGHT] + params,
+            )
+
+    def markReleased(self, game, poke):  # owned → caught
+        self.conn.execute(SQL_RELEASE, (int(game), int(poke)))
+
+    def markReleasedMany(self, game, pokemon):  # owned → caught
+        for pred, params in range_predicates('dexno', pokemon):
+            self.conn.execute(
+                'UPDATE caught SET status = ?'
+                ' WHERE gameID = ? AND status = ? AND ' + pred,
+                [CAUGHT, int(game), OWNED] + params,
+            )
+
+    def status_matrix_rows(self, games, maxno=None, dexnos=None):  # internal function
+        """
+        Returns the rows of the query behind `getStatusMatrix` for either all
+        Pokémon up to ``maxno`` in dexno order or for the given dexnos (in
+        any order).  Each row consists of a dexno, a name, and a status value
+        (or `None`) for each game.
+        """
+        columns = ['pokemon.dexno', 'pokemon.name']
+        params = []
+        for g in games:
+            columns.append(
+                'CASE WHEN pokemon.dexno <= ? THEN IFNULL(max(CASE WHEN'
+                ' caught.gameID = ? THEN caught.status END), ?) END'
+            )
+            params.extend([g.dexsize, int(g), UNCAUGHT])
+        sql = 'SELECT ' + ', '.join(columns) + ' FROM pokemon' \
+              ' LEFT OUTER JOIN caught ON caught.dexno = pokemon.dexno' \
+              ' AND caught.gameID IN (' + placeholders(len(games)) + ')'
+        params.extend(int(g) for g in games)
+        if dexnos is None:
+            sql += ' WHERE pokemon.dexno <= ?' \
+                   ' GROUP BY pokemon.dexno ORDER BY pokemon.dexno'
+            params.append(maxno)
+        else:
+            sql += ' WHERE pokemon.dexno IN (' + placeholders(len(dexnos)) \
+                 + ') GROUP BY pokemon.dexno'
+            params.extend(dexnos)
+        return self.conn.execute(sql, params)
+
+    def status_expr_rows(self, expr, maxno):  # internal function
+        """
+        Returns the ``(dexno, name)`` rows, in dexno order, of the Pokémon up
+        to ``maxno`` that satisfy the parsed status expression ``expr``
+        """
+        params = [maxno]
+        sql = 'SELECT pokemon.dexno, pokemon.name FROM pokemon' \
+              ' WHERE pokemon.dexno <= ? AND ' \
+              + status_expr_sql(expr, params, count()) \
+              + ' ORDER BY pokemon.dexno'
+        return self.conn.execute(sql, params)
+
+    def get_pokemon_names(self, dexno):  # internal function
+        return [n for n, in self.conn.execute(SQL_POKEMON_NAMES, (dexno,))]
+
+    def get_game_names(self, gameID):  # internal function
+        return [n for n, in self.conn.execute(SQL_GAME_NAMES, (gameID,))]
+
+    def get_pokemon_names_range(self, start=None, end=None):  # internal function
+        """
+        Returns a `dict` mapping each dexno in the inclusive range from
+        ``start`` to ``end`` (either of which may be `None` to leave that side
+        unbounded) to the sorted list of its names, fetched with a single
+        query.  Dexnos without any names map to an empty list.
+        """
+        return group_names(self.conn.execute(SQL_POKEMON_NAMES_RANGE, (
+            MIN_DEXNO if start is None else int(start),
+            MAX_DEXNO if end is None else int(end),
+        )))
+
+    def get_pokemon_names_in(self, dexnos):  # internal function
+        """
+        Returns a `dict` mapping each of the given dexnos (in increasing
+        order) to the sorted list of its names, fetched `IN_CHUNK_SIZE`
+        dexnos at a time.  Dexnos without any names map to an empty list.
+        """
+        return group_names(self.select_in(
+            SQL_POKEMON_NAMES_IN, dexnos, ' ORDER BY dexno, name',
+        ))
+
+    def get_all_game_names(self):  # internal function
+        """
+        Returns a `dict` mapping each gameID to the sorted list of its names,
+        fetched with a single query
+        """
+        return group_names(self.conn.execute(SQL_ALL_GAME_NAMES))
+
+    def scalar(self, sql, params=()):  # internal function
+        """
+        Returns the first column of the first row returned by ``sql``, or
+        `None` if there are no rows
+        """
+        row = self.conn.execute(sql, params).fetchone()
+        return None if row is None else row[0]
+
+    def select_in(self, sql, values, suffix=''):  # internal function
+        """
+        Yields the rows of ``sql + ' (?, ...)' + suffix`` for ``values`` split
+        into chunks of at most `IN_CHUNK_SIZE`
+        """
+        values = list(values)
+        for i in range(0, len(values), IN_CHUNK_SIZE):
+            chunk = values[i:i+IN_CHUNK_SIZE]
+            for row in self.conn.execute(
+                sql + ' (' + placeholders(len(chunk)) + ')' + suffix,
+                chunk,
+            ):
+                yield row
+
+
+def placeholders(n):
+    """ Returns a comma-separated list of ``n`` SQL parameter placeholders """
+    return ', '.join(['?'] * n)
+
+def status_expr_sql(expr, params, aliases):
+    """
+    Compiles a parsed status expression into a SQL condition over
+    ``pokemon`` that is true for the Pokémon satisfying it, appending its
+    parameters to ``params``.  Each atom becomes an ``EXISTS`` over
+    ``caught`` (or, for ``*``, over ``games``) correlated with the enclosing
+    query; ``aliases`` is an iterator of integers used to give each subquery
+    a distinct table alias.
+    """
+    if isinstance(expr, (And, Or)):
+        op = ' AND ' if isinstance(expr, And) else ' OR '
+        return '(' + op.join(status_expr_sql(e, params, aliases)
+                             for e in expr.args) + ')'
+    elif isinstance(expr, Not):
+        return 'NOT ' + status_expr_sql(expr.arg, params, aliases)
+    elif expr.game == ALL_GAMES:
+        every = 'games_%d' % (next(aliases),)
+        in_dex = 'EXISTS (SELECT 1 FROM games AS {0}' \
+                 ' WHERE {0}.dexsize >= pokemon.dexno'.format(every)
+        others = frozenset(Status.STATUSES) - expr.statuses
+        return '(' + in_dex + ') AND NOT ' + in_dex + ' AND ' \
+             + status_in_sql(others, every + '.gameID', params, aliases) + '))'
+    else:
+        params.append(expr.game.dexsize)
+        return '(pokemon.dexno <= ? AND ' \
+             + status_in_sql(expr.statuses, int(expr.game), params, aliases) \
+             + ')'
+
+def status_in_sql(statuses, game, params, aliases):
+    """
+    Returns a SQL condition that is true for the Pokémon in ``pokemon`` whose
+    status in ``game`` (a gameID or a SQL column expression) is one of
+    ``statuses``, appending its parameters to ``params``
+    """
+    wanted = set(int(s) for s in statuses)
+    if not wanted:
+        return '0'
+    elif len(wanted) == len(Status.STATUSES):
+        return '1'
+    negate = UNCAUGHT in wanted
+    if negate:
+        # A Pokémon is uncaught if it has no row in `caught`, so match the
+        # Pokémon that do not have one of the other statuses instead:
+        wanted = set(int(s) for s in Status.STATUSES) - wanted
+    if isinstance(game, int):
+        params.append(game)
+        game = '?'
+    params.extend(sorted(wanted))
+    return '{0}EXISTS (SELECT 1 FROM caught AS {1} WHERE {1}.gameID = {2}' \
+           ' AND {1}.dexno = pokemon.dexno AND {1}.status IN ({3}))'.format(
+               'NOT ' if negate else '',
+               'caught_%d' % (next(aliases),),
+               game,
+               placeholders(len(wanted)),
+           )
+
+
+def range_predicates(column, pokemon):
+    """
+    Returns a list of ``(sql, params)`` pairs of SQL expressions and their
+    parameters that together match ``column`` against every dexno in
+    ``pokemon``, each one covering at most `RANGE_CHUNK_SIZE` runs of
+    consecutive dexnos
+    """
+    ranges = dexno_ranges(pokemon)
+    preds = []
+    for i in range(0, len(ranges), RANGE_CHUNK_SIZE):
+        terms, params = [], []
+        for start, end in ranges[i:i+RANGE_CHUNK_SIZE]:
+            if start == end:
+                terms.append(column + ' = ?')
+                params.append(start)
+            else:
+                terms.append(column + ' BETWEEN ? AND ?')
+                params.extend([start, end])
+        preds.append(('(' + ' OR '.join(terms) + ')', params))
+    return preds
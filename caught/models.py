@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+The data types & exceptions used by `caught`.  This module does not depend on
+SQLAlchemy so that it can be imported cheaply.
+"""
+from   bisect import bisect_left, bisect_right
+from   collections import namedtuple
+import json
+
+class Status(namedtuple('Status', 'value name checks')):
+    __slots__ = ()
+
+    def __int__(self):
+        return self.value
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return self.__class__.__name__ + '.' + self.name.upper()
+
+    @classmethod
+    def fromValue(cls, val):
+        return cls.STATUSES[val]
+
+    @classmethod
+    def fromName(cls, name):
+        return cls.BY_NAME[name]
+
+### TODO: Improve the checkmarks:
+Status.UNCAUGHT = Status(0, 'uncaught', '  ')
+Status.CAUGHT = Status(1, 'caught', '✓ ')
+Status.OWNED = Status(2, 'owned', '✓✓')
+Status.STATUSES = (Status.UNCAUGHT, Status.CAUGHT, Status.OWNED)
+Status.BY_NAME = {s.name: s for s in Status.STATUSES}
+Status.CHECKS_LEN = 2
+
+
+class Game(namedtuple('Game', 'gameID name version player_name dexsize synonyms')):
+    # `version` and `player_name` are the only attributes that should ever be
+    # `None`.
+    __slots__ = ()
+
+    def __int__(self):
+        return self.gameID
+
+    def __str__(self):
+        return self.name
+
+    def asYAML(self, caught_or_owned=None, owned=None):
+        version = 'null' if self.version is None else self.version
+        player_name = 'null' if self.player_name is None else self.player_name
+        yml = '''
+- game ID: %d
+  name: %s
+  version: %s
+  player name: %s
+  dexsize: %d
+  synonyms:
+%s
+'''.strip() % (self.gameID, self.name, version, player_name, self.dexsize,
+               ''.join('    - ' + syn + '\n' for syn in self.synonyms))
+        if caught_or_owned is not None:
+            yml += '  caught or owned: ' + str(caught_or_owned) + '\n'
+        if owned is not None:
+            yml += '  owned: ' + str(owned) + '\n'
+        return yml
+
+    def asDict(self, caught_or_owned=None, owned=None):
+        d = {
+                "game ID":     self.gameID,
+                "name":        self.name,
+                "version":     self.version,
+                "player name": self.player_name,
+                "dexsize":     self.dexsize,
+                "synonyms":    list(self.synonyms)
+            }
+        if caught_or_owned is not None:
+            d["caught or owned"] = caught_or_owned
+        if owned is not None:
+            d["owned"] = owned
+        return d
+
+    def asJSON(self, caught_or_owned=None, owned=None):
+        return json.dumps(self.asDict(caught_or_owned, owned))
+
+
+class Pokemon(namedtuple('Pokemon', 'dexno name synonyms')):
+    __slots__ = ()
+
+    def __int__(self):
+        return self.dexno
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def fromTSVFile(cls, pokedex):
+        for _, poke in cls.readTSVFile(pokedex):
+            yield poke
+
+    @classmethod
+    def readTSVFile(cls, pokedex):
+        """
+        Like `fromTSVFile`, but yields ``(lineno, pokemon)`` pairs so that
+        callers can report where in the file a problem occurs
+        """
+        with open(pokedex) as dex:
+            for (lineno, line) in enumerate(dex, start=1):
+                line = line.strip()
+                if line == '' or line[0] == '#':
+                    continue
+                fields = line.split('\t')
+                if len(fields) < 2:
+                    raise MalformedFileError(pokedex, lineno, 'too few fields')
+                try:
+                    dexno = int(fields[0])
+                except ValueError:
+                    raise MalformedFileError(pokedex, lineno,
+                                             fields[0] + ': not a number')
+                yield (lineno, cls(dexno, fields[1], tuple(fields[2:])))
+
+
+class NameResolver(object):
+    """
+    An in-memory index of a Pokédex for resolving Pokémon names, dexnos, and
+    ranges without querying the database.  ``pokemon`` must be an iterable of
+    `Pokemon` objects whose ``synonyms`` contain all of their lowercased names,
+    as returned by `CaughtDB.allPokemon`.
+    """
+
+    def __init__(self, pokemon):
+        self.byDexno = {}
+        self.byName = {}
+        for poke in pokemon:
+            self.byDexno[poke.dexno] = poke
+            for name in poke.synonyms:
+                self.byName[name] = poke.dexno
+        self.dexnos = sorted(self.byDexno)
+
+    def findDexno(self, name):
+        """
+        Returns the dexno of the Pokémon with the given name, or `None` if
+        there is no such Pokémon
+        """
+        return self.byName.get(name.lower())
+
+    def getPokemon(self, name):
+        """
+        Returns the `Pokemon` object for the Pokémon with the given name.
+        Raises a `NoSuchPokemonError` if there is no such Pokémon.
+        """
+        dexno = self.findDexno(name)
+        if dexno is None:
+            raise NoSuchPokemonError(name)
+        return self.getPokemonByDexno(dexno)
+
+    def getPokemonByDexno(self, dexno):
+        try:
+            return self.byDexno[int(dexno)]
+        except KeyError:
+            raise NoSuchPokemonError(dexno=int(dexno))
+
+    def getPokemonRange(self, pokeA, pokeB, maxno=None):
+        pokeA = int(pokeA)
+        pokeB = int(pokeB)
+        if maxno is not None:
+            pokeB = min(pokeB, maxno)
+        return [self.byDexno[d] for d in self.dexnos[
+            bisect_left(self.dexnos, pokeA):bisect_right(self.dexnos, pokeB)
+        ]]
+
+    def resolve(self, spec, maxno=None):
+        """
+        Returns a list of the `Pokemon` objects specified by ``spec``, which
+        is either a single Pokémon name or dexno or a range of Pokémon given
+        as two names and/or dexnos separated by a hyphen.  Raises a
+        `NoSuchPokemonError` if ``spec`` cannot be resolved.
+        """
+        try:
+            return [self.getPokemon(spec)]
+        except NoSuchPokemonError as e:
+            i = spec.find('-')
+            while i != -1:
+                if 0 < i < len(spec)-1:
+                    a = self.findDexno(spec[:i])
+                    b = self.findDexno(spec[i+1:])
+                    if a is not None and b is not None:
+                        return self.getPokemonRange(a, b, maxno)
+                i = spec.find('-', i+1)
+            raise e
+
+
+class CaughtDBError(Exception):
+    pass
+
+
+class NoSuchGameError(CaughtDBError, LookupError):
+    def __init__(self, name=None, gameID=None):
+        self.name = name
+        self.gameID = gameID
+        super(NoSuchGameError, self).__init__(name, gameID)
+
+    def __str__(self):
+        if self.gameID is None:
+            return 'No such game name: %r' % (self.name,)
+        else:
+            return 'No such gameID: %d' % (self.gameID,)
+
+
+class NoSuchPokemonError(CaughtDBError, LookupError):
+    def __init__(self, name=None, dexno=None):
+        self.name = name
+        self.dexno = dexno
+        super(NoSuchPokemonError, self).__init__(name, dexno)
+
+    def __str__(self):
+        if self.dexno is None:
+            return 'No such Pokémon name: %r' % (self.name,)
+        else:
+            return 'No such dexno: %d' % (self.dexno,)
+
+
+class MalformedFileError(CaughtDBError, ValueError):
+    def __init__(self, filename, lineno, reason):
+        self.filename = filename
+        self.lineno = lineno
+        self.reason = reason
+        super(MalformedFileError, self).__init__(filename, lineno, reason)
+
+    def __str__(self):
+        return '%s: line %d: %s' % (self.filename, self.lineno, self.reason)
+
+
+class DuplicateNameError(CaughtDBError, ValueError):
+    def __init__(self, objType, name):
+        self.objType = objType
+        self.name = name
+        super(DuplicateNameError, self).__init__(objType, name)
+
+    def __str__(self):
+        return 'Duplicate %s name: %r' % (self.objType, self.name)
+
+
+class SchemaVersionError(CaughtDBError):
+    def __init__(self, version, supported):
+        self.version = version
+        self.supported = supported
+        super(SchemaVersionError, self).__init__(version, supported)
+
+    def __str__(self):
+        return 'Database schema version %d is newer than the supported'\
+               ' version %d' % (self.version, self.supported)
+
+
+class DatabaseLockedError(CaughtDBError):
+    def __init__(self, attempts):
+        self.attempts = attempts
+        super(DatabaseLockedError, self).__init__(attempts)
+
+    def __str__(self):
+        return 'Database is locked by another connection (gave up after %d'\
+               ' attempts)' % (self.attempts,)
+
+
+def check_pokedex(pokedex):
+    """
+    Reads through the entire TSV file ``pokedex`` and raises a
+    `MalformedFileError` if it cannot be parsed or if any dexno or
+    (case-insensitive) name is used more than once
+    """
+    for _ in read_pokedex(pokedex):
+        pass
+
+def read_pokedex(pokedex):
+    """
+    Like `Pokemon.readTSVFile`, but yields ``(lineno, pokemon, names)``
+    triples, where ``names`` is a list of all of the Pokémon's lowercased
+    names (including its dexno), and raises a `MalformedFileError` as soon as
+    a dexno or (case-insensitive) name is used for a second time
+    """
+    dexnos = set()
+    seen = set()
+    for lineno, poke in Pokemon.readTSVFile(pokedex):
+        if poke.dexno in dexnos:
+            raise MalformedFileError(pokedex, lineno,
+                                     '%d: duplicate dexno' % (poke.dexno,))
+        dexnos.add(poke.dexno)
+        names = []
+        for name in (str(poke.dexno), poke.name) + poke.synonyms:
+            name = name.lower()
+            if name in seen:
+                raise MalformedFileError(pokedex, lineno,
+                                         name + ': duplicate name')
+            seen.add(name)
+            names.append(name)
+        yield (lineno, poke, names)
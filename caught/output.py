@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Writers for the tabular output of ``caught get`` and ``caught stats``.  Each
+row is formatted in full and written to the output stream with a single
+`write` call; the stream is only flushed once the table is finished.
+"""
+import json
+import click
+
+#: The available output formats
+FORMATS = ('table', 'json', 'tsv', 'ndjson')
+
+#: The formats meant to be read by other programs, which give each key column
+#: its own field and do not pad their values
+MACHINE_FORMATS = ('tsv', 'ndjson')
+
+def Tabulator(minlengths, fmt='table', keys=('name',), group=None, out=None):
+    """
+    Returns a writer for a table in the given format.  Each row consists of
+    the values of the key columns named by ``keys`` followed by one value for
+    each heading passed to the writer's ``header()`` method.
+
+    ``minlengths`` gives the minimum width of each column in the ``table``
+    format, in which all of the key columns are expected to be combined into
+    one.  The ``json`` format likewise expects a single key column and
+    outputs an object mapping each row's key to an object of its values.
+
+    The ``tsv`` format outputs a line of tab-separated column names followed
+    by a line of tab-separated values for each row.  The ``ndjson`` format
+    outputs one JSON object per row, mapping each of ``keys`` and the
+    headings to their values; if ``group`` is given, the values for the
+    headings are instead nested in an object under that name.
+
+    Output is written to ``out`` (default: standard output).
+    """
+    if out is None:
+        out = click.get_text_stream('stdout')
+    if fmt == 'table':
+        return TableWriter(out, minlengths)
+    elif fmt == 'json':
+        return JSONWriter(out)
+    elif fmt == 'tsv':
+        return TSVWriter(out, keys)
+    elif fmt == 'ndjson':
+        return NDJSONWriter(out, keys, group)
+    else:
+        raise ValueError('%s: unknown output format' % (fmt,))
+
+
+class RowWriter(object):
+    def __init__(self, out):
+        self.out = out
+        self.started = False
+
+    def header(self, heads):
+        self.started = True
+        self.write_header([from_bytes(h) for h in heads])
+
+    def row(self, values):
+        if not self.started:
+            raise RuntimeError('Tabulator.row() called before Tabulator.header()')
+        self.out.write(self.format_row(list(values)))
+
+    def end(self):
+        self.write_end()
+        self.out.flush()
+
+    def write_header(self, heads):
+        pass
+
+    def format_row(self, values):
+        raise NotImplementedError
+
+    def write_end(self):
+        pass
+
+
+class TableWriter(RowWriter):
+    """ Fixed-width columns separated by ``|`` """
+
+    def __init__(self, out, minlengths):
+        super(TableWriter, self).__init__(out)
+        self.minlengths = tuple(minlengths)
+        self.widths = None
+
+    def write_header(self, heads):
+        minlengths = list(self.minlengths[1:]) + [0] * len(heads)
+        self.widths = [self.minlengths[0]] + [
+            max(len(h), ml) for h, ml in zip(heads, minlengths)
+        ]
+        self.out.write(
+            ' ' * self.widths[0]
+            + ''.join(u'|%-*s' % (w, h) for w, h in zip(self.widths[1:], heads))
+            + '\n'
+            + '|'.join('-' * w for w in self.widths)
+            + '\n'
+        )
+
+    def format_row(self, values):
+        values += [None] * (len(self.widths) - len(values))
+        return '|'.join(
+            u'%-*s' % (width, from_bytes(val) or '')
+            for val, width in zip(values, self.widths)
+        ) + '\n'
+
+
+class JSONEncoderCache(object):
+    """
+    Encodes scalar values as JSON, remembering the encodings of values seen
+    before, as tables contain few distinct values
+    """
+
+    def __init__(self):
+        self.encoded = {}
+
+    def __call__(self, value):
+        try:
+            return self.encoded[value]
+        except KeyError:
+            s = self.encoded[value] = json.dumps(value)
+            return s
+
+
+class JSONWriter(RowWriter):
+    """
+    A single JSON object mapping each row's key to an object of its values,
+    written incrementally one row at a time
+    """
+
+    def __init__(self, out):
+        super(JSONWriter, self).__init__(out)
+        self.encode = JSONEncoderCache()
+        self.prefixes = None
+        self.sep = ''
+
+    def write_header(self, heads):
+        self.prefixes = [json.dumps(h) + ': ' for h in heads]
+        self.out.write('{')
+
+    def format_row(self, values):
+        encode = self.encode
+        # JSON object keys must be strings:
+        key = encode(u'%s' % (from_bytes(values[0]),))
+        fields = pad(values[1:], len(self.prefixes))
+        s = self.sep + key + ':{' + ', '.join(
+            p + encode(from_bytes(v)) for p, v in zip(self.prefixes, fields)
+        ) + '}'
+        self.sep = ','
+        return s
+
+    def write_end(self):
+        self.out.write('}\n')
+
+
+class TSVWriter(RowWriter):
+    """ Tab-separated values, preceded by a line of column names """
+
+    def __init__(self, out, keys):
+        super(TSVWriter, self).__init__(out)
+        self.keys = list(keys)
+
+    def write_header(self, heads):
+        self.out.write('\t'.join(self.keys + heads) + '\n')
+
+    def format_row(self, values):
+        return '\t'.join(tsv_field(v) for v in values) + '\n'
+
+
+class NDJSONWriter(RowWriter):
+    """ One JSON object per line for each row """
+
+    def __init__(self, out, keys, group=None):
+        super(NDJSONWriter, self).__init__(out)
+        self.keys = [json.dumps(k) + ': ' for k in keys]
+        self.group = group
+        self.encode = JSONEncoderCache()
+        self.prefixes = None
+
+    def write_header(self, heads):
+        self.prefixes = [json.dumps(h) + ': ' for h in heads]
+
+    def format_row(self, values):
+        encode = self.encode
+        nkeys = len(self.keys)
+        fields = [k + encode(from_bytes(v))
+                  for k, v in zip(self.keys, values[:nkeys])]
+        heads = [p + encode(from_bytes(v)) for p, v in
+                 zip(self.prefixes, pad(values[nkeys:], len(self.prefixes)))]
+        if self.group is not None:
+            fields.append(
+                json.dumps(self.group) + ': {' + ', '.join(heads) + '}'
+            )
+        else:
+            fields.extend(heads)
+        return '{' + ', '.join(fields) + '}\n'
+
+
+def pad(values, length):
+    """ Pads or truncates the list ``values`` with `None`s to ``length`` """
+    return (values + [None] * length)[:length]
+
+def tsv_field(value):
+    """
+    Formats a value as a TSV field, with `None` as the empty string and with
+    backslashes, tabs, and newlines escaped
+    """
+    if value is None:
+        return ''
+    return (u'%s' % (from_bytes(value),)).replace('\\', '\\\\')\
+                                        .replace('\t', '\\t')\
+                                        .replace('\n', '\\n')
+
+def from_bytes(s):
+    return s.decode('utf-8') if isinstance(s, bytes) else s
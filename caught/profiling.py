@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Per-statement SQL profiling, as enabled by `CaughtDBBase.startProfiling` and
+``caught --trace-sql``.  For every distinct SQL statement executed, a
+`QueryProfiler` records how many times it was run, the total and 95th
+percentile time taken to execute it and fetch its results, the number of rows
+returned (or, for statements that change the database, affected), and which
+`CaughtDB` methods issued it.  Statements that differ only in the number of
+parameters in a list (e.g., an ``IN (?, ?, ?)``) are counted together.
+
+Like `caught.base`, this module does not depend on SQLAlchemy.
+"""
+from   collections import Counter
+import json
+import re
+import sys
+from   timeit import default_timer
+
+#: Number of characters of each statement to show in `QueryProfiler.report`
+STATEMENT_WIDTH = 72
+
+PARAM_LIST_RGX = re.compile(r'\?(?:\s*,\s*\?)+')
+
+def normalize_sql(statement):
+    """
+    Collapses whitespace and lists of parameters in ``statement`` so that
+    executions of the same statement are counted together
+    """
+    return PARAM_LIST_RGX.sub('?, ...', ' '.join(statement.split()))
+
+def percentile(times, p):
+    """ Returns the ``p``-th quantile of the list of numbers ``times`` """
+    if not times:
+        return 0.0
+    times = sorted(times)
+    return times[min(int(len(times) * p), len(times) - 1)]
+
+
+class StatementStats(object):
+    """ The accumulated statistics for one statement """
+
+    def __init__(self):
+        self.times = []
+        self.rows = 0
+        self.callers = Counter()
+
+    @property
+    def count(self):
+        return len(self.times)
+
+    @property
+    def total(self):
+        return sum(self.times)
+
+    @property
+    def p95(self):
+        return percentile(self.times, 0.95)
+
+
+class QueryProfiler(object):
+    """
+    Collects statistics on the SQL statements executed on behalf of a
+    database.  Backends call `record` after each statement.
+    """
+
+    def __init__(self):
+        #: The database being profiled, used to find the methods issuing
+        #: statements
+        self.db = None
+        #: A mapping from normalized statements to `StatementStats`
+        self.statements = {}
+
+    def record(self, statement, seconds, rows):
+        """
+        Records an execution of ``statement`` that took ``seconds`` and
+        returned or affected ``rows`` rows (`None` if unknown)
+        """
+        key = normalize_sql(statement)
+        try:
+            stats = self.statements[key]
+        except KeyError:
+            stats = self.statements[key] = StatementStats()
+        stats.times.append(seconds)
+        if rows is not None and rows > 0:
+            stats.rows += rows
+        stats.callers[self.caller()] += 1
+
+    def caller(self):  # internal function
+        """
+        Returns a description of the database methods on the call stack: the
+        outermost one, followed by the innermost one if different, e.g.,
+        ``getPokemon > get_pokemon_names``
+        """
+        methods = []
+        frame = sys._getframe(1)
+        while frame is not None:
+            code = frame.f_code
+            if code.co_varnames[:1] == ('self',) \
+                    and frame.f_locals.get('self') is self.db:
+                methods.append(code.co_name)
+            frame = frame.f_back
+        if not methods:
+            return '?'
+        elif len(methods) == 1 or methods[0] == methods[-1]:
+            return methods[-1]
+        else:
+            return '%s > %s' % (methods[-1], methods[0])
+
+    @property
+    def total_statements(self):
+        return sum(s.count for s in self.statements.values())
+
+    @property
+    def total_time(self):
+        return sum(s.total for s in self.statements.values())
+
+    def asDict(self):
+        """
+        Returns the statistics as a JSON-serializable `dict`, with the
+        statements listed in decreasing order of total time
+        """
+        return {
+            "statements": self.total_statements,
+            "seconds": self.total_time,
+            "queries": [
+                {
+                    "sql": sql,
+                    "count": stats.count,
+                    "total_seconds": stats.total,
+                    "p95_seconds": stats.p95,
+                    "rows": stats.rows,
+                    "callers": dict(stats.callers),
+                } for sql, stats in self.sorted_statements()
+            ],
+        }
+
+    def dump_json(self, fp):
+        json.dump(self.asDict(), fp, indent=4)
+        fp.write('\n')
+
+    def report(self, out):
+        """
+        Writes a table of the statistics to ``out``, with the statements
+        listed in decreasing order of total time
+        """
+        rows = []
+        for sql, stats in self.sorted_statements():
+            caller, _ = stats.callers.most_common(1)[0]
+            if len(stats.callers) > 1:
+                caller += ' (+%d)' % (len(stats.callers) - 1,)
+            if len(sql) > STATEMENT_WIDTH:
+                sql = sql[:STATEMENT_WIDTH-3] + '...'
+            rows.append((stats, caller, sql))
+        width = max([len('method')] + [len(c) for _, c, _ in rows])
+        out.write('%6s %10s %9s %8s  %-*s  %s\n'
+                  % ('count', 'total ms', 'p95 ms', 'rows', width, 'method',
+                     'sql'))
+        for stats, caller, sql in rows:
+            out.write('%6d %10.2f %9.3f %8d  %-*s  %s\n' % (
+                stats.count, stats.total * 1000, stats.p95 * 1000, stats.rows,
+                width, caller, sql,
+            ))
+        out.write('%d statements in %.2f ms\n'
+                  % (self.total_statements, self.total_time * 1000))
+
+    def sorted_statements(self):  # internal function
+        return sorted(self.statements.items(), key=lambda kv: -kv[1].total)
+
+
+class ProfiledConnection(object):
+    """
+    A wrapper around a `sqlite3.Connection` that records the statements
+    executed through its `execute` and `executemany` methods with a
+    `QueryProfiler`.  Each query's results are fetched in full as part of the
+    timed execution.
+    """
+
+    def __init__(self, conn, profiler):
+        self.conn = conn
+        self.profiler = profiler
+
+    def execute(self, sql, *args):
+        return self.timed(sql, self.conn.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.timed(sql, self.conn.executemany, sql, *args)
+
+    def timed(self, sql, method, *args):  # internal function
+        start = default_timer()
+        cursor = method(*args)
+        if cursor.description is not None:
+            rows = cursor.fetchall()
+            qty = len(rows)
+        else:
+            rows = []
+            qty = cursor.rowcount
+        self.profiler.record(sql, default_timer() - start, qty)
+        return BufferedCursor(cursor, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class BufferedCursor(object):
+    """ A cursor whose results have already been fetched """
+
+    def __init__(self, cursor, rows):
+        self.cursor = cursor
+        self.rows = iter(rows)
+
+    def __iter__(self):
+        return self.rows
+
+    def fetchone(self):
+        return next(self.rows, None)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.cursor.arraysize
+        return [row for _, row in zip(range(size), self.rows)]
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
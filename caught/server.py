@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+A small HTTP/JSON API over a database, as run by ``caught serve``.  The
+endpoints are:
+
+``GET /games``
+    All games, with their progress
+
+``GET /games/GAME``
+    A single game, with its progress
+
+``GET /games/GAME/count``
+    ``{"caught": N, "owned": N}``
+
+``GET /games/GAME/statuses[?start=DEXNO][&end=DEXNO]``
+    The status of each Pokémon in the game's dex, or in the given range of
+    it, as a list of ``{"dexno": N, "name": NAME, "status": STATUS}`` objects
+
+``GET /games/GAME/pokemon?status=STATUS``
+    The Pokémon in the game's dex with the given status, as a list of
+    ``{"dexno": N, "name": NAME}`` objects
+
+``POST /games/GAME/add``, ``.../own``, ``.../release``, ``.../uncatch``
+    Changes the statuses of the Pokémon listed in the request body, a JSON
+    object of the form ``{"pokemon": [SPEC, ...]}``, in the same way as the
+    corresponding ``caught`` commands; each ``SPEC`` is a Pokémon name, dexno,
+    or range.  Returns ``{"pokemon": N}``, the number of Pokémon given.
+
+``GAME`` is a (URL-encoded) game name or gameID.  Errors are returned as
+``{"error": MESSAGE}`` with a 400, 404, or 500 status.
+
+Read requests are served concurrently by a bounded pool of connections, each
+in a read-only transaction, while requests that modify the database are run
+one at a time on a single writer connection, each in a transaction of its
+own.
+"""
+import json
+import queue
+import threading
+from   http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from   urllib.parse import parse_qs, unquote, urlsplit
+from   .models import CaughtDBError, NoSuchGameError, NoSuchPokemonError, \
+                      Status
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8151
+
+#: Default number of connections in the reader pool
+DEFAULT_READERS = 4
+
+#: The `CaughtDB` methods run by each of the ``POST`` actions
+ACTIONS = {
+    "add":     'markCaughtMany',
+    "own":     'markOwnedMany',
+    "release": 'markReleasedMany',
+    "uncatch": 'markUncaughtMany',
+}
+
+
+class ConnectionPool(object):
+    """
+    A pool of at most ``size`` databases created on demand by calling
+    ``factory``.  A thread that finds every database in use waits for one to
+    be returned.
+    """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.opened = []
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            db = self.factory()
+        except Exception:
+            self.slots.release()
+            raise
+        self.opened.append(db)
+        return db
+
+    def release(self, db):
+        self.idle.put(db)
+        self.slots.release()
+
+    def close(self):
+        for db in self.opened:
+            db.close()
+
+
+class CaughtServer(ThreadingHTTPServer):
+    """
+    An HTTP server for the API, reading from databases created by
+    ``factory`` (a callable returning a new `CaughtDB`-like object for the
+    database being served)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, factory, readers=DEFAULT_READERS,
+                 quiet=False):
+        self.readers = ConnectionPool(factory, readers)
+        self.writer = factory()
+        self.write_lock = threading.Lock()
+        self.quiet = quiet
+        ThreadingHTTPServer.__init__(self, address, RequestHandler)
+
+    def read(self, func):
+        """ Calls ``func`` on a database from the reader pool """
+        db = self.readers.acquire()
+        try:
+            with db.reading():
+                return func(db)
+        finally:
+            self.readers.release(db)
+
+    def write(self, func):
+        """ Calls ``func`` on the writer database once it is free """
+        with self.write_lock:
+            with self.writer:
+                return func(self.writer)
+
+    def server_close(self):
+        ThreadingHTTPServer.server_close(self)
+        self.readers.close()
+        self.writer.close()
+
+
+class RequestError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+        super(RequestError, self).__init__(code, message)
+
+    def __str__(self):
+        return self.message
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Responses are written as headers and then body, which interacts badly
+    # with delayed ACKs on keep-alive connections unless Nagle is disabled:
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.handle_api(self.route_get)
+
+    def do_POST(self):
+        self.handle_api(self.route_post)
+
+    def handle_api(self, route):  # internal function
+        url = urlsplit(self.path)
+        path = [unquote(p) for p in url.path.strip('/').split('/')]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            code, body = 200, route(path, query)
+        except RequestError as e:
+            code, body = e.code, {"error": e.message}
+        except (NoSuchGameError, NoSuchPokemonError) as e:
+            code, body = 404, {"error": str(e)}
+        except (CaughtDBError, ValueError) as e:
+            code, body = 400, {"error": str(e)}
+        except Exception as e:
+            self.log_error('%s %s: %r', self.command, self.path, e)
+            code, body = 500, {"error": 'Internal server error'}
+        data = (json.dumps(body) + '\n').encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route_get(self, path, query):  # internal function
+        if path == ['games']:
+            return self.server.read(games_json)
+        elif len(path) == 2 and path[0] == 'games':
+            return self.server.read(lambda db: games_json(db, [path[1]])[0])
+        elif len(path) == 3 and path[0] == 'games' and path[2] == 'count':
+            def count(db):
+                caught, owned = db.getGameCount(lookup_game(db, path[1]))
+                return {"caught": caught, "owned": owned}
+            return self.server.read(count)
+        elif len(path) == 3 and path[0] == 'games' and path[2] == 'statuses':
+            start = int_param(query, 'start')
+            end = int_param(query, 'end')
+
+            def statuses(db):
+                game = lookup_game(db, path[1])
+                # `iterStatusRange` treats a lone start as the end of the
+                # range, so an open-ended range has to be spelled out:
+                if start is not None and end is None:
+                    bounds = (start, game.dexsize)
+                else:
+                    bounds = (start, end)
+                return [
+                    {"dexno": poke.dexno, "name": poke.name,
+                     "status": stat.name}
+                    for poke, stat in db.iterStatusRange(game, *bounds)
+                ]
+
+            return self.server.read(statuses)
+        elif len(path) == 3 and path[0] == 'games' and path[2] == 'pokemon':
+            try:
+                status = Status.fromName(query["status"])
+            except KeyError:
+                raise RequestError(400, 'a valid status parameter is required')
+            return self.server.read(lambda db: [
+                {"dexno": poke.dexno, "name": poke.name}
+                for poke in db.iterByStatus(lookup_game(db, path[1]), status)
+            ])
+        else:
+            raise RequestError(404, 'Not found')
+
+    def route_post(self, path, query):  # internal function
+        if len(path) != 3 or path[0] != 'games' or path[2] not in ACTIONS:
+            raise RequestError(404, 'Not found')
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            specs = json.loads(self.rfile.read(length).decode('utf-8'))
+            specs = specs["pokemon"]
+        except (ValueError, KeyError, TypeError):
+            raise RequestError(400, 'expected a JSON object with a "pokemon"'
+                                    ' list')
+        if not isinstance(specs, list) \
+                or not all(isinstance(s, str) for s in specs):
+            raise RequestError(400, '"pokemon" must be a list of strings')
+
+        def change(db):
+            game = lookup_game(db, path[1])
+            resolver = db.nameResolver()
+            pokemon = [poke for spec in specs
+                            for poke in resolver.resolve(spec, game.dexsize)]
+            getattr(db, ACTIONS[path[2]])(game, pokemon)
+            return {"pokemon": len(pokemon)}
+
+        return self.server.write(change)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def games_json(db, names=None):
+    """
+    Returns a list of the `Game.asDict` forms, with progress, of the games
+    named by ``names`` (default: all games)
+    """
+    if names is None:
+        games = db.allGames()
+    else:
+        games = [lookup_game(db, name) for name in names]
+    counts = db.getGameCounts(games)
+    out = []
+    for game in games:
+        caught, owned = counts[game.gameID]
+        out.append(game.asDict(caught + owned, owned))
+    return out
+
+def lookup_game(db, name):
+    """ Looks up a game by name or (if all digits) gameID """
+    if name.isdigit():
+        return db.getGameByID(int(name))
+    else:
+        return db.getGame(name)
+
+def int_param(query, name):
+    """
+    Returns the value of the query parameter ``name`` as an `int`, or `None`
+    if it is absent
+    """
+    try:
+        value = query[name]
+    except KeyError:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise RequestError(400, '%s: expected an integer' % (name,))
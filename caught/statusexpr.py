@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Set expressions over the statuses of Pokémon in one or more games, as used by
+``caught list``.  An expression is built from atoms of the form
+``status:game`` (true of the Pokémon in ``game``'s dex with the given status)
+or ``status:*`` (true of the Pokémon with the given status in every game
+whose dex includes them), combined with ``&`` (and), ``|`` (or), ``!`` (not),
+and parentheses.  ``!`` binds tightest and ``|`` loosest.
+
+A status is any of the names in `STATUS_SETS`, or several of them separated
+by slashes.  A game is a name or gameID; names containing spaces or special
+characters can be written in double quotes, with embedded quotes doubled.
+
+Parsed expressions are trees of `StatusIn`, `And`, `Or`, and `Not` nodes,
+which each database backend compiles into a single SQL query.
+"""
+from   collections import namedtuple
+import re
+from   .models import Status
+
+#: The status names accepted in expressions, and the statuses they match
+STATUS_SETS = {
+    "uncaught": frozenset([Status.UNCAUGHT]),
+    "caught":   frozenset([Status.CAUGHT]),
+    "caught+":  frozenset([Status.CAUGHT, Status.OWNED]),
+    "owned":    frozenset([Status.OWNED]),
+    "unowned":  frozenset([Status.UNCAUGHT, Status.CAUGHT]),
+}
+
+#: The value of `StatusIn.game` for atoms that apply to every game
+ALL_GAMES = '*'
+
+#: A Pokémon has one of ``statuses`` in ``game`` (a `Game` or `ALL_GAMES`)
+StatusIn = namedtuple('StatusIn', 'statuses game')
+
+And = namedtuple('And', 'args')
+Or = namedtuple('Or', 'args')
+Not = namedtuple('Not', 'arg')
+
+TOKEN_RGX = re.compile(r'''
+    \s*(?:
+        (?P<op>[()&|!])
+      | (?P<status>[^\s()&|!:"]+):(?P<game>"(?:[^"]|"")*"|[^\s()&|!"]+)
+      | (?P<word>[^\s()&|!]+)
+    )
+''', flags=re.X)
+
+
+class StatusExprError(ValueError):
+    """ Raised when a status expression cannot be parsed """
+
+    def __init__(self, expr, msg):
+        self.expr = expr
+        self.msg = msg
+        super(StatusExprError, self).__init__(expr, msg)
+
+    def __str__(self):
+        return '%r: %s' % (self.expr, self.msg)
+
+
+def parse_status_set(spec):
+    """
+    Returns the `frozenset` of `Status` values named by ``spec``, one or more
+    names from `STATUS_SETS` separated by slashes.  Raises a `ValueError` if
+    any of the names are unknown.
+    """
+    matched = frozenset()
+    for name in spec.split('/'):
+        name = name.strip().lower()
+        if name not in STATUS_SETS:
+            raise ValueError(name + ': invalid status')
+        matched |= STATUS_SETS[name]
+    return matched
+
+def parse_status_expr(expr, getGame):
+    """
+    Parses the status expression ``expr``, calling ``getGame`` on each game
+    name or ID (other than ``*``) to get the corresponding `Game`.  Raises a
+    `StatusExprError` if the expression is malformed.
+    """
+    tokens = []
+    for m in TOKEN_RGX.finditer(expr.rstrip()):
+        if m.group('word') is not None:
+            raise StatusExprError(
+                expr,
+                '%r: expected an atom of the form status:game'
+                    % (m.group('word'),),
+            )
+        elif m.group('op') is not None:
+            tokens.append(m.group('op'))
+        else:
+            try:
+                statuses = parse_status_set(m.group('status'))
+            except ValueError as e:
+                raise StatusExprError(expr, str(e))
+            game = m.group('game')
+            if game == ALL_GAMES:
+                pass
+            elif game.startswith('"'):
+                game = getGame(game[1:-1].replace('""', '"'))
+            else:
+                game = getGame(game)
+            tokens.append(StatusIn(statuses, game))
+    if not tokens:
+        raise StatusExprError(expr, 'empty expression')
+    tokens.reverse()
+
+    def parse_binary(op, cls, parse_operand):
+        args = [parse_operand()]
+        while tokens and tokens[-1] == op:
+            tokens.pop()
+            args.append(parse_operand())
+        return args[0] if len(args) == 1 else cls(tuple(args))
+
+    def parse_or():
+        return parse_binary('|', Or, parse_and)
+
+    def parse_and():
+        return parse_binary('&', And, parse_not)
+
+    def parse_not():
+        if not tokens:
+            raise StatusExprError(expr, 'unexpected end of expression')
+        tok = tokens.pop()
+        if tok == '!':
+            return Not(parse_not())
+        elif tok == '(':
+            node = parse_or()
+            if not tokens or tokens.pop() != ')':
+                raise StatusExprError(expr, "missing ')'")
+            return node
+        elif isinstance(tok, StatusIn):
+            return tok
+        else:
+            raise StatusExprError(expr, 'unexpected %r' % (tok,))
+
+    node = parse_or()
+    if tokens:
+        raise StatusExprError(expr, 'unexpected %r' % (tokens[-1],))
+    return node
+
+def status_expr_games(expr):
+    """
+    Yields each game (or `ALL_GAMES`) referred to in the parsed expression
+    ``expr``
+    """
+    if isinstance(expr, StatusIn):
+        yield expr.game
+    elif isinstance(expr, Not):
+        for g in status_expr_games(expr.arg):
+            yield g
+    else:
+        for arg in expr.args:
+            for g in status_expr_games(arg):
+                yield g
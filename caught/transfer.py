@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Exporting games & their statuses to newline-delimited JSON and importing them
+into another database.  An export consists of one ``game`` record per game::
+
+    {"type": "game", "gameID": 1, "name": "Red", "version": "red",
+     "player_name": null, "dexsize": 151, "synonyms": ["red-syn"]}
+
+followed by one ``caught`` record per Pokémon caught or owned in a game::
+
+    {"type": "caught", "gameID": 1, "dexno": 25, "status": "caught"}
+
+Both directions stream records one at a time, so memory use does not depend
+on the number of ``caught`` rows.
+"""
+from   collections import namedtuple
+import json
+from   timeit import default_timer
+from   .base import LOAD_CHUNK_SIZE
+from   .models import Game, MalformedFileError, NoSuchGameError, Status
+
+#: Default number of ``caught`` records to import per transaction
+COMMIT_CHUNK_SIZE = 100000
+
+#: The ways `import_ndjson` can handle an imported game whose name is already
+#: in use in the database: raise an error, skip the game & its records, or
+#: merge its records into the existing game, keeping whichever of the two
+#: statuses is better for each Pokémon
+CONFLICT_POLICIES = ('error', 'skip', 'merge')
+
+CAUGHT_RECORD = '{"type": "caught", "gameID": %d, "dexno": %d, "status": "%s"}\n'
+
+#: The result of `import_ndjson`: the number of games created or merged, the
+#: number of ``caught`` records imported, the number of ``caught`` records
+#: skipped, and the number of seconds elapsed
+ImportStats = namedtuple('ImportStats', 'games statuses skipped seconds')
+
+
+class GameConflictError(MalformedFileError):
+    def __init__(self, filename, lineno, name):
+        super(GameConflictError, self).__init__(
+            filename, lineno, 'game name %r is already in use' % (name,),
+        )
+
+
+def export_ndjson(db, out, games=None):
+    """
+    Writes ``games`` (default: all games) and the statuses of the Pokémon
+    caught or owned in them to the text file ``out`` as NDJSON, and returns
+    the number of ``caught`` records written
+    """
+    if games is None:
+        games = db.allGames()
+        gameIDs = None
+    else:
+        gameIDs = [int(g) for g in games]
+    for g in games:
+        out.write(json.dumps({
+            "type":        "game",
+            "gameID":      g.gameID,
+            "name":        g.name,
+            "version":     g.version,
+            "player_name": g.player_name,
+            "dexsize":     g.dexsize,
+            "synonyms":    list(g.synonyms),
+        }) + '\n')
+    qty = 0
+    for gameID, dexno, status in db.iterCaught(gameIDs):
+        out.write(CAUGHT_RECORD % (gameID, dexno, status.name))
+        qty += 1
+    return qty
+
+def import_ndjson(db, fp, on_conflict='error', commit_every=COMMIT_CHUNK_SIZE,
+                  progress=None):
+    """
+    Imports the games & statuses in the NDJSON file ``fp`` (as written by
+    `export_ndjson`) into ``db``, which must be inside a ``with`` block.  Each
+    game is created anew and given a fresh gameID, with any synonyms already
+    in use dropped; a game whose name is already in use is handled according
+    to ``on_conflict`` (one of `CONFLICT_POLICIES`).  Records for Pokémon
+    beyond the end of the database's Pokédex are skipped.
+
+    Statuses are written with ``executemany`` calls of up to
+    `LOAD_CHUNK_SIZE` rows, and the transaction is committed after every ``commit_every``
+    records, after each of which ``progress`` (if given) is called with an
+    `ImportStats` of the progress so far.  If an error occurs, the chunks
+    committed before it remain in the database.
+
+    Returns an `ImportStats` for the whole import.  Raises a
+    `MalformedFileError` if a record is invalid or a game conflicts with an
+    existing one under the ``error`` policy.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError('%s: invalid conflict policy' % (on_conflict,))
+    filename = getattr(fp, 'name', '<input>')
+    start = default_timer()
+    maxno = db.pokemonQty() or 0
+    # Merged statuses never downgrade those already in the database:
+    keep_best = on_conflict == 'merge'
+    # Maps gameIDs in the file to gameIDs in the database, or to `None` for
+    # skipped games:
+    gameIDs = {}
+    chunk_size = min(LOAD_CHUNK_SIZE, commit_every)
+    batch = []
+    statuses = skipped = uncommitted = 0
+
+    def stats():
+        return ImportStats(len(gameIDs) - sum(1 for g in gameIDs.values()
+                                             if g is None),
+                           statuses, skipped, default_timer() - start)
+
+    for lineno, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            rtype = record["type"]
+            oldID = int(record["gameID"])
+            if rtype == 'game':
+                game = Game(
+                    None,
+                    record["name"],
+                    record.get("version"),
+                    record.get("player_name"),
+                    int(record["dexsize"]),
+                    tuple(record.get("synonyms", ())),
+                )
+            elif rtype == 'caught':
+                dexno = int(record["dexno"])
+                status = Status.fromName(record["status"])
+        except (ValueError, KeyError, TypeError):
+            raise MalformedFileError(filename, lineno, 'invalid record')
+        if rtype == 'game':
+            if oldID in gameIDs:
+                raise MalformedFileError(
+                    filename, lineno, 'duplicate gameID %d' % (oldID,),
+                )
+            try:
+                existing = db.getGame(game.name)
+            except NoSuchGameError:
+                gameIDs[oldID] = db.newGame(game, ignore_dups=True).gameID
+            else:
+                if on_conflict == 'error':
+                    raise GameConflictError(filename, lineno, game.name)
+                elif on_conflict == 'skip':
+                    gameIDs[oldID] = None
+                else:
+                    gameIDs[oldID] = existing.gameID
+        elif rtype == 'caught':
+            try:
+                gameID = gameIDs[oldID]
+            except KeyError:
+                raise MalformedFileError(
+                    filename, lineno, 'unknown gameID %d' % (oldID,),
+                )
+            if gameID is None or not (1 <= dexno <= maxno):
+                skipped += 1
+                continue
+            batch.append((gameID, dexno, status))
+            if len(batch) >= chunk_size:
+                db.setStatusRows(batch, keep_best)
+                statuses += len(batch)
+                uncommitted += len(batch)
+                batch = []
+                if uncommitted >= commit_every:
+                    db.commit()
+                    uncommitted = 0
+                    if progress is not None:
+                        progress(stats())
+        else:
+            raise MalformedFileError(
+                filename, lineno, 'unknown record type %r' % (rtype,),
+            )
+    if batch:
+        db.setStatusRows(batch, keep_best)
+        statuses += len(batch)
+    return stats()
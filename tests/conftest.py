@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import pytest
+from   benchmarks.synthetic import write_pokedex
+from   caught.base import BACKENDS, open_db
+from   caught.models import Game
+
+#: The number of species in the test Pokédex
+SPECIES = 30
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('CAUGHT_CACHE_DIR', str(tmp_path / 'cache'))
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request):
+    return request.param
+
+@pytest.fixture
+def pokedex(tmp_path):
+    path = tmp_path / 'pokedex.tsv'
+    write_pokedex(str(path), SPECIES)
+    return path
+
+@pytest.fixture
+def dbpath(tmp_path, backend, pokedex):
+    """
+    The path to a database created with the test Pokédex and two games,
+    ``red`` and ``blue``, with dexsizes of 20 and 25
+    """
+    path = str(tmp_path / 'caught.db')
+    db = open_db(path, backend)
+    with db:
+        db.create(str(pokedex))
+        db.newGame(Game(None, 'Red', 'Red', 'Ash', 20, ('red',)))
+        db.newGame(Game(None, 'Blue', 'Blue', 'Gary', 25, ('blue',)))
+    db.close()
+    return path
+
+@pytest.fixture
+def db(dbpath, backend):
+    db = open_db(dbpath, backend)
+    yield db
+    db.close()
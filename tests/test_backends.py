@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the `CaughtDB` API that every backend must pass
+"""
+import sqlite3
+import pytest
+from   caught.base import PokedexChanges, StatusChange
+from   caught.models import Game, NoSuchGameError, NoSuchPokemonError, Status
+from   caught.statusexpr import parse_status_expr
+
+def dexnos(pokemon):
+    return [poke.dexno for poke in pokemon]
+
+def statuses(db, game, maxno=None):
+    """
+    Returns a `dict` mapping the dexnos of the Pokémon in ``game``'s dex (up
+    to ``maxno``) to their statuses, leaving out those that are uncaught
+    """
+    return {
+        poke.dexno: status
+        for poke, status in db.getStatusRange(game, 1, maxno or game.dexsize)
+        if status != Status.UNCAUGHT
+    }
+
+def test_set_status_many(db):
+    with db:
+        red = db.getGame('red')
+        db.setStatusMany(red, [1, 2, 3, 7, 8, db.getPokemon('species12')],
+                         Status.CAUGHT)
+        db.setStatusMany(red, [3, 8], Status.OWNED)
+        assert statuses(db, red) == {
+            1: Status.CAUGHT, 2: Status.CAUGHT, 3: Status.OWNED,
+            7: Status.CAUGHT, 8: Status.OWNED, 12: Status.CAUGHT,
+        }
+        assert db.getStatus(red, 8) == Status.OWNED
+        assert db.getStatus(red, 9) == Status.UNCAUGHT
+        assert db.getGameCount(red) == (4, 2)
+
+def test_uncatch_and_release(db):
+    with db:
+        red = db.getGame('red')
+        db.setStatusMany(red, range(1, 7), Status.CAUGHT)
+        db.markOwnedMany(red, [4, 5, 6])
+        db.markUncaughtMany(red, [1, 2, 5])
+        db.markReleasedMany(red, [3, 4])
+        db.markCaughtMany(red, [1, 6])
+        assert statuses(db, red) == {
+            1: Status.CAUGHT, 3: Status.CAUGHT, 4: Status.CAUGHT,
+            6: Status.OWNED,
+        }
+        db.markUncaught(red, 6)
+        assert db.getStatus(red, 6) == Status.UNCAUGHT
+
+def test_status_range(db):
+    with db:
+        red = db.getGame('red')
+        db.setStatusMany(red, [5, 6], Status.OWNED)
+        assert dexnos(p for p, _ in db.getStatusRange(red)) \
+            == list(range(1, 21))
+        assert db.getStatusRange(red, 4, 6)[1:] == [
+            (db.getPokemonByDexno(5), Status.OWNED),
+            (db.getPokemonByDexno(6), Status.OWNED),
+        ]
+        assert dexnos(p for p, _ in db.getStatusRange(red, 18, 99)) \
+            == [18, 19, 20]
+        assert dexnos(db.getByStatus(red, Status.OWNED)) == [5, 6]
+        assert len(db.getByStatus(red, Status.UNCAUGHT, red.dexsize)) == 18
+
+def test_update(db, tmp_path):
+    newdex = tmp_path / 'newdex.tsv'
+    with open(str(newdex), 'w') as fp:
+        for dexno in range(1, 33):
+            fields = [str(dexno), 'Species%d' % (dexno,)]
+            if dexno == 2:
+                fields = ['2', 'Renamed2', 'Species2']
+            elif dexno % 3 == 0 and dexno != 6:
+                fields.append('Alias%d' % (dexno,))
+            fp.write('\t'.join(fields) + '\n')
+    with db:
+        assert db.getPokemon('alias6').dexno == 6
+        changes = db.update(str(newdex))
+        assert changes == PokedexChanges(
+            added=2, renamed=1, resynonymed=2, unlisted=0,
+        )
+        assert db.getPokemonByDexno(2).name == 'Renamed2'
+        assert db.getPokemon('species2').dexno == 2
+        assert db.getPokemonByDexno(6).synonyms == ['6', 'species6']
+        assert db.getPokemon('species32').dexno == 32
+        assert db.pokemonQty() == 32
+    with db.reading():
+        assert db.getPokemon('renamed2').dexno == 2
+        with pytest.raises(NoSuchPokemonError):
+            db.getPokemon('alias6')
+
+def set_up_copies(db):
+    red, blue = db.getGame('red'), db.getGame('blue')
+    db.setStatusMany(red, [1, 2, 3], Status.CAUGHT)
+    db.setStatusMany(red, [4, 5], Status.OWNED)
+    db.setStatusMany(blue, [1, 4], Status.OWNED)
+    db.setStatusMany(blue, [5, 22], Status.CAUGHT)
+    return red, blue
+
+@pytest.mark.parametrize('mode,changed,expected', [
+    ('merge', 3, {
+        1: Status.OWNED, 2: Status.CAUGHT, 3: Status.CAUGHT, 4: Status.OWNED,
+        5: Status.OWNED, 22: Status.CAUGHT,
+    }),
+    ('overwrite', 4, {
+        1: Status.CAUGHT, 2: Status.CAUGHT, 3: Status.CAUGHT,
+        4: Status.OWNED, 5: Status.OWNED, 22: Status.CAUGHT,
+    }),
+    ('replace', 5, {
+        1: Status.CAUGHT, 2: Status.CAUGHT, 3: Status.CAUGHT,
+        4: Status.OWNED, 5: Status.OWNED,
+    }),
+])
+def test_copy_progress(db, mode, changed, expected):
+    with db:
+        red, blue = set_up_copies(db)
+        assert db.copyProgress(red, blue, mode) == changed
+        assert statuses(db, blue) == expected
+        # Copying again changes nothing:
+        assert db.copyProgress(red, blue, mode) == 0
+        assert statuses(db, red) == {
+            1: Status.CAUGHT, 2: Status.CAUGHT, 3: Status.CAUGHT,
+            4: Status.OWNED, 5: Status.OWNED,
+        }
+
+def test_copy_progress_clips_to_dexsize(db):
+    with db:
+        red, blue = set_up_copies(db)
+        db.copyProgress(blue, red, 'overwrite')
+        assert 22 not in statuses(db, red)
+        with pytest.raises(ValueError):
+            db.copyProgress(red, red)
+        with pytest.raises(ValueError):
+            db.copyProgress(red, blue, 'bogus')
+
+def test_merge_games(db):
+    with db:
+        red, blue = set_up_copies(db)
+        green = db.newGame(Game(None, 'Green', 'Green', 'Ash', 30, ()))
+        db.setStatusMany(green, [2, 30], Status.OWNED)
+        db.mergeGames([red, blue, green], blue, delete=True)
+        assert statuses(db, db.getGame('blue')) == {
+            1: Status.OWNED, 2: Status.OWNED, 3: Status.CAUGHT,
+            4: Status.OWNED, 5: Status.OWNED, 22: Status.CAUGHT,
+        }
+        assert [g.name for g in db.allGames()] == ['Blue']
+
+def test_delete_games(db):
+    with db:
+        red, blue = set_up_copies(db)
+        db.deleteGames([red])
+        assert [g.name for g in db.allGames()] == ['Blue']
+        with pytest.raises(NoSuchGameError):
+            db.getGame('red')
+        assert list(db.iterCaught()) == [
+            (blue.gameID, 1, Status.OWNED),
+            (blue.gameID, 4, Status.OWNED),
+            (blue.gameID, 5, Status.CAUGHT),
+            (blue.gameID, 22, Status.CAUGHT),
+        ]
+
+@pytest.mark.parametrize('expr,expected', [
+    ('owned:red', [4, 5]),
+    ('caught+:red & !caught+:blue', [2, 3]),
+    ('owned:red | owned:blue', [1, 4, 5]),
+    ('caught:blue & (owned:red | uncaught:red)', [5]),
+    ('caught:blue & !owned:red', [22]),
+    ('owned:*', [4]),
+    ('caught/owned:red & !(caught:red)', [4, 5]),
+])
+def test_status_expr(db, expr, expected):
+    with db:
+        set_up_copies(db)
+        parsed = parse_status_expr(expr, db.getGame)
+        assert dexnos(db.getByStatusExpr(parsed)) == expected
+        assert dexnos(db.iterByStatusExpr(parsed)) == expected
+
+def test_progress_counters(db):
+    with db:
+        assert not db.hasProgressCounters()
+        with pytest.raises(RuntimeError):
+            db.checkProgressCounters()
+        red, blue = set_up_copies(db)
+        db.enableProgressCounters()
+        assert db.hasProgressCounters()
+        assert db.getGameCounts() == {red.gameID: (3, 2), blue.gameID: (2, 2)}
+        db.markUncaughtMany(red, [1, 4])
+        db.copyProgress(red, blue, 'replace')
+        assert db.checkProgressCounters() == []
+        assert db.getGameCounts() == {red.gameID: (2, 1), blue.gameID: (2, 1)}
+        db.disableProgressCounters()
+        assert not db.hasProgressCounters()
+        assert db.getGameCounts() == {red.gameID: (2, 1), blue.gameID: (2, 1)}
+
+def test_rebuild_progress_counters(db, dbpath):
+    with db:
+        red, blue = set_up_copies(db)
+        db.enableProgressCounters()
+    conn = sqlite3.connect(dbpath)
+    conn.execute('UPDATE game_progress SET caught = 0 WHERE gameID = ?',
+                 (red.gameID,))
+    conn.commit()
+    conn.close()
+    with db:
+        assert db.checkProgressCounters() == [(red.gameID, (0, 2), (3, 2))]
+        assert db.rebuildProgressCounters() \
+            == [(red.gameID, (0, 2), (3, 2))]
+        assert db.checkProgressCounters() == []
+
+def test_change_log(db):
+    with db:
+        assert not db.hasChangeLog()
+        with pytest.raises(RuntimeError):
+            list(db.changesSince())
+        red = db.getGame('red')
+        db.setStatus(red, 1, Status.CAUGHT)
+        db.enableChangeLog()
+        assert db.hasChangeLog()
+        start = db.lastChangeSeq()
+        db.setStatusMany(red, [1, 2], Status.OWNED)
+        db.markUncaught(red, 1)
+    with db:
+        changes = list(db.changesSince(start))
+        assert [c[1:] for c in changes] == [
+            (red.gameID, 1, Status.CAUGHT, Status.OWNED),
+            (red.gameID, 2, Status.UNCAUGHT, Status.OWNED),
+            (red.gameID, 1, Status.OWNED, Status.UNCAUGHT),
+        ]
+        assert all(isinstance(c, StatusChange) for c in changes)
+        assert [c.seq for c in changes] == sorted(c.seq for c in changes)
+        assert db.lastChangeSeq() == changes[-1].seq
+        assert list(db.changesSince(changes[1].seq)) == changes[2:]
+        assert list(db.changesSince(start, games=[db.getGame('blue')])) == []
+        assert list(db.changesSince(start, games=[])) == []
+
+def test_change_log_rollback(db):
+    with db:
+        db.enableChangeLog()
+        red = db.getGame('red')
+        db.setStatus(red, 1, Status.CAUGHT)
+        seq = db.lastChangeSeq()
+        with pytest.raises(ZeroDivisionError):
+            with db.savepoint():
+                db.setStatus(red, 2, Status.CAUGHT)
+                1 / 0
+        assert db.lastChangeSeq() == seq
+        assert db.getStatus(red, 2) == Status.UNCAUGHT
+    with db:
+        db.disableChangeLog()
+        assert not db.hasChangeLog()
+
+def test_object_cache(db):
+    with db:
+        red = db.getGame('red')
+        assert db.getGame('red') is red
+        assert db.getGameByID(red.gameID) is red
+        poke = db.getPokemon('alias3')
+        assert db.getPokemonByDexno(3) is poke
+        hits = db.objectCacheInfo().hits
+        db.getPokemon('species3')
+        assert db.objectCacheInfo().hits > hits
+        db.deleteGames([db.getGame('blue')])
+        with pytest.raises(NoSuchGameError):
+            db.getGame('blue')
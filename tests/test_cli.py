@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from   click.testing import CliRunner
+from   caught.__main__ import main
+from   caught.base import open_db
+from   caught.models import Status
+
+def run(dbpath, backend, args):
+    return CliRunner().invoke(
+        main, ['-D', dbpath, '--backend', backend] + args,
+    )
+
+def write_batch(tmp_path, lines):
+    path = tmp_path / 'batch.txt'
+    path.write_text(''.join(line + '\n' for line in lines))
+    return str(path)
+
+def test_batch_create(tmp_path, backend, pokedex):
+    dbpath = str(tmp_path / 'new.db')
+    r = run(dbpath, backend, ['batch', write_batch(tmp_path, [
+        'create %s' % (pokedex,),
+        'new -q -D 20 Red red',
+        'own red 1 species2',
+    ])])
+    assert r.exit_code == 0, r.output
+    db = open_db(dbpath, backend)
+    with db.reading():
+        assert db.pokemonQty() == 30
+        red = db.getGame('red')
+        assert db.getStatuses(red, [1, 2]) \
+            == {1: Status.OWNED, 2: Status.OWNED}
+    db.close()
+
+def test_batch_create_rolled_back(tmp_path, backend, pokedex):
+    dbpath = str(tmp_path / 'new.db')
+    r = run(dbpath, backend, ['batch', '--fail-fast', write_batch(tmp_path, [
+        'create %s' % (pokedex,),
+        'new -q -D 20 Red red',
+        'bogus',
+    ])])
+    assert r.exit_code == 1
+    assert 'line 3: bogus: not a batch command' in r.output
+    assert 'line 1' not in r.output
+    db = open_db(dbpath, backend)
+    with db.reading():
+        assert not db.pokemonQty()
+        assert db.allGames() == []
+    db.close()
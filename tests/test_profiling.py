@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from   caught.models import Status
+
+def rows_by_caller(profiler):
+    """
+    Returns a `dict` mapping each caller recorded by ``profiler`` to the total
+    number of rows returned or affected by its statements
+    """
+    rows = {}
+    for stats in profiler.statements.values():
+        for caller in stats.callers:
+            rows[caller] = rows.get(caller, 0) + stats.rows
+    return rows
+
+def test_profile_rows(db):
+    with db:
+        red = db.getGame('red')
+        db.setStatusMany(red, [2, 4, 6, 8, 10], Status.OWNED)
+        profiler = db.startProfiling()
+        try:
+            owned = db.getByStatus(red, Status.OWNED)
+            db.markReleasedMany(red, [2, 4])
+        finally:
+            db.stopProfiling()
+    assert [poke.dexno for poke in owned] == [2, 4, 6, 8, 10]
+    rows = rows_by_caller(profiler)
+    assert rows['getByStatus > iterByStatus'] == 5
+    assert rows['markReleasedMany'] == 2
+    assert profiler.total_statements >= 3
+
+def test_profile_across_transactions(db):
+    profiler = db.startProfiling()
+    try:
+        with db.reading():
+            games = db.allGames()
+        with db.reading():
+            assert db.getGameCounts() == {g.gameID: (0, 0) for g in games}
+    finally:
+        db.stopProfiling()
+    rows = rows_by_caller(profiler)
+    assert rows['allGames > iterAllGames'] == 2
+    assert any(caller.endswith('begin_transaction') for caller in rows)
+
+def names_fetched(profiler):
+    """ Returns the number of ``pokemon_names`` rows fetched while profiling """
+    return sum(stats.rows for sql, stats in profiler.statements.items()
+               if 'FROM pokemon_names' in sql)
+
+def test_sparse_names(db):
+    with db:
+        blue = db.getGame('blue')
+        db.setStatusMany(blue, [1, 12, 25], Status.OWNED)
+        db.setStatusMany(blue, range(2, 6), Status.CAUGHT)
+        profiler = db.startProfiling()
+        try:
+            owned = db.getByStatus(blue, Status.OWNED)
+            caught = db.getByStatus(blue, Status.CAUGHT)
+        finally:
+            db.stopProfiling()
+    assert [poke.dexno for poke in owned] == [1, 12, 25]
+    assert [poke.dexno for poke in caught] == [2, 3, 4, 5]
+    assert owned[1].synonyms == ['12', 'alias12', 'species12']
+    # Only the names of the Pokémon returned are fetched:
+    assert names_fetched(profiler) \
+        == sum(len(poke.synonyms) for poke in owned + caught)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from   caught.base import PROGRESS_TRIGGERS, open_db
+from   caught.models import Status
+
+def write_statuses(db):
+    red = db.getGame('red')
+    blue = db.getGame('blue')
+    db.setStatus(red, db.getPokemon('species1'), Status.CAUGHT)
+    db.setStatus(red, db.getPokemon('species1'), Status.OWNED)
+    db.setStatusMany(red, [db.getPokemonByDexno(i) for i in range(1, 11)],
+                     Status.CAUGHT)
+    db.markOwnedMany(red, [db.getPokemonByDexno(i) for i in range(5, 15)])
+    db.setStatusMany(blue, [db.getPokemonByDexno(i) for i in range(1, 4)],
+                     Status.OWNED)
+    db.markUncaughtMany(red, [db.getPokemonByDexno(2)])
+    db.copyProgress(red, blue, 'merge')
+
+def test_write_statuses_with_counters(db):
+    with db:
+        db.enableProgressCounters()
+        write_statuses(db)
+        assert db.checkProgressCounters() == []
+    with db.reading():
+        assert db.hasProgressCounters()
+        assert db.checkProgressCounters() == []
+        counts = db.getGameCounts()
+        red, blue = db.getGame('red'), db.getGame('blue')
+    assert counts[red.gameID] == (3, 10)
+    assert counts[blue.gameID] == (1, 13)
+
+def test_counters_follow_games(db):
+    with db:
+        db.enableProgressCounters()
+        write_statuses(db)
+        db.deleteGame(db.getGame('blue'))
+        assert db.checkProgressCounters() == []
+    with db:
+        db.disableProgressCounters()
+        assert not db.hasProgressCounters()
+
+def test_migration_repairs_old_triggers(dbpath, backend):
+    db = open_db(dbpath, backend)
+    with db:
+        db.enableProgressCounters()
+    db.close()
+    # Replace the triggers with those of schema version 2:
+    conn = sqlite3.connect(dbpath)
+    for name, ddl in PROGRESS_TRIGGERS.items():
+        conn.execute('DROP TRIGGER ' + name)
+        conn.execute(ddl.replace(
+            'INSERT INTO game_progress (gameID, caught, owned)\n'
+            '                    SELECT NEW.gameID, 0, 0 WHERE NOT EXISTS (\n'
+            '                        SELECT 1 FROM game_progress'
+            ' WHERE gameID = NEW.gameID\n'
+            '                    );',
+            'INSERT OR IGNORE INTO game_progress (gameID, caught, owned)'
+            ' VALUES (NEW.gameID, 0, 0);',
+        ))
+    conn.execute('DELETE FROM game_progress')
+    conn.execute('PRAGMA user_version = 2')
+    conn.commit()
+    conn.close()
+    db = open_db(dbpath, backend)
+    try:
+        with db:
+            assert db.hasProgressCounters()
+            assert db.checkProgressCounters() == []
+            write_statuses(db)
+            assert db.checkProgressCounters() == []
+    finally:
+        db.close()
+
+def test_migration_without_counters(dbpath, backend):
+    conn = sqlite3.connect(dbpath)
+    conn.execute('PRAGMA user_version = 2')
+    conn.commit()
+    conn.close()
+    db = open_db(dbpath, backend)
+    try:
+        with db:
+            assert not db.hasProgressCounters()
+            write_statuses(db)
+    finally:
+        db.close()
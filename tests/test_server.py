@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from   urllib.error import HTTPError
+from   urllib.request import Request, urlopen
+import pytest
+from   caught.base import open_db
+from   caught.models import Status
+from   caught.server import CaughtServer
+
+@pytest.fixture
+def server_url(dbpath, backend):
+    db = open_db(dbpath, backend)
+    with db:
+        db.setStatusMany(db.getGame('red'), [3, 18], Status.OWNED)
+    db.close()
+    server = CaughtServer(('127.0.0.1', 0), lambda: open_db(dbpath, backend),
+                          readers=2, quiet=True)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'poll_interval': 0.05})
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:%d' % (server.server_address[1],)
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+def get(url):
+    with urlopen(url) as r:
+        return json.loads(r.read().decode('utf-8'))
+
+def post(url, body):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    with urlopen(Request(url, data=body)) as r:
+        return json.loads(r.read().decode('utf-8'))
+
+def error(func, *args):
+    """
+    Calls ``func`` with ``args``, which must fail with an HTTP error, and
+    returns the error's status code and decoded JSON body
+    """
+    with pytest.raises(HTTPError) as e:
+        func(*args)
+    return (e.value.code, json.loads(e.value.read().decode('utf-8')))
+
+@pytest.mark.parametrize('query,dexnos', [
+    ('', list(range(1, 21))),
+    ('?start=3&end=5', [3, 4, 5]),
+    ('?start=17', [17, 18, 19, 20]),
+    ('?end=2', [1, 2]),
+    ('?start=18&end=99', [18, 19, 20]),
+])
+def test_statuses_range(server_url, query, dexnos):
+    statuses = get(server_url + '/games/red/statuses' + query)
+    assert [s["dexno"] for s in statuses] == dexnos
+    assert [s["dexno"] for s in statuses if s["status"] == 'owned'] \
+        == [d for d in (3, 18) if d in dexnos]
+
+def test_own_and_release(server_url):
+    url = server_url + '/games/red'
+    assert get(url + '/count') == {"caught": 0, "owned": 2}
+    assert post(url + '/own', {"pokemon": ["species1", "4-6"]}) \
+        == {"pokemon": 4}
+    assert get(url + '/count') == {"caught": 0, "owned": 6}
+    assert post(url + '/release', {"pokemon": ["1", "5", "7"]}) \
+        == {"pokemon": 3}
+    assert post(url + '/uncatch', {"pokemon": ["alias6"]}) == {"pokemon": 1}
+    assert get(url + '/count') == {"caught": 2, "owned": 3}
+    assert [p["dexno"] for p in get(url + '/pokemon?status=owned')] \
+        == [3, 4, 18]
+
+def test_concurrent_writes(server_url):
+    url = server_url + '/games/blue/add'
+    threads = [
+        threading.Thread(target=post, args=(url, {"pokemon": [str(d)]}))
+        for d in range(1, 21)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert get(server_url + '/games/blue/count') \
+        == {"caught": 20, "owned": 0}
+
+def test_errors(server_url):
+    code, body = error(get, server_url + '/games/nosuch/count')
+    assert code == 404 and 'error' in body
+    code, _ = error(post, server_url + '/games/nosuch/own',
+                    {"pokemon": ["1"]})
+    assert code == 404
+    code, _ = error(post, server_url + '/games/red/own',
+                    {"pokemon": ["nosuchmon"]})
+    assert code == 404
+    assert error(get, server_url + '/nowhere')[0] == 404
+    assert error(get, server_url + '/games/red/statuses?start=x')[0] == 400
+    assert error(get, server_url + '/games/red/pokemon?status=bad')[0] == 400
+    assert error(post, server_url + '/games/red/own', b'xx')[0] == 400
+    assert error(post, server_url + '/games/red/own', {"pokemon": [1]})[0] \
+        == 400
+    assert get(server_url + '/games/red/count') == {"caught": 0, "owned": 2}
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import io
+import pytest
+from   caught.models import Game, Status
+from   caught.transfer import GameConflictError, export_ndjson, import_ndjson
+
+EXPORT = '''\
+{"type": "game", "gameID": 7, "name": "Red", "version": "Red", "player_name": "Ash", "dexsize": 20, "synonyms": ["red"]}
+{"type": "game", "gameID": 8, "name": "Yellow", "version": "Yellow", "player_name": "Ash", "dexsize": 25, "synonyms": ["yellow", "blue"]}
+{"type": "caught", "gameID": 7, "dexno": 1, "status": "caught"}
+{"type": "caught", "gameID": 7, "dexno": 2, "status": "owned"}
+{"type": "caught", "gameID": 7, "dexno": 3, "status": "caught"}
+{"type": "caught", "gameID": 7, "dexno": 99, "status": "caught"}
+{"type": "caught", "gameID": 8, "dexno": 4, "status": "owned"}
+'''
+
+def import_statuses(db, on_conflict):
+    with db:
+        red = db.getGame('red')
+        db.setStatusMany(red, [1, 2], Status.OWNED)
+        db.setStatus(red, 5, Status.CAUGHT)
+        stats = import_ndjson(db, io.StringIO(EXPORT), on_conflict)
+        yellow = db.getGame('yellow')
+        return (stats, caught(db, red), caught(db, yellow))
+
+def caught(db, game):
+    return {
+        dexno: status
+        for dexno, status in db.getStatuses(game, range(1, 6)).items()
+        if status != Status.UNCAUGHT
+    }
+
+def test_import_merge_keeps_best(db):
+    stats, red, yellow = import_statuses(db, 'merge')
+    assert (stats.games, stats.statuses, stats.skipped) == (2, 4, 1)
+    assert red == {
+        1: Status.OWNED, 2: Status.OWNED, 3: Status.CAUGHT, 5: Status.CAUGHT,
+    }
+    assert yellow == {4: Status.OWNED}
+
+def test_import_skip(db):
+    stats, red, yellow = import_statuses(db, 'skip')
+    assert (stats.games, stats.statuses, stats.skipped) == (1, 1, 4)
+    assert red == {1: Status.OWNED, 2: Status.OWNED, 5: Status.CAUGHT}
+    assert yellow == {4: Status.OWNED}
+
+def test_import_conflict_error(db):
+    with pytest.raises(GameConflictError):
+        import_statuses(db, 'error')
+
+def test_export_round_trip(db, tmp_path):
+    with db:
+        red = db.getGame('red')
+        db.setStatusMany(red, [1, 2], Status.OWNED)
+        db.setStatus(red, 5, Status.CAUGHT)
+        out = io.StringIO()
+        assert export_ndjson(db, out, [red]) == 3
+        db.newGame(Game(None, 'Green', 'Green', None, 30, ()))
+        stats = import_ndjson(db, io.StringIO(
+            out.getvalue().replace('"Red"', '"Green"', 1)
+        ), 'merge')
+        assert stats.statuses == 3
+        green = db.getGame('green')
+        assert db.getStatusRange(green, 1, 5) == db.getStatusRange(red, 1, 5)